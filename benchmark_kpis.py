@@ -0,0 +1,137 @@
+# benchmark_kpis.py
+"""
+Mede o tempo das funções de KPI em dados sintéticos e compara colunas de texto com categorias.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# Adicionar o diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils import kpis
+
+def gerar_dados(n_linhas, seed=42):
+    """Gera vendas e cotações sintéticas com o mesmo esquema das tabelas limpas."""
+    rng = np.random.default_rng(seed)
+    n_clientes = max(50, n_linhas // 500)
+    n_materiais = max(100, n_linhas // 200)
+    inicio = np.datetime64('2022-01-01')
+
+    def base():
+        clientes = rng.integers(0, n_clientes, n_linhas)
+        materiais = rng.integers(0, n_materiais, n_linhas)
+        return pd.DataFrame({
+            'cod_cliente': pd.Series(clientes).map(lambda c: f'{100000 + c}'),
+            'cliente': pd.Series(clientes).map(lambda c: f'Cliente {c}'),
+            'material': pd.Series(materiais).map(lambda m: f'{10000000 + m}'),
+            'produto': pd.Series(materiais).map(lambda m: f'Produto {m}'),
+            'unidade_negocio': rng.choice(['MOTORES', 'DRIVES', 'TRANSMISSÃO', 'AUTOMAÇÃO', 'ENERGIA'], n_linhas),
+        }), pd.Series(inicio + rng.integers(0, 3 * 365, n_linhas).astype('timedelta64[D]')).astype('datetime64[us]')
+
+    df_vendas, datas = base()
+    df_vendas['data_faturamento'] = datas
+    df_vendas['quantidade_faturada'] = rng.integers(1, 50, n_linhas).astype(float)
+    df_vendas['valor_faturado'] = rng.uniform(100, 50000, n_linhas).round(2)
+
+    df_cotacoes, datas = base()
+    df_cotacoes['data'] = datas
+    df_cotacoes['quantidade'] = rng.integers(1, 80, n_linhas).astype(float)
+    return df_vendas, df_cotacoes
+
+CASOS = {
+    'calculate_kpis_por_cliente': lambda v, c: kpis.calculate_kpis_por_cliente(v, c),
+    'calculate_funil_metrics': lambda v, c: kpis.calculate_funil_metrics(v, c, periodo_meses=36)['funil_completo'],
+    'calculate_produtos_matrix': lambda v, c: kpis.calculate_produtos_matrix(v, c),
+    'calculate_material_analysis': lambda v, c: kpis.calculate_material_analysis(v, c.copy()),
+}
+
+def cronometrar(func, repeticoes):
+    melhor, resultado = None, None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = func()
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor, resultado
+
+def executar(tamanhos, repeticoes):
+    for n in tamanhos:
+        print(f"\n📊 {n:,} linhas de vendas e de cotações".replace(",", "."))
+        df_vendas, df_cotacoes = gerar_dados(n)
+        print(f"   {'função':<30}{'tempo (s)':>12}{'linhas':>10}")
+        for nome, caso in CASOS.items():
+            tempo, resultado = cronometrar(lambda: caso(df_vendas, df_cotacoes), repeticoes)
+            print(f"   {nome:<30}{tempo:>12.3f}{len(resultado):>10}")
+    return True
+
+# Colunas que os loaders do db devolvem como categorias de dicionário compartilhado (db.get_category_dtypes)
+CATEGORICAS = ['cod_cliente', 'cliente', 'material', 'produto', 'unidade_negocio']
+
+def como_categorias(df_vendas, df_cotacoes):
+    """As mesmas bases com as colunas de texto como categorias, com um dicionário comum às duas tabelas."""
+    df_vendas, df_cotacoes = df_vendas.copy(), df_cotacoes.copy()
+    for col in CATEGORICAS:
+        dtype = pd.CategoricalDtype(sorted(set(df_vendas[col]) | set(df_cotacoes[col])))
+        df_vendas[col] = df_vendas[col].astype(dtype)
+        df_cotacoes[col] = df_cotacoes[col].astype(dtype)
+    return df_vendas, df_cotacoes
+
+def _como_texto(df):
+    return df.apply(lambda s: s.astype(object) if isinstance(s.dtype, pd.CategoricalDtype) else s)
+
+def _memoria_mb(*dfs):
+    return sum(df.memory_usage(deep=True).sum() for df in dfs) / 2**20
+
+def comparar_categorias(tamanhos, repeticoes):
+    """Memória e tempo de groupby/merge/isin com texto (object e str) e com categorias; confere os KPIs."""
+    ok = True
+    for n in tamanhos:
+        print(f"\n📦 {n:,} linhas de vendas e de cotações".replace(",", "."))
+        texto = gerar_dados(n)
+        bases = {
+            'object': tuple(df.astype({col: object for col in CATEGORICAS}) for df in texto),
+            'str': texto,
+            'category': como_categorias(*texto),
+        }
+        operacoes = {
+            'groupby cliente+material': lambda v, c: v.groupby(['cod_cliente', 'material'], observed=True)['quantidade_faturada'].sum(),
+            'merge por material': lambda v, c: c[['material', 'quantidade']].merge(
+                v.groupby('material', observed=True)['quantidade_faturada'].sum().reset_index(), on='material'),
+            'isin clientes': lambda v, c: v['cod_cliente'].isin(c['cod_cliente'].iloc[:1000]),
+        }
+        print(f"   {'tipo':<10}{'memória (MB)':>14}" + ''.join(f"{nome:>28}" for nome in operacoes))
+        for tipo, (v, c) in bases.items():
+            tempos = [cronometrar(lambda: op(v, c), repeticoes)[0] for op in operacoes.values()]
+            print(f"   {tipo:<10}{_memoria_mb(v, c):>14.1f}" + ''.join(f"{t:>27.3f}s" for t in tempos))
+
+        for nome, caso in CASOS.items():
+            esperado = caso(*texto)
+            obtido = caso(*bases['category'])
+            try:
+                pd.testing.assert_frame_equal(
+                    _como_texto(esperado).reset_index(drop=True), _como_texto(obtido).reset_index(drop=True),
+                    check_dtype=False, rtol=1e-9
+                )
+            except AssertionError as e:
+                ok = False
+                print(f"   ❌ {nome} com categorias: {str(e).splitlines()[0]}")
+        if ok:
+            print("   KPIs com categorias iguais aos com texto")
+    return ok
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark das funções de KPI')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000], help='Tamanhos de base a testar')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetições por medição (vale o melhor tempo)')
+    parser.add_argument('--categorias', action='store_true',
+                        help='Compara memória e groupby de colunas de texto x categorias (em vez do tempo das funções)')
+
+    args = parser.parse_args()
+    executar_benchmark = comparar_categorias if args.categorias else executar
+    sys.exit(0 if executar_benchmark(args.rows, args.repeat) else 1)
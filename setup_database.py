@@ -97,11 +97,9 @@ def add_sample_data():
     
     try:
         import pandas as pd
-        import sqlite3
         from datetime import datetime
-        
-        # Conectar diretamente ao banco
-        conn = sqlite3.connect('instance/database.sqlite')
+        from webapp import server
+        from utils import db
         
         # Dados de exemplo de vendas (sem dataset_id)
         sample_vendas = pd.DataFrame({
@@ -126,12 +124,11 @@ def add_sample_data():
             'quantidade': [5, 2, 4, 3, 2]
         })
         
-        # Inserir dados usando pandas
-        sample_vendas.to_sql('vendas', conn, if_exists='append', index=False)
-        sample_cotacoes.to_sql('cotacoes', conn, if_exists='append', index=False)
-        
-        conn.commit()
-        conn.close()
+        # Inserir pela camada de dados: clientes e materiais vão para dim_cliente/dim_material
+        with server.app_context():
+            db.ensure_derived_schema()
+            db.save_clean_df(sample_vendas, 'vendas')
+            db.save_clean_df(sample_cotacoes, 'cotacoes')
         
         print(f"✅ Dados de exemplo inseridos:")
         print(f"   📈 Vendas: {len(sample_vendas)} registros")
@@ -0,0 +1,104 @@
+# utils/bulk_load.py
+
+import time
+from contextlib import contextmanager
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+# Tipos inferidos pelo pandas que o sqlite3 já aceita valor a valor (depois de trocar nulos por None)
+_NATIVE_INFERRED_TYPES = {'string', 'floating', 'integer', 'mixed-integer-float', 'boolean', 'empty'}
+
+def _sqlite_value(valor):
+    """Converte um valor avulso (colunas object) no mesmo formato que o DataFrame.to_sql gravaria."""
+    if valor is None or valor is pd.NaT or valor is pd.NA:
+        return None
+    if isinstance(valor, float) and np.isnan(valor):
+        return None
+    if isinstance(valor, dt.datetime):
+        return valor.isoformat(' ')
+    if isinstance(valor, (dt.date, dt.time)):
+        return valor.isoformat()
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+def _column_values(serie):
+    """Lista de valores Python prontos para o executemany, com nulos como None."""
+    if pd.api.types.is_datetime64_dtype(serie.dtype):
+        # Mesmo texto do to_sql (datetime.isoformat(' ')); frações de segundo só quando existem
+        texto = serie.dt.strftime('%Y-%m-%d %H:%M:%S')
+        fracao = serie.dt.microsecond != 0
+        if fracao.any():
+            texto = texto.where(~fracao, serie.dt.strftime('%Y-%m-%d %H:%M:%S.%f'))
+        return texto.astype(object).where(serie.notna(), None).tolist()
+    if isinstance(serie.dtype, pd.DatetimeTZDtype) or (
+            serie.dtype == object and pd.api.types.infer_dtype(serie, skipna=True) not in _NATIVE_INFERRED_TYPES):
+        return [_sqlite_value(valor) for valor in serie.tolist()]
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+def _table_indexes(db, table_name):
+    return db.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table_name,)
+    ).fetchall()
+
+def _insert_batches(db, sql, valores, rows, batch_size):
+    for ini in range(0, rows, batch_size):
+        fim = min(ini + batch_size, rows)
+        db.executemany(sql, zip(*(coluna[ini:fim] for coluna in valores)))
+
+def insert_sql(table_name, columns):
+    """INSERT preparado (um '?' por coluna) com os nomes de tabela e colunas entre aspas."""
+    colunas = [str(col) for col in columns]
+    return 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+        table_name,
+        ', '.join('"{}"'.format(col.replace('"', '""')) for col in colunas),
+        ', '.join('?' * len(colunas))
+    )
+
+@contextmanager
+def indexes_dropped(db, table_name):
+    """Remove os índices da tabela enquanto o bloco grava e os recria ao final (na transação corrente)."""
+    indexes = _table_indexes(db, table_name)
+    for name, _ in indexes:
+        db.execute(f'DROP INDEX "{name}"')
+    yield
+    for _, index_sql in indexes:
+        db.execute(index_sql)
+
+def bulk_insert_df(db, df, table_name, batch_size=50_000, rebuild_indexes=False):
+    """
+    Insere o DataFrame com executemany preparado, em lotes, dentro da transação corrente.
+
+    Não faz commit: quem chama abre a transação (BEGIN), agrupa as demais escritas e confirma.
+
+    Args:
+        db: conexão de escrita (write_transaction())
+        df: dados; as colunas precisam existir na tabela, como no to_sql com if_exists='append'
+        table_name: tabela de destino
+        batch_size: linhas por chamada de executemany
+        rebuild_indexes: remove os índices da tabela antes da carga e os recria ao final
+            (compensa em cargas grandes, em que manter os índices linha a linha custa mais)
+
+    Returns:
+        dict: rows, seconds e rows_per_s da carga
+    """
+    inicio = time.perf_counter()
+    rows = len(df)
+    if rows:
+        valores = [_column_values(df[col]) for col in df.columns]
+        sql = insert_sql(table_name, df.columns)
+
+        if rebuild_indexes:
+            with indexes_dropped(db, table_name):
+                _insert_batches(db, sql, valores, rows, batch_size)
+        else:
+            _insert_batches(db, sql, valores, rows, batch_size)
+
+    seconds = time.perf_counter() - inicio
+    return {
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'rows_per_s': round(rows / seconds) if seconds > 0 else rows,
+    }
@@ -0,0 +1,75 @@
+# utils/cache.py
+
+import threading
+from collections import OrderedDict
+
+class DataFrameCache:
+    """
+    Cache LRU em memória, compartilhado pelo processo, para DataFrames.
+
+    As chaves devem incluir a versão dos dados; quando a versão muda as entradas
+    antigas simplesmente deixam de ser pedidas e saem por LRU. O tamanho total
+    (memory_usage deep) nunca passa de max_bytes.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        """Guarda o DataFrame; retorna False se ele sozinho não cabe no limite de memória."""
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if size > self.max_bytes:
+                self.rejected += 1
+                return False
+            if key in self._entries:
+                self._current_bytes -= self._entries.pop(key)[1]
+            while self._entries and self._current_bytes + size > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._current_bytes -= old_size
+                self.evictions += 1
+            self._entries[key] = (df, size)
+            self._current_bytes += size
+            return True
+
+    def discard_older_versions(self, version):
+        """Remove entradas cuja chave tem versão (segundo elemento) diferente da atual."""
+        with self._lock:
+            for key in [k for k in self._entries if k[1] != version]:
+                self._current_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 1) if total else 0.0,
+                'evictions': self.evictions,
+                'rejected': self.rejected,
+            }
@@ -1,56 +1,166 @@
 # utils/data_loader.py
 
 import pandas as pd
-import io
-import base64
-import hashlib
-
-def parse_upload_content(contents):
-    """Decodifica o conteúdo de um arquivo carregado pelo dcc.Upload."""
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
-    return io.BytesIO(decoded)
-
-def generate_fingerprint(file_bytes_io):
-    """Gera uma assinatura MD5 para o conteúdo do arquivo."""
+import datetime as dt
+import math
+import pickle
+from utils import xlsx_stream
+
+# Textos lidos como nulos (os na_values padrão do pd.read_excel), para o importador em streaming gravar o mesmo
+NA_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>',
+    'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+def _is_null(valor):
+    return valor is None or valor is pd.NaT or (isinstance(valor, float) and math.isnan(valor))
+
+def _blank_row(row):
+    return all(_is_null(valor) or valor == '' for valor in row)
+
+def _text_value(valor):
+    """Valor de uma coluna TEXT: números inteiros sem '.0' e datas no formato do to_sql."""
+    if _is_null(valor):
+        return None
+    if isinstance(valor, str):
+        return None if valor in NA_STRINGS else valor
+    if isinstance(valor, bool):
+        return str(int(valor))
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    if isinstance(valor, dt.datetime):
+        return valor.isoformat(' ')
+    if isinstance(valor, (dt.date, dt.time)):
+        return valor.isoformat()
+    return str(valor)
+
+def _real_value(valor):
+    """Valor de uma coluna REAL; textos que não são número viram nulo (o ETL os descartaria igual)."""
+    if _is_null(valor):
+        return None
+    if isinstance(valor, (bool, int, float)):
+        return float(valor)
+    if isinstance(valor, str):
+        try:
+            return float(valor.strip())
+        except ValueError:
+            return None
+    return None
+
+def _sheet_reader(file_bytes_io):
+    """
+    Leitor da primeira planilha: (gerador de linhas, função que restringe as colunas convertidas).
+
+    .xlsx é lido em streaming (utils.xlsx_stream); .xls não tem leitura por linha e vem inteiro do pandas (xlrd).
+    """
     file_bytes_io.seek(0)
-    file_bytes = file_bytes_io.read()
+    is_xlsx = file_bytes_io.read(4) == b'PK\x03\x04'
     file_bytes_io.seek(0)
-    return hashlib.md5(file_bytes).hexdigest()
-
-def read_raw_vendas(file_bytes_io):
-    """Lê um arquivo de vendas e retorna um DataFrame com todas as colunas da planilha."""
-    df = pd.read_excel(file_bytes_io)
-    return df
-
-def read_raw_materiais_cotados(file_bytes_io):
-    """Lê um arquivo de materiais cotados e retorna um DataFrame com as colunas relevantes."""
-    df = pd.read_excel(file_bytes_io)
-    # Lista definitiva de colunas para materiais cotados
-    expected_cols = [
-        "Cotação",
-        "Cod. Cliente",
-        "Cliente",
-        "Material",
-        "Descrição",
-        "Quantidade",
-        "Preço Líquido Total"
+    if not is_xlsx:
+        df = pd.read_excel(file_bytes_io, header=None, na_filter=False)
+        return (row for row in df.astype(object).itertuples(index=False, name=None)), lambda posicoes: None
+
+    reader = xlsx_stream.SheetReader(file_bytes_io)
+
+    def rows():
+        try:
+            yield from reader.rows()
+        finally:
+            reader.close()
+
+    def keep(posicoes):
+        reader.keep = set(posicoes)
+    return rows(), keep
+
+def stream_raw_rows(file_bytes_io, schema_columns, batch_rows=10_000):
+    """
+    Lê a primeira planilha de um arquivo em lotes, só com as colunas do schema da tabela bruta.
+
+    As linhas de um .xlsx são lidas uma a uma (utils.xlsx_stream), então a memória fica em um lote,
+    qualquer que seja o tamanho da planilha; as demais colunas nem chegam a ser convertidas. Linhas sem
+    valor nas colunas do schema são descartadas.
+
+    Args:
+        file_bytes_io: arquivo binário aberto (.xlsx ou .xls)
+        schema_columns: {coluna: tipo} da tabela bruta (db.raw_table_columns)
+        batch_rows: linhas por lote
+
+    Returns:
+        tuple: (colunas encontradas no cabeçalho, na ordem do schema; gerador de listas de tuplas)
+
+    Raises:
+        ValueError: a planilha não tem nenhuma das colunas do schema
+    """
+    rows, keep = _sheet_reader(file_bytes_io)
+    # Cabeçalho: a primeira linha não vazia (como no pd.read_excel); nomes repetidos valem na primeira ocorrência
+    header = next((row for row in rows if not _blank_row(row)), ())
+    posicoes = {}
+    for i, nome in enumerate(header):
+        if isinstance(nome, str) and nome in schema_columns:
+            posicoes.setdefault(nome, i)
+    colunas = [col for col in schema_columns if col in posicoes]
+    if not colunas:
+        rows.close()
+        raise ValueError("Nenhuma coluna esperada encontrada no cabeçalho da planilha.")
+    # Daqui em diante só as células das colunas do schema são convertidas
+    keep(posicoes.values())
+    conversores = [
+        (posicoes[col], _real_value if schema_columns[col] == 'REAL' else _text_value) for col in colunas
     ]
-    # Filtra o DataFrame, mantendo apenas as colunas da lista que existem na planilha
-    return df[[col for col in expected_cols if col in df.columns]]
-
-def read_raw_propostas_anuais(file_bytes_io):
-    """Lê um arquivo de propostas anuais e retorna um DataFrame com as colunas relevantes."""
-    df = pd.read_excel(file_bytes_io)
-    # Lista definitiva de colunas para propostas anuais
-    expected_cols = [
-        "Número da Cotação",
-        "Número da Revisão",
-        "Código do Cliente",
-        "Nome do Cliente",
-        "Data de Criação",
-        "Status da Cotação",
-        "Valor Total"
+
+    def lotes():
+        lote = []
+        for row in rows:
+            if _blank_row(row):
+                # Linha em branco: o pd.read_excel também descarta
+                continue
+            lote.append(tuple(
+                converter(row[i]) if i < len(row) else None for i, converter in conversores
+            ))
+            if len(lote) >= batch_rows:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+    return colunas, lotes()
+
+def df_raw_rows(df, schema_columns):
+    """
+    Linhas de um DataFrame já lido, convertidas como em stream_raw_rows (só as colunas do schema).
+
+    Returns:
+        tuple: (colunas do schema presentes no DataFrame, lista de tuplas)
+    """
+    colunas = [col for col in schema_columns if col in df.columns]
+    valores = [
+        [(_real_value if schema_columns[col] == 'REAL' else _text_value)(v) for v in df[col].astype(object)]
+        for col in colunas
     ]
-    # Filtra o DataFrame, mantendo apenas as colunas da lista que existem na planilha
-    return df[[col for col in expected_cols if col in df.columns]]
\ No newline at end of file
+    return colunas, list(zip(*valores))
+
+def parse_raw_file(path, schema_columns, out_path, batch_rows=10_000):
+    """
+    Lê um arquivo com stream_raw_rows e grava os lotes já convertidos em out_path (pickle, um lote por vez).
+
+    Roda nos processos do upload paralelo (utils.uploads.UploadPipeline): o processo que grava no banco
+    só lê os lotes prontos com read_parsed_batches, sem segurar o arquivo inteiro na memória.
+
+    Returns:
+        list: colunas encontradas no cabeçalho (na ordem dos valores de cada linha)
+    """
+    with open(path, 'rb') as f, open(out_path, 'wb') as out:
+        colunas, lotes = stream_raw_rows(f, schema_columns, batch_rows)
+        for lote in lotes:
+            pickle.dump(lote, out, protocol=pickle.HIGHEST_PROTOCOL)
+    return colunas
+
+def read_parsed_batches(path):
+    """Lotes gravados por parse_raw_file, na ordem em que foram lidos."""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
@@ -1,28 +1,132 @@
 # utils/db.py
 
+import hashlib
+import itertools
+import json
 import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
 import click
+import numpy as np
 import pandas as pd
 from flask import current_app, g
 from utils.security import hash_password
+from utils.cache import DataFrameCache
+from utils import snapshot
+from utils.data_loader import df_raw_rows
+from utils.bulk_load import bulk_insert_df, indexes_dropped, insert_sql
 
-def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE']
-        )
-        g.db.row_factory = sqlite3.Row
-    return g.db
+# Conexões de longa duração do processo, por caminho do banco:
+# uma única conexão de escrita (serializada por _write_lock) e um pool de conexões de leitura.
+# Com WAL, leitores não bloqueiam o escritor e vice-versa.
+_write_lock = threading.RLock()
+# Profundidade das write_transaction abertas pela thread (as internas entram na transação da externa)
+_write_state = threading.local()
+_write_connections = {}
+_read_pools = {}
+_pools_lock = threading.Lock()
+
+def _connect(database, read_only=False):
+    config = current_app.config
+    busy_timeout_ms = int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    conn = sqlite3.connect(database, timeout=busy_timeout_ms / 1000, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {busy_timeout_ms}")
+    # cache_size negativo = tamanho em KiB
+    conn.execute(f"PRAGMA cache_size = -{int(config.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))}")
+    conn.execute(f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        # journal_mode é persistente no arquivo; basta a conexão de escrita ativá-lo
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+@contextmanager
+def write_transaction(bulk=False):
+    """
+    Transação na conexão de escrita do processo: toma o lock de escrita, BEGIN IMMEDIATE, commit no final
+    (rollback em erro) e libera o lock.
+
+    Só existe uma conexão de escrita por banco, e ela fica com a transação, não com a requisição ou o job
+    que a abriu: escritas concorrentes esperam apenas o fim da transação em andamento. Uma write_transaction
+    aberta dentro de outra (na mesma thread) entra na transação de fora. Para apenas ler, use get_read_db(),
+    que não espera por escritas.
+
+    Args:
+        bulk: carga em massa, com synchronous=OFF enquanto dura. O journal_mode continua WAL (sair dele
+            exige acesso exclusivo ao banco e bloquearia os leitores); uma queda de energia no meio da carga
+            perde no máximo essa transação, que o ETL refaz.
+
+    Raises:
+        sqlite3.OperationalError: 'database is locked' se outra transação (ex.: a carga do ETL em segundo
+            plano) segura a conexão por mais que SQLITE_BUSY_TIMEOUT_MS, como faria uma segunda conexão
+    """
+    config = current_app.config
+    if not _write_lock.acquire(timeout=int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000):
+        raise sqlite3.OperationalError("database is locked")
+    depth = getattr(_write_state, 'depth', 0)
+    _write_state.depth = depth + 1
+    try:
+        database = config['DATABASE']
+        db = _write_connections.get(database)
+        if db is None:
+            db = _write_connections[database] = _connect(database)
+        if depth:
+            yield db
+            return
+        if bulk:
+            db.execute("PRAGMA synchronous = OFF")
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+        finally:
+            if bulk:
+                db.execute("PRAGMA synchronous = NORMAL")
+    finally:
+        _write_state.depth = depth
+        _write_lock.release()
+
+def in_write_transaction():
+    """True se a thread atual está dentro de uma write_transaction."""
+    return getattr(_write_state, 'depth', 0) > 0
+
+def get_read_db():
+    """Conexão somente leitura, emprestada do pool do processo até o fim do contexto da aplicação."""
+    if 'read_db' not in g:
+        database = current_app.config['DATABASE']
+        with _pools_lock:
+            pool = _read_pools.setdefault(database, [])
+            conn = pool.pop() if pool else None
+        if conn is None:
+            conn = _connect(database, read_only=True)
+        g.read_db = (database, conn)
+    return g.read_db[1]
 
 def close_db(e=None):
-    db = g.pop('db', None)
-    if db is not None:
-        db.close()
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        database, conn = read_db
+        with _pools_lock:
+            pool = _read_pools.setdefault(database, [])
+            if len(pool) < current_app.config.get('SQLITE_READ_POOL_SIZE', 8):
+                pool.append(conn)
+                return
+        conn.close()
 
 def init_db():
-    db = get_db()
-    with current_app.open_resource('schema.sql') as f:
-        db.executescript(f.read().decode('utf8'))
+    with write_transaction() as db:
+        for statement in _schema_statements():
+            db.execute(statement)
 
 def init_database():
     """Função standalone para inicialização do banco"""
@@ -115,138 +219,1405 @@ def init_db_command():
     click.echo('Banco de dados inicializado.')
 
 def add_user(username, password):
-    db = get_db()
+    # O hash (lento de propósito) é calculado antes de tomar o lock de escrita
+    password_hash = hash_password(password)
     try:
-        db.execute(
-            "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-            (username, hash_password(password)),
-        )
-        db.commit()
+        with write_transaction() as db:
+            db.execute(
+                "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                (username, password_hash),
+            )
         return True
-    except db.IntegrityError:
+    except sqlite3.IntegrityError:
         return False
 
 def get_user_by_username(username):
-    db = get_db()
+    db = get_read_db()
     user = db.execute(
         "SELECT * FROM users WHERE username = ?", (username,)
     ).fetchone()
     return user
 
 def check_raw_fingerprint_exists(fingerprint, table_name):
-    db = get_db()
+    db = get_read_db()
     query = f"SELECT id FROM {table_name} WHERE fingerprint = ?"
     result = db.execute(query, (fingerprint,)).fetchone()
     return result is not None
 
-def insert_raw_df(df, table_name, filename, fingerprint, user_id):
-    db = get_db()
-    df['source_filename'] = filename
-    df['fingerprint'] = fingerprint
-    df['uploaded_by'] = user_id
+def _bulk_insert(db, df, table_name, rebuild_indexes=False):
+    config = current_app.config
+    stats = bulk_insert_df(
+        db, df, table_name,
+        batch_size=config.get('BULK_INSERT_BATCH_SIZE', 50_000),
+        rebuild_indexes=rebuild_indexes and len(df) >= config.get('BULK_REBUILD_INDEX_MIN_ROWS', 100_000)
+    )
+    print(f"{table_name}: {stats['rows']} linhas em {stats['seconds']}s ({stats['rows_per_s']} linhas/s)")
+    return stats
+
+# Colunas de controle das tabelas brutas, preenchidas pelo upload (não vêm da planilha)
+RAW_METADATA_COLUMNS = ['id', 'source_filename', 'fingerprint', 'uploaded_by', 'uploaded_at', 'row_hash']
+
+def raw_table_columns(table_name):
+    """Colunas de dados de uma tabela bruta no schema.sql, na ordem do CREATE TABLE: {nome: tipo}."""
+    reference = sqlite3.connect(':memory:')
     try:
-        df.to_sql(table_name, db, if_exists='append', index=False)
-        db.commit()
-        return len(df)
-    except Exception as e:
-        db.rollback()
+        reference.execute(_create_statements()[table_name])
+        return {
+            row[1]: row[2].upper() for row in reference.execute(f'PRAGMA table_info("{table_name}")')
+            if row[1] not in RAW_METADATA_COLUMNS
+        }
+    finally:
+        reference.close()
+
+def raw_row_hasher(table_name, columns):
+    """
+    Função que calcula o row_hash das linhas (tuplas na ordem de columns) de um arquivo bruto.
+
+    O hash cobre todas as colunas de dados do schema, na ordem do CREATE TABLE (as que faltam na planilha
+    contam como nulas): não depende da ordem das colunas no arquivo. Linhas idênticas dentro do mesmo
+    arquivo são lançamentos distintos, então a n-ésima repetição entra no hash com o número n; a mesma
+    linha reexportada em outro arquivo tem o mesmo hash e é ignorada pelo índice único.
+    Uma função por arquivo: ela guarda a contagem de repetições (8 bytes por linha distinta).
+    """
+    columns = list(columns)
+    posicoes = [columns.index(col) if col in columns else None for col in raw_table_columns(table_name)]
+    ocorrencias = {}
+
+    def row_hash(linha):
+        valores = [linha[i] if i is not None else None for i in posicoes]
+        conteudo = json.dumps(valores, ensure_ascii=False, separators=(',', ':')).encode('utf8')
+        digest = hashlib.blake2b(conteudo, digest_size=16).digest()
+        chave = int.from_bytes(digest[:8], 'big')
+        n = ocorrencias.get(chave, 0)
+        ocorrencias[chave] = n + 1
+        if n:
+            digest = hashlib.blake2b(digest + n.to_bytes(4, 'big'), digest_size=16).digest()
+        return digest.hex()
+
+    return row_hash
+
+def insert_raw_batches(table_name, columns, batches, filename, fingerprint, user_id):
+    """
+    Grava lotes de linhas (tuplas na ordem de columns) de um arquivo bruto em uma única transação.
+
+    Os lotes podem vir de um gerador que ainda está lendo a planilha: só um lote fica na memória.
+    Linhas com row_hash já presente na tabela (de um arquivo com período sobreposto) não são gravadas.
+
+    Returns:
+        dict: rows (linhas gravadas) e skipped (linhas já carregadas); rows 0 em caso de erro, e nada
+            do arquivo fica no banco
+    """
+    colunas = list(columns) + ['source_filename', 'fingerprint', 'uploaded_by', 'row_hash']
+    sql = insert_sql(table_name, colunas) + " ON CONFLICT (row_hash) DO NOTHING"
+    controle = (filename, fingerprint, user_id)
+    row_hash = raw_row_hasher(table_name, columns)
+    lidas = 0
+    inicio = time.perf_counter()
+    try:
+        ensure_raw_columns([table_name])
+        with write_transaction(bulk=True) as db:
+            antes = db.total_changes
+            for batch in batches:
+                db.executemany(sql, [linha + controle + (row_hash(linha),) for linha in batch])
+                lidas += len(batch)
+            # Sem bump_data_version: as tabelas limpas (e o cache e os snapshots delas) só mudam no próximo ETL
+            rows = db.total_changes - antes
+    except sqlite3.Error as e:
+        # Erros de leitura da planilha (vindos dos lotes) sobem para quem chamou, já com a transação desfeita
         print(f"Erro ao inserir dados brutos: {e}")
-        return 0
+        return {'rows': 0, 'skipped': 0}
+    seconds = time.perf_counter() - inicio
+    print(f"{table_name}: {rows} linhas em {seconds:.3f}s ({round(lidas / seconds) if seconds > 0 else lidas} linhas/s), "
+          f"{lidas - rows} já carregadas ignoradas")
+    return {'rows': rows, 'skipped': lidas - rows}
 
 def get_all_users():
-    db = get_db()
+    db = get_read_db()
     users = db.execute("SELECT id, username, created_at FROM users ORDER BY id").fetchall()
     return users
 
 def delete_user(user_id):
-    db = get_db()
-    db.execute("DELETE FROM users WHERE id = ?", (user_id,))
-    db.commit()
+    with write_transaction() as db:
+        db.execute("DELETE FROM users WHERE id = ?", (user_id,))
 
 def wipe_all_transaction_data():
-    db = get_db()
     try:
-        db.execute("BEGIN TRANSACTION")
-        db.execute("DELETE FROM vendas")
-        db.execute("DELETE FROM cotacoes")
-        db.execute("DELETE FROM raw_vendas")
-        db.execute("DELETE FROM raw_materiais_cotados")
-        db.execute("DELETE FROM raw_propostas_anuais")
-        db.commit()
+        with write_transaction() as db:
+            db.execute("DELETE FROM vendas")
+            db.execute("DELETE FROM cotacoes")
+            db.execute("DELETE FROM vendas_mensal")
+            db.execute("DELETE FROM cotacoes_mensal")
+            db.execute("DELETE FROM etl_processed")
+            db.execute("DELETE FROM raw_vendas")
+            db.execute("DELETE FROM raw_materiais_cotados")
+            db.execute("DELETE FROM raw_propostas_anuais")
+            bump_data_version(db)
         return True
-    except db.Error as e:
-        db.rollback()
+    except sqlite3.Error as e:
         print(f"Erro ao limpar o banco: {e}")
         return False
 
-def get_raw_data_as_df(table_name):
-    db = get_db()
-    query = f'SELECT * FROM "{table_name}"'
-    df = pd.read_sql_query(query, db)
+def _raw_query(table_name, columns=None, fingerprints=None):
+    if columns:
+        available_columns = get_table_columns(table_name)
+        column_list = ', '.join(f'"{col}"' for col in columns if col in available_columns) or '*'
+        query = f'SELECT {column_list} FROM "{table_name}"'
+    else:
+        query = f'SELECT * FROM "{table_name}"'
+    params = []
+    if fingerprints is not None:
+        fingerprints = list(fingerprints)
+        query += f' WHERE fingerprint IN ({", ".join("?" * len(fingerprints))})'
+        params = fingerprints
+    return query + ' ORDER BY id', params
+
+def get_raw_data_as_df(table_name, columns=None, fingerprints=None):
+    """Lê uma tabela bruta (na ordem de carga); com fingerprints, só as linhas desses arquivos."""
+    db = get_read_db()
+    query, params = _raw_query(table_name, columns, fingerprints)
+    df = pd.read_sql_query(query, db, params=params)
     return df
 
+def iter_raw_data(table_name, columns=None, fingerprints=None, chunksize=None):
+    """
+    Como get_raw_data_as_df, mas devolve a tabela em blocos de até chunksize linhas, lidos do cursor
+    conforme são consumidos (chunksize vazio ou 0: um único bloco com tudo).
+    """
+    if not chunksize:
+        yield get_raw_data_as_df(table_name, columns, fingerprints)
+        return
+    db = get_read_db()
+    query, params = _raw_query(table_name, columns, fingerprints)
+    yield from pd.read_sql_query(query, db, params=params, chunksize=chunksize)
+
+def get_raw_fingerprints(table_name):
+    """Fingerprints dos arquivos presentes em uma tabela bruta."""
+    db = get_read_db()
+    return [row[0] for row in db.execute(f'SELECT DISTINCT fingerprint FROM "{table_name}"').fetchall()]
+
+# Tabelas brutas de onde o ETL deriva cada tabela limpa
+RAW_SOURCES = {
+    'vendas': ['raw_vendas'],
+    'cotacoes': ['raw_materiais_cotados', 'raw_propostas_anuais'],
+}
+
+def get_etl_state(raw_tables):
+    """Arquivos já transformados: {tabela bruta: {fingerprint: regras}}."""
+    db = get_read_db()
+    raw_tables = list(raw_tables)
+    rows = db.execute(
+        f'SELECT raw_table, fingerprint, rules FROM etl_processed WHERE raw_table IN ({", ".join("?" * len(raw_tables))})',
+        raw_tables
+    ).fetchall()
+    state = {raw_table: {} for raw_table in raw_tables}
+    for raw_table, fingerprint, rules in rows:
+        state[raw_table][fingerprint] = rules
+    return state
+
+def _record_etl_state(db, table_name, etl_state, rules, replace):
+    """
+    Registra na transação corrente os arquivos transformados na tabela limpa.
+
+    Em uma recarga completa (replace) o estado anterior das tabelas brutas de origem é descartado,
+    mesmo sem etl_state: sem saber de onde vieram os dados, o próximo ETL incremental vira completo.
+    """
+    if replace:
+        for raw_table in RAW_SOURCES.get(table_name, []):
+            db.execute("DELETE FROM etl_processed WHERE raw_table = ?", (raw_table,))
+    for raw_table, fingerprints in (etl_state or {}).items():
+        db.executemany(
+            "INSERT OR REPLACE INTO etl_processed (raw_table, fingerprint, rules) VALUES (?, ?, ?)",
+            [(raw_table, fingerprint, rules) for fingerprint in fingerprints]
+        )
+
+def hash_raw_rows(batch_rows=10_000):
+    """
+    Preenche o row_hash das linhas brutas gravadas antes da coluna existir e apaga as repetidas.
+
+    Os arquivos são percorridos na ordem de carga: a linha fica com o primeiro arquivo que a trouxe, e as
+    cópias de reexportações posteriores são apagadas. Se algo foi apagado, o próximo ETL das tabelas
+    limpas de origem é completo.
+
+    Returns:
+        dict: {tabela bruta: {'hashed': linhas preenchidas, 'deleted': linhas repetidas apagadas}}
+    """
+    ensure_raw_columns()
+    resultado = {}
+    for table_name in [name for name in _create_statements() if name.startswith('raw_')]:
+        schema_columns = raw_table_columns(table_name)
+        select = ', '.join(f'"{col}"' for col in schema_columns)
+        hashed = deleted = 0
+        with write_transaction(bulk=True) as db:
+            arquivos = [row[0] for row in db.execute(
+                f'SELECT fingerprint FROM "{table_name}" WHERE row_hash IS NULL GROUP BY fingerprint ORDER BY MIN(id)'
+            )]
+            for fingerprint in arquivos:
+                row_hash = raw_row_hasher(table_name, schema_columns)
+                ultimo_id = 0
+                while True:
+                    df = pd.read_sql_query(
+                        f'SELECT id, {select} FROM "{table_name}" WHERE fingerprint = ? AND id > ? ORDER BY id LIMIT ?',
+                        db, params=(fingerprint, ultimo_id, batch_rows)
+                    )
+                    if df.empty:
+                        break
+                    ultimo_id = int(df['id'].iloc[-1])
+                    # Mesma conversão do upload, para o hash coincidir com o de uma nova carga do arquivo
+                    _, linhas = df_raw_rows(df, schema_columns)
+                    for row_id, linha in zip(df['id'].tolist(), linhas):
+                        try:
+                            db.execute(f'UPDATE "{table_name}" SET row_hash = ? WHERE id = ?', (row_hash(linha), row_id))
+                            hashed += 1
+                        except sqlite3.IntegrityError:
+                            db.execute(f'DELETE FROM "{table_name}" WHERE id = ?', (row_id,))
+                            deleted += 1
+            if deleted:
+                for clean_table, raw_tables in RAW_SOURCES.items():
+                    if table_name in raw_tables:
+                        _record_etl_state(db, clean_table, None, None, replace=True)
+        resultado[table_name] = {'hashed': hashed, 'deleted': deleted}
+    return resultado
+
+def create_etl_job(job_id, mode, user_id=None, stale_seconds=6 * 3600):
+    """
+    Registra um job de ETL como 'running', se nenhum outro estiver rodando (em qualquer processo).
+
+    Um job 'running' sem atualização há mais de stale_seconds é de um processo que caiu no meio do ETL
+    e é marcado como erro antes da verificação.
+
+    Returns:
+        bool: True se o job foi registrado; False se já existe um ETL em execução
+    """
+    # BEGIN IMMEDIATE (write_transaction): a verificação e o INSERT ficam atômicos também entre processos
+    with write_transaction() as db:
+        db.execute(
+            "UPDATE etl_jobs SET status = 'error', message = 'Execução interrompida.', finished_at = CURRENT_TIMESTAMP "
+            "WHERE status = 'running' AND updated_at < datetime('now', ?)", (f'-{int(stale_seconds)} seconds',)
+        )
+        running = db.execute("SELECT id FROM etl_jobs WHERE status = 'running'").fetchone()
+        if running is None:
+            db.execute(
+                "INSERT INTO etl_jobs (id, mode, status, stage, started_by) VALUES (?, ?, 'running', 'Iniciando', ?)",
+                (job_id, mode, user_id)
+            )
+    return running is None
+
+def update_etl_job(job_id, stage, rows_processed):
+    with write_transaction() as db:
+        db.execute(
+            "UPDATE etl_jobs SET stage = ?, rows_processed = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (stage, rows_processed, job_id)
+        )
+
+def finish_etl_job(job_id, status, message, rows_processed=None):
+    """Encerra o job com status 'done' ou 'error'; rows_processed vazio mantém o último valor gravado."""
+    with write_transaction() as db:
+        db.execute(
+            "UPDATE etl_jobs SET status = ?, message = ?, rows_processed = COALESCE(?, rows_processed), "
+            "updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (status, message, rows_processed, job_id)
+        )
+
+def get_etl_job(job_id=None):
+    """Um job de ETL (o mais recente se job_id for vazio), com o tempo decorrido em segundos; None se não houver."""
+    db = get_read_db()
+    query = (
+        "SELECT id, mode, status, stage, rows_processed, message, started_by, started_at, finished_at, "
+        "(julianday(COALESCE(finished_at, CURRENT_TIMESTAMP)) - julianday(started_at)) * 86400 AS elapsed "
+        "FROM etl_jobs "
+    )
+    if job_id:
+        row = db.execute(query + "WHERE id = ?", (job_id,)).fetchone()
+    else:
+        row = db.execute(query + "ORDER BY started_at DESC, rowid DESC LIMIT 1").fetchone()
+    return dict(row) if row else None
+
+def record_etl_runs(run_id, runs):
+    """Grava no histórico (etl_runs) as medidas de cada tabela processada em uma execução do ETL."""
+    with write_transaction() as db:
+        db.executemany(
+            "INSERT INTO etl_runs (run_id, table_name, mode, started_at, finished_at, seconds, rows_in, rows_out, "
+            "stage_seconds, dropped_rows, peak_rss_mb, max_chunk_mb) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (run_id, run['table_name'], run['mode'], run['started_at'], run['finished_at'], run['seconds'],
+                 run['rows_in'], run['rows_out'], json.dumps(run['stage_seconds']),
+                 json.dumps(run['dropped_rows'], ensure_ascii=False), run['peak_rss_mb'], run['max_chunk_mb'])
+                for run in runs
+            ]
+        )
+
+def get_etl_runs(limit=20, table_name=None):
+    """Últimas entradas do histórico do ETL (mais recentes primeiro), com stage_seconds e dropped_rows como dicts."""
+    db = get_read_db()
+    query = "SELECT * FROM etl_runs"
+    params = []
+    if table_name:
+        query += " WHERE table_name = ?"
+        params.append(table_name)
+    query += " ORDER BY started_at DESC, id DESC LIMIT ?"
+    params.append(int(limit))
+    runs = []
+    for row in db.execute(query, params).fetchall():
+        run = dict(row)
+        run['stage_seconds'] = json.loads(run['stage_seconds'] or '{}')
+        run['dropped_rows'] = json.loads(run['dropped_rows'] or '{}')
+        runs.append(run)
+    return runs
+
 def truncate_table(table_name):
-    db = get_db()
-    db.execute(f"DELETE FROM {table_name}")
-    db.execute("DELETE FROM sqlite_sequence WHERE name=?", (table_name,))
-    db.commit()
+    with write_transaction() as db:
+        db.execute(f"DELETE FROM {table_name}")
+        db.execute("DELETE FROM sqlite_sequence WHERE name=?", (table_name,))
+        _rebuild_monthly(db, table_name)
+        _record_etl_state(db, table_name, None, None, replace=True)
+        bump_data_version(db)
     print(f"Tabela {table_name} limpa com sucesso.")
 
+# Dimensões das tabelas limpas: chave inteira, chave natural e atributos descritivos
+DIMENSIONS = {
+    'dim_cliente': {'key': 'cliente_id', 'natural_key': 'cod_cliente', 'attributes': ['cliente']},
+    'dim_material': {
+        'key': 'material_id', 'natural_key': 'material',
+        'attributes': ['produto', 'unidade_negocio', 'hier_produto_1', 'hier_produto_2', 'hier_produto_3']
+    },
+}
+
+# Colunas de cada dimensão que os loaders devolvem junto com a tabela de fatos, na ordem das colunas antigas.
+# 'vendas' é a fonte dos atributos; 'cotacoes' só acrescenta clientes e materiais que não aparecem nas vendas.
+FACT_DIMENSIONS = {
+    'vendas': {'dim_cliente': ['cod_cliente', 'cliente'], 'dim_material': ['material', 'produto', 'unidade_negocio']},
+    'cotacoes': {'dim_cliente': ['cod_cliente', 'cliente'], 'dim_material': ['material']},
+}
+FACT_DIMENSIONS['vendas_mensal'] = FACT_DIMENSIONS['vendas']
+FACT_DIMENSIONS['cotacoes_mensal'] = FACT_DIMENSIONS['cotacoes']
+AUTHORITATIVE_FACTS = {'vendas'}
+
+def _write_dimension(db, dim_table, valores, attributes, mode):
+    natural_key = DIMENSIONS[dim_table]['natural_key']
+    if mode == 'overwrite' and attributes:
+        conflict = 'DO UPDATE SET ' + ', '.join(f'{col} = excluded.{col}' for col in attributes)
+    elif mode == 'fill' and attributes:
+        conflict = 'DO UPDATE SET ' + ', '.join(f'{col} = COALESCE({dim_table}.{col}, excluded.{col})' for col in attributes)
+    else:
+        conflict = 'DO NOTHING'
+    sql = (
+        f"INSERT INTO {dim_table} ({', '.join([natural_key] + attributes)}) "
+        f"VALUES ({', '.join('?' * (len(attributes) + 1))}) ON CONFLICT({natural_key}) {conflict}"
+    )
+    db.executemany(sql, valores.astype(object).where(valores.notna(), None).itertuples(index=False, name=None))
+
+def _upsert_dimension(db, dim_table, df, mode, seen=None):
+    """
+    Grava as chaves naturais (e atributos) do DataFrame na dimensão e retorna o mapa chave natural -> chave inteira.
+
+    mode: 'overwrite' (atributos do DataFrame substituem os gravados), 'fill' (só preenche atributos nulos)
+    ou 'insert' (só inclui chaves novas).
+
+    seen: chaves já gravadas pelos blocos anteriores da mesma carga (atualizado aqui). Em 'overwrite' elas
+    só têm os atributos nulos preenchidos, então a carga em blocos grava os mesmos atributos que a de uma vez.
+    """
+    dim = DIMENSIONS[dim_table]
+    natural_key = dim['natural_key']
+    attributes = [col for col in dim['attributes'] if col in df.columns]
+
+    # Um registro por chave natural, com o primeiro valor não nulo de cada atributo
+    valores = df[[natural_key] + attributes].dropna(subset=[natural_key])
+    if attributes:
+        valores = valores.groupby(natural_key, sort=False, observed=True).first().reset_index()
+    else:
+        valores = valores.drop_duplicates()
+
+    if seen is not None and mode == 'overwrite':
+        chaves = seen.setdefault(dim_table, set())
+        repetidas = valores[natural_key].isin(chaves)
+        chaves.update(valores[natural_key].tolist())
+        _write_dimension(db, dim_table, valores[~repetidas], attributes, 'overwrite')
+        _write_dimension(db, dim_table, valores[repetidas], attributes, 'fill')
+    else:
+        _write_dimension(db, dim_table, valores, attributes, mode)
+
+    mapping = db.execute(f"SELECT {natural_key}, {dim['key']} FROM {dim_table}").fetchall()
+    return pd.Series({row[0]: row[1] for row in mapping}, dtype='Int64')
+
+# Datas das tabelas de fatos, gravadas como número de dias desde DATE_EPOCH (INTEGER). A coluna de data principal
+# de cada tabela (CLEAN_DATE_COLUMNS) leva junto ano, mes e yyyymm, calculados uma vez na carga.
+DATE_EPOCH = pd.Timestamp('1970-01-01')
+FACT_DATE_COLUMNS = ['data_entrada', 'data_faturamento', 'data']
+
+def _encode_dates(fact, table_name):
+    """Converte as colunas de data em dias inteiros e acrescenta ano/mes/yyyymm da data principal."""
+    date_col = CLEAN_DATE_COLUMNS.get(table_name)
+    for col in FACT_DATE_COLUMNS:
+        if col not in fact.columns:
+            continue
+        datas = fact[col]
+        if not pd.api.types.is_datetime64_any_dtype(datas):
+            datas = pd.to_datetime(datas, errors='coerce')
+        if col == date_col:
+            fact['ano'] = datas.dt.year.astype('Int64')
+            fact['mes'] = datas.dt.month.astype('Int64')
+            fact['yyyymm'] = fact['ano'] * 100 + fact['mes']
+        fact[col] = (datas - DATE_EPOCH).dt.days.astype('Int64')
+    return fact
+
+def _days_to_datetime(serie):
+    """Dias desde DATE_EPOCH (nulos como None/NaN) em datetime64, sem nenhum parsing de texto."""
+    dias = serie.to_numpy(dtype='float64', na_value=np.nan)
+    nulos = np.isnan(dias)
+    datas = np.where(nulos, 0, dias).astype('int64').astype('datetime64[D]').astype('datetime64[us]')
+    datas[nulos] = np.datetime64('NaT')
+    return pd.Series(datas, index=serie.index, name=serie.name)
+
+def _day_number(valor):
+    """Primeiro dia inteiro >= valor: as datas gravadas são dias inteiros (meia-noite)."""
+    ts = pd.Timestamp(valor)
+    dias = (ts.normalize() - DATE_EPOCH).days
+    return dias if ts == ts.normalize() else dias + 1
+
+def _fact_df(db, df, table_name, append=False, seen=None):
+    """
+    Troca as colunas descritivas pelas chaves das dimensões (gravando-as), codifica as datas em dias
+    e devolve o DataFrame da tabela de fatos.
+
+    A tabela de fatos de referência (AUTHORITATIVE_FACTS) define os atributos: numa recarga completa ela os
+    sobrescreve e numa carga incremental (append) só preenche os que faltam, mantendo o primeiro valor do
+    histórico, como na recarga. As demais só incluem chaves novas, assim o resultado não depende da ordem
+    em que os ETLs rodam. seen acompanha as chaves de uma carga em blocos (ver _upsert_dimension).
+    """
+    if table_name not in AUTHORITATIVE_FACTS:
+        mode = 'insert'
+    else:
+        mode = 'fill' if append else 'overwrite'
+    fact = _encode_dates(df.copy(), table_name)
+    for dim_table in FACT_DIMENSIONS.get(table_name, {}):
+        dim = DIMENSIONS[dim_table]
+        if dim['natural_key'] not in fact.columns:
+            continue
+        # A chave natural é TEXT na dimensão; códigos numéricos são comparados pelo mesmo texto que o SQLite grava
+        natural = fact[dim['natural_key']]
+        if isinstance(natural.dtype, pd.CategoricalDtype):
+            natural = natural.astype(object)
+        fact[dim['natural_key']] = natural.where(natural.isna(), natural.astype(str))
+        mapping = _upsert_dimension(db, dim_table, fact, mode, seen)
+        fact[dim['key']] = fact[dim['natural_key']].map(mapping)
+        fact = fact.drop(columns=[dim['natural_key']] + [col for col in dim['attributes'] if col in fact.columns])
+    return fact
+
 def save_clean_df(df, table_name):
-    db = get_db()
     try:
-        df.to_sql(table_name, db, if_exists='append', index=False)
-        db.commit()
-        return len(df)
+        return append_clean_df(df, table_name)['rows']
+    except Exception:
+        return 0
+
+def append_clean_df(df, table_name, etl_state=None, rules=None):
+    """
+    Acrescenta linhas a uma tabela limpa em uma única transação (carga incremental do ETL).
+
+    No agregado mensal só os meses que receberam linhas são refeitos, sem reagregar a tabela inteira.
+
+    Args:
+        df: linhas novas, com as colunas descritivas (como em replace_clean_table)
+        table_name: 'vendas' ou 'cotacoes'
+        etl_state: {tabela bruta: fingerprints} dos arquivos transformados nesta carga
+        rules: identificador das regras de transformação usadas (etl.rules_fingerprint)
+
+    Returns:
+        dict: rows, seconds e rows_per_s da carga
+
+    Raises:
+        Exception: erro na gravação, já com a transação desfeita
+    """
+    try:
+        with write_transaction(bulk=True) as db:
+            # AUTOINCREMENT: as linhas novas recebem ids maiores que qualquer id já usado
+            first_id = db.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM "{table_name}"').fetchone()[0]
+            stats = _bulk_insert(db, _fact_df(db, df, table_name, append=True), table_name)
+            _refresh_monthly(db, table_name, first_id)
+            _record_etl_state(db, table_name, etl_state, rules, replace=False)
+            bump_data_version(db)
+        return stats
     except Exception as e:
-        db.rollback()
         print(f"Erro ao salvar dados limpos: {e}")
-        return 0
+        raise
 
-def get_clean_vendas_as_df():
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM vendas")
-    data = cursor.fetchall()
-    columns = [description[0] for description in cursor.description]
-    if not data:
-        return pd.DataFrame(columns=columns)
-    df = pd.DataFrame(data, columns=columns)
-    date_cols = ['data_entrada', 'data_faturamento']
-    for col in date_cols:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
-    return df
+def replace_clean_table(df, table_name, etl_state=None, rules=None):
+    """
+    Troca todo o conteúdo de uma tabela limpa em uma única transação (leitores nunca a veem vazia).
+
+    O DataFrame vem com as colunas descritivas (cod_cliente, cliente, material, produto, ...); elas vão
+    para as dimensões e a tabela de fatos recebe só as chaves inteiras. O agregado mensal da tabela
+    (vendas_mensal/cotacoes_mensal) é refeito na mesma transação.
+
+    Em cargas grandes os índices são removidos e recriados ao final (BULK_REBUILD_INDEX_MIN_ROWS).
+
+    etl_state e rules registram os arquivos brutos transformados (ver append_clean_df); o estado anterior
+    das tabelas brutas de origem é descartado.
+
+    Returns:
+        dict: rows, seconds e rows_per_s da carga
+
+    Raises:
+        Exception: erro na gravação, já com a transação desfeita
+    """
+    try:
+        with write_transaction(bulk=True) as db:
+            db.execute(f'DELETE FROM "{table_name}"')
+            db.execute("DELETE FROM sqlite_sequence WHERE name=?", (table_name,))
+            stats = _bulk_insert(db, _fact_df(db, df, table_name), table_name, rebuild_indexes=True)
+            _rebuild_monthly(db, table_name)
+            _record_etl_state(db, table_name, etl_state, rules, replace=True)
+            bump_data_version(db)
+        return stats
+    except Exception as e:
+        print(f"Erro ao salvar dados limpos: {e}")
+        raise
+
+def load_clean_chunks(chunks, table_name, etl_state=None, rules=None, replace=True):
+    """
+    Grava uma tabela limpa a partir de blocos de DataFrame, consumidos um a um, em uma única transação.
+
+    Com replace=True equivale a replace_clean_table com todos os blocos concatenados (os índices são
+    removidos durante a carga e o agregado mensal é refeito no fim); com replace=False, a append_clean_df.
+    Só um bloco fica em memória por vez, então o histórico inteiro nunca é montado em um DataFrame.
+
+    Returns:
+        dict: rows, chunks, seconds e rows_per_s da carga
+
+    Raises:
+        Exception: como em load_clean_tables
+    """
+    load = {'table_name': table_name, 'chunks': chunks, 'etl_state': etl_state, 'rules': rules, 'replace': replace}
+    return load_clean_tables([load])[table_name]
+
+def load_clean_tables(loads):
+    """
+    Grava várias tabelas limpas (na ordem da lista) em uma única transação: os leitores passam a ver
+    todas juntas, no commit.
+
+    Args:
+        loads: lista de dicts com table_name, chunks, etl_state, rules e replace (como em load_clean_chunks).
+            Se chunks não entrega nenhum bloco, a tabela não é tocada.
+
+    Returns:
+        dict: tabela -> rows, chunks, seconds e rows_per_s da carga
+
+    Raises:
+        Exception: erro na gravação ou nos blocos (a leitura e a limpeza rodam dentro do gerador chunks);
+            a transação é desfeita e nenhuma tabela muda
+    """
+    result = {}
+    try:
+        with write_transaction(bulk=True) as db:
+            for load in loads:
+                result[load['table_name']] = _load_chunks(db, **load)
+            bump_data_version(db)
+    except sqlite3.Error as e:
+        print(f"Erro ao salvar dados limpos: {e}")
+        raise
+    return result
+
+def _load_chunks(db, table_name, chunks, etl_state=None, rules=None, replace=True):
+    """Carga de uma tabela limpa dentro da transação corrente (ver load_clean_tables)."""
+    inicio = time.perf_counter()
+    stats = {'rows': 0, 'chunks': 0}
+    chunks = iter(chunks)
+    # O primeiro bloco é lido antes de apagar a tabela: sem nenhum, ela fica como está
+    primeiro = next(chunks, None)
+    if primeiro is not None:
+        if replace:
+            db.execute(f'DELETE FROM "{table_name}"')
+            db.execute("DELETE FROM sqlite_sequence WHERE name=?", (table_name,))
+        first_id = db.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM "{table_name}"').fetchone()[0]
+        seen = {} if replace else None
+        with (indexes_dropped(db, table_name) if replace else nullcontext()):
+            for chunk in itertools.chain([primeiro], chunks):
+                if chunk.empty:
+                    continue
+                fact = _fact_df(db, chunk, table_name, append=not replace, seen=seen)
+                stats['rows'] += _bulk_insert(db, fact, table_name)['rows']
+                stats['chunks'] += 1
+        if replace:
+            _rebuild_monthly(db, table_name)
+        else:
+            _refresh_monthly(db, table_name, first_id)
+        _record_etl_state(db, table_name, etl_state, rules, replace=replace)
+    seconds = time.perf_counter() - inicio
+    stats['seconds'] = round(seconds, 3)
+    stats['rows_per_s'] = round(stats['rows'] / seconds) if seconds > 0 else stats['rows']
+    return stats
+
+# Colunas de data usadas nos filtros de período de cada tabela limpa
+CLEAN_DATE_COLUMNS = {
+    'vendas': 'data_faturamento',
+    'cotacoes': 'data',
+    'vendas_mensal': 'data_faturamento',
+    'cotacoes_mensal': 'data',
+}
 
-def get_clean_cotacoes_as_df():
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM cotacoes")
-    data = cursor.fetchall()
-    columns = [description[0] for description in cursor.description]
-    if not data:
-        return pd.DataFrame(columns=columns)
-    df = pd.DataFrame(data, columns=columns)
-    if 'data' in df.columns:
-        df['data'] = pd.to_datetime(df['data'], errors='coerce')
+# Origem do dicionário de cada coluna categórica das tabelas limpas (snapshot.CATEGORICAL_COLUMNS): a dimensão,
+# comum a vendas e cotacoes, ou a tabela de fatos para colunas que só ela tem
+CATEGORY_SOURCES = {
+    'cod_cliente': 'dim_cliente', 'cliente': 'dim_cliente',
+    'material': 'dim_material', 'produto': 'dim_material', 'unidade_negocio': 'dim_material',
+    'canal_distribuicao': 'vendas',
+}
+# Versão dos dados -> tipos categóricos (só a versão mais recente fica guardada)
+_category_dtypes = {}
+
+# Cache das tabelas limpas completas, compartilhado pelo processo e indexado por (tabela, versão dos dados)
+_df_cache = DataFrameCache()
+# Tabela -> versão em que ela não coube no limite do cache (evita recarregá-la a cada consulta)
+_oversized_tables = {}
+
+def get_data_version():
+    db = get_read_db()
+    row = db.execute("SELECT value_json FROM settings WHERE key = 'data_version'").fetchone()
+    return int(row[0]) if row else 0
+
+def get_data_token(version=None):
+    """
+    Identifica o estado dos dados (banco + versão) para validar arquivos em disco, como os snapshots.
+
+    Retorna None enquanto o banco ainda não tem identificador (nenhuma escrita passou por bump_data_version).
+    """
+    db = get_read_db()
+    row = db.execute("SELECT value_json FROM settings WHERE key = 'database_uid'").fetchone()
+    if row is None:
+        return None
+    if version is None:
+        version = get_data_version()
+    return f"{row[0]}:{version}"
+
+def bump_data_version(db):
+    """
+    Incrementa a versão dos dados dentro da transação corrente; o commit fica com quem chamou.
+
+    A versão identifica o conteúdo das tabelas limpas e derivadas (cache de DataFrames e snapshots): só
+    as escritas nelas a incrementam. Uploads para as tabelas brutas não mexem nela.
+    """
+    # Um banco recriado volta a contar do zero; o uid impede que snapshots antigos pareçam atuais
+    db.execute(
+        "INSERT OR IGNORE INTO settings (key, value_json) VALUES ('database_uid', ?)", (uuid.uuid4().hex,)
+    )
+    db.execute(
+        "INSERT INTO settings (key, value_json) VALUES ('data_version', '1') "
+        "ON CONFLICT(key) DO UPDATE SET value_json = CAST(value_json AS INTEGER) + 1"
+    )
+
+def get_setting(key, default=None):
+    """Valor (JSON decodificado) de uma chave de settings, ou default se ela não existe."""
+    row = get_read_db().execute("SELECT value_json FROM settings WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+def set_setting(key, value):
+    """Grava (ou, com value None, remove) uma chave de settings."""
+    with write_transaction() as db:
+        if value is None:
+            db.execute("DELETE FROM settings WHERE key = ?", (key,))
+        else:
+            db.execute(
+                "INSERT INTO settings (key, value_json) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value_json = excluded.value_json",
+                (key, json.dumps(value, ensure_ascii=False)),
+            )
+
+def get_category_dtypes():
+    """
+    Tipos categóricos das colunas de texto repetitivas das tabelas limpas, para a versão atual dos dados.
+
+    As categorias (em ordem alfabética, então ordenar a coluna dá o mesmo resultado que no texto) vêm das
+    dimensões: vendas e cotacoes devolvem cod_cliente e material com o mesmo dicionário, e merges, isin e
+    concat entre as duas comparam códigos inteiros em vez de textos.
+    """
+    version = get_data_version()
+    dtypes = _category_dtypes.get(version)
+    if dtypes is not None:
+        return dtypes
+    db = get_read_db()
+    dtypes = {}
+    for col, source in CATEGORY_SOURCES.items():
+        try:
+            rows = db.execute(
+                f'SELECT DISTINCT "{col}" FROM {source} WHERE "{col}" IS NOT NULL ORDER BY "{col}"'
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # Banco de uma versão anterior, sem a dimensão: a coluna continua como texto
+            continue
+        dtypes[col] = pd.CategoricalDtype([row[0] for row in rows])
+    _category_dtypes.clear()
+    _category_dtypes[version] = dtypes
+    return dtypes
+
+def _with_categories(df):
+    """Converte as colunas categóricas de df para os tipos compartilhados de get_category_dtypes (altera df)."""
+    dtypes = get_category_dtypes()
+    for col in df.columns:
+        dtype = dtypes.get(col)
+        if dtype is None or df[col].dtype == dtype:
+            continue
+        valores = df[col]
+        convertida = valores.astype(dtype)
+        if convertida.isna().sum() != valores.isna().sum():
+            # Valor fora do dicionário (gravado depois da leitura das dimensões): categorias próprias da coluna
+            convertida = valores.astype(object).astype('category')
+        df[col] = convertida
     return df
 
+def get_cache_stats():
+    return _df_cache.stats()
+
+def get_table_columns(table_name):
+    db = get_read_db()
+    return [row[1] for row in db.execute(f'PRAGMA table_info("{table_name}")').fetchall()]
+
+def get_clean_columns(table_name):
+    """Colunas lógicas de uma tabela limpa: as da tabela de fatos com as chaves trocadas pelas colunas das dimensões."""
+    physical = get_table_columns(table_name)
+    dimension_columns = [col for columns in FACT_DIMENSIONS.get(table_name, {}).values() for col in columns]
+    keys = {DIMENSIONS[dim_table]['key'] for dim_table in FACT_DIMENSIONS.get(table_name, {})}
+    head = ['id'] if 'id' in physical else []
+    return head + dimension_columns + [col for col in physical if col not in keys and col != 'id']
+
+def _dimension_of(table_name, column):
+    """Dimensão de onde vem a coluna lógica (None se ela está na própria tabela de fatos)."""
+    for dim_table, columns in FACT_DIMENSIONS.get(table_name, {}).items():
+        if column in columns:
+            return dim_table
+    return None
+
+def _column_ref(table_name, column):
+    dim_table = _dimension_of(table_name, column)
+    return f'"{dim_table or table_name}"."{column}"'
+
+def get_material_hierarchy():
+    """Hierarquia de produto por material (dim_material), com os nomes de coluna do raw_vendas."""
+    db = get_read_db()
+    cursor = db.execute(
+        'SELECT material, hier_produto_1, hier_produto_2, hier_produto_3 FROM dim_material'
+    )
+    return pd.DataFrame(
+        cursor.fetchall(), columns=['Material', 'Hier. Produto 1', 'Hier. Produto 2', 'Hier. Produto 3']
+    )
+
+def get_dim_material_df(columns=None):
+    """Tabela dim_material (colunas lógicas: material, produto, unidade_negocio, hier_produto_1/2/3)."""
+    db = get_read_db()
+    dim = DIMENSIONS['dim_material']
+    available = [dim['natural_key']] + dim['attributes']
+    selected = [col for col in (columns or available) if col in available]
+    cursor = db.execute(f"SELECT {', '.join(selected)} FROM dim_material")
+    return pd.DataFrame(cursor.fetchall(), columns=selected)
+
+def _as_range(valor):
+    """Normaliza um filtro de slider (valor único ou [início, fim]) em uma tupla (início, fim)."""
+    if isinstance(valor, (list, tuple)) and len(valor) == 2:
+        return int(valor[0]), int(valor[1])
+    return int(valor), int(valor)
+
+def _build_clean_filters(table_name, available_columns, data_inicio=None, data_fim=None, ano=None, mes=None,
+                         clientes=None, canais=None, unidades=None):
+    """
+    Monta as cláusulas WHERE (e seus parâmetros) para as tabelas limpas.
+
+    Filtros sobre colunas inexistentes na tabela são ignorados, como os callbacks já faziam em pandas.
+    """
+    clauses, params = [], []
+    date_col = CLEAN_DATE_COLUMNS.get(table_name)
+
+    if date_col in available_columns:
+        # Datas são dias inteiros: todos os filtros de período viram comparações de inteiros
+        date_ref = _column_ref(table_name, date_col)
+        mes_ini, mes_fim = _as_range(mes) if mes else (1, 12)
+        # Intervalo de anos vira intervalo de dias para aproveitar os índices (cliente, data);
+        # com um único ano, o intervalo de meses também entra no intervalo de dias
+        if ano:
+            ano_ini, ano_fim = _as_range(ano)
+            if ano_ini == ano_fim:
+                inicio = pd.Timestamp(ano_ini, mes_ini, 1)
+                fim = pd.Timestamp(ano_ini, mes_fim, 1) + pd.offsets.MonthBegin()
+            else:
+                inicio, fim = pd.Timestamp(ano_ini, 1, 1), pd.Timestamp(ano_fim + 1, 1, 1)
+            clauses.append(f'{date_ref} >= ? AND {date_ref} < ?')
+            params += [_day_number(inicio), _day_number(fim)]
+        if data_inicio is not None:
+            clauses.append(f'{date_ref} >= ?')
+            params.append(_day_number(data_inicio))
+        if data_fim is not None:
+            clauses.append(f'{date_ref} < ?')
+            params.append(_day_number(data_fim))
+        if (mes_ini, mes_fim) != (1, 12) and 'mes' in available_columns:
+            clauses.append(f'{_column_ref(table_name, "mes")} BETWEEN ? AND ?')
+            params += [mes_ini, mes_fim]
+
+    for col, valores in (('cod_cliente', clientes), ('canal_distribuicao', canais), ('unidade_negocio', unidades)):
+        if valores and col in available_columns:
+            valores = list(valores)
+            marcadores = ", ".join("?" * len(valores))
+            dim_table = _dimension_of(table_name, col)
+            if dim_table:
+                # Filtro sobre atributo da dimensão: a subconsulta resolve as chaves na dimensão (pelo índice do
+                # atributo) e o planejador casa o IN com os índices da chave na tabela de fatos. Os parâmetros
+                # são só os valores pedidos, qualquer que seja o número de chaves que eles cobrem.
+                key = DIMENSIONS[dim_table]['key']
+                clauses.append(
+                    f'"{table_name}"."{key}" IN (SELECT {key} FROM {dim_table} WHERE "{col}" IN ({marcadores}))'
+                )
+            else:
+                clauses.append(f'{_column_ref(table_name, col)} IN ({marcadores})')
+            params += valores
+
+    return clauses, params
+
+def _clean_filter_mask(df, table_name, data_inicio=None, data_fim=None, ano=None, mes=None,
+                       clientes=None, canais=None, unidades=None):
+    """Equivalente em pandas de _build_clean_filters; retorna None quando não há filtro."""
+    mask = None
+    def _and(cond):
+        nonlocal mask
+        mask = cond if mask is None else mask & cond
+
+    date_col = CLEAN_DATE_COLUMNS.get(table_name)
+    if date_col in df.columns:
+        datas = df[date_col]
+        # Ano e mês pré-calculados na carga, quando vieram junto (comparação de inteiros)
+        if ano:
+            ano_ini, ano_fim = _as_range(ano)
+            if 'ano' in df.columns:
+                _and(df['ano'].between(ano_ini, ano_fim))
+            else:
+                _and((datas >= pd.Timestamp(ano_ini, 1, 1)) & (datas < pd.Timestamp(ano_fim + 1, 1, 1)))
+        if data_inicio is not None:
+            _and(datas >= pd.Timestamp(data_inicio))
+        if data_fim is not None:
+            _and(datas < pd.Timestamp(data_fim))
+        if mes:
+            mes_ini, mes_fim = _as_range(mes)
+            if (mes_ini, mes_fim) != (1, 12):
+                _and((df['mes'] if 'mes' in df.columns else datas.dt.month).between(mes_ini, mes_fim))
+
+    for col, valores in (('cod_cliente', clientes), ('canal_distribuicao', canais), ('unidade_negocio', unidades)):
+        if valores and col in df.columns:
+            _and(df[col].isin(list(valores)))
+
+    return mask
+
+def _clean_select_sql(table_name, selected, clauses=()):
+    column_list = ', '.join(f'{_column_ref(table_name, col)} AS "{col}"' for col in selected)
+    query = f'SELECT {column_list} FROM "{table_name}"'
+    # LEFT JOIN mantém a tabela de fatos como laço externo (e a ordem das linhas); só entram as dimensões usadas
+    for dim_table in FACT_DIMENSIONS.get(table_name, {}):
+        if any(_dimension_of(table_name, col) == dim_table for col in selected):
+            key = DIMENSIONS[dim_table]['key']
+            query += f' LEFT JOIN {dim_table} ON {dim_table}.{key} = "{table_name}".{key}'
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    return query
+
+def _read_clean_sql(table_name, selected, clauses=(), params=()):
+    db = get_read_db()
+    cursor = db.execute(_clean_select_sql(table_name, selected, clauses), list(params))
+    df = pd.DataFrame(cursor.fetchall(), columns=selected)
+    for col in FACT_DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = _days_to_datetime(df[col])
+    return _with_categories(df)
+
+def read_clean_table(table_name):
+    """Lê a tabela limpa completa direto do SQLite (já com as colunas das dimensões), com as datas convertidas."""
+    return _read_clean_sql(table_name, get_clean_columns(table_name))
+
+def _get_cached_clean_table(table_name):
+    """Retorna a tabela limpa completa do cache, carregando-a se couber no limite; None caso contrário."""
+    if _df_cache.max_bytes <= 0:
+        return None
+    # A versão é lida antes dos dados: uma escrita concorrente no máximo invalida a entrada recém-criada
+    version = get_data_version()
+    key = (table_name, version)
+    df = _df_cache.get(key)
+    if df is not None:
+        return df
+    if _oversized_tables.get(table_name) == version:
+        return None
+
+    df = snapshot.read_snapshot(table_name, get_data_token(version), categories=True)
+    if df is None:
+        df = read_clean_table(table_name)
+    else:
+        df = _with_categories(df)
+    if _df_cache.put(key, df):
+        _df_cache.discard_older_versions(version)
+        return df
+    _oversized_tables[table_name] = version
+    return None
+
+def query_clean_df(table_name, columns=None, **filtros):
+    """
+    Lê uma tabela limpa trazendo apenas as colunas e linhas necessárias.
+
+    Se a tabela completa está (ou cabe) no cache da versão atual dos dados, os filtros são aplicados
+    em pandas sobre ela; senão usa o snapshot Parquet atualizado ou, na falta dele, envia os filtros ao SQLite.
+
+    Args:
+        table_name: 'vendas' ou 'cotacoes'
+        columns: lista de colunas desejadas (None = todas)
+        **filtros: data_inicio (>=), data_fim (<), ano e mes (valor único ou [início, fim]),
+            clientes, canais e unidades (listas de valores aceitos)
+
+    Returns:
+        DataFrame novo (pode ser alterado por quem chamou) com as colunas de data em datetime e as de texto
+        repetitivo (cliente, material, ...) como categorias compartilhadas entre as tabelas (get_category_dtypes)
+    """
+    full_df = _get_cached_clean_table(table_name)
+    available_columns = list(full_df.columns) if full_df is not None else get_clean_columns(table_name)
+    if columns is None:
+        selected = available_columns
+    else:
+        selected = [col for col in columns if col in available_columns]
+    if not selected:
+        return pd.DataFrame()
+
+    if full_df is not None:
+        mask = _clean_filter_mask(full_df, table_name, **filtros)
+        if mask is None:
+            return full_df[selected].copy()
+        return full_df.loc[mask, selected].reset_index(drop=True)
+
+    # Sem cache: um snapshot Parquet atualizado ainda evita a leitura linha a linha do SQLite
+    date_col = CLEAN_DATE_COLUMNS.get(table_name)
+    filter_columns = [date_col, 'ano', 'mes', 'cod_cliente', 'canal_distribuicao', 'unidade_negocio']
+    snapshot_columns = selected + [col for col in filter_columns if col in available_columns and col not in selected]
+    snap_df = snapshot.read_snapshot(table_name, get_data_token(), columns=snapshot_columns, categories=True)
+    if snap_df is not None:
+        snap_df = _with_categories(snap_df)
+        mask = _clean_filter_mask(snap_df, table_name, **filtros)
+        if mask is not None:
+            snap_df = snap_df.loc[mask].reset_index(drop=True)
+        return snap_df[selected]
+
+    clauses, params = _build_clean_filters(table_name, available_columns, **filtros)
+    return _read_clean_sql(table_name, selected, clauses, params)
+
+def get_clean_vendas_as_df(columns=None, **filtros):
+    return query_clean_df('vendas', columns, **filtros)
+
+def get_clean_cotacoes_as_df(columns=None, **filtros):
+    return query_clean_df('cotacoes', columns, **filtros)
+
+# Agregados mensais das tabelas de fatos: uma linha por mês x cliente x material (x canal), com as medidas somadas.
+# O mês fica na mesma coluna de data da tabela de origem (primeiro dia do mês) e em ano/mes/yyyymm, então os filtros
+# são os mesmos;
+# a unidade de negócio vem do material (dim_material), como na tabela de origem.
+MONTHLY_TABLES = {
+    'vendas': {
+        'table': 'vendas_mensal',
+        'keys': ['cliente_id', 'material_id', 'canal_distribuicao'],
+        'measures': ['quantidade_entrada', 'quantidade_carteira', 'quantidade_faturada',
+                     'valor_entrada', 'valor_carteira', 'valor_faturado'],
+    },
+    'cotacoes': {
+        'table': 'cotacoes_mensal',
+        'keys': ['cliente_id', 'material_id'],
+        'measures': ['quantidade'],
+    },
+}
+
+def _monthly_select(table_name, where=''):
+    """SELECT que agrega a tabela de fatos no layout do agregado mensal."""
+    monthly = MONTHLY_TABLES[table_name]
+    date_col = CLEAN_DATE_COLUMNS[table_name]
+    keys = ', '.join(monthly['keys'])
+    # Dia do primeiro dia do mês: data - (dia do mês - 1)
+    month = f"MIN({date_col}) - CAST(strftime('%d', MIN({date_col}) * 86400, 'unixepoch') AS INTEGER) + 1"
+    return (
+        f'SELECT {keys}, {month} AS {date_col}, ano, mes, yyyymm, '
+        f'{", ".join(f"SUM({col}) AS {col}" for col in monthly["measures"])} '
+        f'FROM {table_name} {where} GROUP BY {keys}, ano, mes, yyyymm'
+    )
+
+def _monthly_columns(table_name):
+    monthly = MONTHLY_TABLES[table_name]
+    return monthly['keys'] + [CLEAN_DATE_COLUMNS[table_name], 'ano', 'mes', 'yyyymm'] + monthly['measures']
+
+def _rebuild_monthly(db, table_name):
+    """Refaz o agregado mensal da tabela de fatos dentro da transação corrente (o commit fica com quem chamou)."""
+    monthly = MONTHLY_TABLES.get(table_name)
+    if monthly is None:
+        return
+    db.execute(f'DELETE FROM {monthly["table"]}')
+    db.execute(f'INSERT INTO {monthly["table"]} ({", ".join(_monthly_columns(table_name))}) {_monthly_select(table_name)}')
+    rows = db.execute(f'SELECT COUNT(*) FROM {monthly["table"]}').fetchone()[0]
+    print(f"{monthly['table']}: {rows} linhas agregadas por mês")
+
+def _month_ranges(meses):
+    """Agrupa meses yyyymm consecutivos em intervalos [dia inicial, dia final) das colunas de data."""
+    ranges = []
+    for yyyymm in sorted(meses):
+        inicio = pd.Timestamp(yyyymm // 100, yyyymm % 100, 1)
+        fim = inicio + pd.offsets.MonthBegin()
+        if ranges and ranges[-1][1] == _day_number(inicio):
+            ranges[-1][1] = _day_number(fim)
+        else:
+            ranges.append([_day_number(inicio), _day_number(fim)])
+    return ranges
+
+def _refresh_monthly(db, table_name, first_id):
+    """
+    Refaz no agregado mensal só os meses que receberam linhas novas (id >= first_id), na transação corrente.
+
+    Os meses viram intervalos de dias na coluna de data, que os índices (data, ...) das duas tabelas atendem;
+    numa carga mensal rotineira só um ou dois meses são reagregados.
+    """
+    monthly = MONTHLY_TABLES.get(table_name)
+    if monthly is None:
+        return
+    date_col = CLEAN_DATE_COLUMNS[table_name]
+    meses = [row[0] for row in db.execute(f'SELECT DISTINCT yyyymm FROM {table_name} WHERE id >= ?', (first_id,))]
+    conditions, params = [], []
+    for inicio, fim in _month_ranges([mes for mes in meses if mes is not None]):
+        conditions.append(f'({date_col} >= ? AND {date_col} < ?)')
+        params += [inicio, fim]
+    if None in meses:
+        conditions.append(f'{date_col} IS NULL')
+    if not conditions:
+        return
+    where = 'WHERE ' + ' OR '.join(conditions)
+    db.execute(f'DELETE FROM {monthly["table"]} {where}', params)
+    db.execute(
+        f'INSERT INTO {monthly["table"]} ({", ".join(_monthly_columns(table_name))}) {_monthly_select(table_name, where)}',
+        params
+    )
+    print(f"{monthly['table']}: {len(meses)} mês(es) reagregado(s)")
+
+def _is_month_start(valor):
+    ts = pd.Timestamp(valor)
+    return ts == ts.normalize() and ts.day == 1
+
+def _aggregate_monthly(df, table_name, selected):
+    """
+    Soma as medidas por combinação das demais colunas selecionadas, com as datas truncadas no mês.
+
+    Chaves nulas formam grupos próprios e somas só de nulos continuam nulas, como no SUM do SQLite.
+    """
+    measures = [col for col in selected if col in MONTHLY_TABLES[table_name]['measures']]
+    keys = [col for col in selected if col not in measures]
+    df = df[selected]
+    if df.empty:
+        return df.reset_index(drop=True)
+    date_col = CLEAN_DATE_COLUMNS[table_name]
+    if date_col in keys:
+        datas = df[date_col]
+        df = df.assign(**{date_col: datas.to_numpy().astype('datetime64[M]').astype(datas.dtype)})
+    if not keys:
+        return df.sum(min_count=1).to_frame().T
+    if not measures:
+        return df.drop_duplicates().sort_values(keys).reset_index(drop=True)
+    return df.groupby(keys, dropna=False, observed=True)[measures].sum(min_count=1).reset_index()
+
+def query_monthly_df(table_name, columns=None, **filtros):
+    """
+    Dados de uma tabela limpa agregados no mês, para consultas que só somam medidas.
+
+    Com filtros no máximo mensais (ano, mes, clientes, canais, unidades e datas no primeiro dia do mês)
+    a leitura vem do agregado mensal; com filtros mais finos, ou se o agregado ainda não existe no banco,
+    a tabela linha a linha é lida e agregada em pandas, com o mesmo resultado.
+
+    Args:
+        table_name: 'vendas' ou 'cotacoes'
+        columns: colunas desejadas; as medidas são somadas por combinação das demais (a coluna de data vira o mês)
+        **filtros: os mesmos de query_clean_df
+
+    Returns:
+        DataFrame com uma linha por combinação das colunas não numéricas
+    """
+    monthly = MONTHLY_TABLES[table_name]['table']
+    available_columns = get_clean_columns(table_name)
+    selected = [col for col in (columns or available_columns) if col in available_columns and col != 'id']
+    if not selected:
+        return pd.DataFrame()
+
+    month_filters = all(
+        filtros.get(nome) is None or _is_month_start(filtros[nome]) for nome in ('data_inicio', 'data_fim')
+    )
+    if month_filters and get_table_columns(monthly) and set(selected) <= set(get_clean_columns(monthly)):
+        df = query_clean_df(monthly, selected, **filtros)
+    else:
+        df = query_clean_df(table_name, selected, **filtros)
+    return _aggregate_monthly(df, table_name, selected)
+
+def get_monthly_vendas_as_df(columns=None, **filtros):
+    return query_monthly_df('vendas', columns, **filtros)
+
+def get_monthly_cotacoes_as_df(columns=None, **filtros):
+    return query_monthly_df('cotacoes', columns, **filtros)
+
+# Tabelas geradas pelo ETL a partir das tabelas brutas; podem ser recriadas sem perda de dados
+# (sem etl_processed o próximo ETL incremental faz a recarga completa)
+DERIVED_TABLES = [
+    'dim_cliente', 'dim_material', 'vendas', 'cotacoes', 'vendas_mensal', 'cotacoes_mensal', 'etl_processed',
+]
+
+# Histórico do ETL: não sai dos dados brutos, então nunca é recriado; bancos antigos recebem a tabela ou as
+# colunas que faltam
+HISTORY_TABLES = ['etl_jobs', 'etl_runs']
+
+def _schema_statements():
+    """Comandos do schema.sql, sem as linhas de comentário (que podem conter ';')."""
+    with current_app.open_resource('schema.sql') as f:
+        lines = [line for line in f.read().decode('utf8').splitlines() if not line.lstrip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+def _create_statements():
+    """CREATE TABLE do schema.sql por nome de tabela."""
+    creates = {}
+    for statement in _schema_statements():
+        words = statement.split()
+        if len(words) > 2 and words[0].upper() == 'CREATE' and words[1].upper() == 'TABLE':
+            creates[words[2].strip('"')] = statement
+    return creates
+
+def _add_missing_columns(tables, create_missing=False):
+    """
+    Acrescenta com ALTER TABLE ADD COLUMN as colunas do schema.sql que faltam nas tabelas (e os índices delas).
+
+    As linhas existentes ficam com a coluna nula. create_missing cria a tabela que ainda não existe; sem ele,
+    ela é ignorada.
+    """
+    creates = _create_statements()
+    reference = sqlite3.connect(':memory:')
+    existentes = []
+    try:
+        with write_transaction() as db:
+            for table_name in tables:
+                reference.execute(creates[table_name])
+                actual = {row[1] for row in db.execute(f'PRAGMA table_info("{table_name}")')}
+                if not actual:
+                    if create_missing:
+                        db.execute(creates[table_name])
+                        existentes.append(table_name)
+                    continue
+                existentes.append(table_name)
+                for _, column, col_type, *_ in reference.execute(f'PRAGMA table_info("{table_name}")'):
+                    if column not in actual:
+                        print(f"Acrescentando a coluna {column} em {table_name}.")
+                        db.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{column}" {col_type}')
+            # O INSERT das tabelas brutas depende do índice único de row_hash
+            for statement in _index_statements(existentes):
+                db.execute(statement)
+    finally:
+        reference.close()
+
+def ensure_raw_columns(tables=None):
+    """
+    Acrescenta às tabelas brutas as colunas do schema.sql que faltam (bancos criados por versões anteriores).
+
+    As tabelas brutas não podem ser recriadas como as derivadas: as linhas já carregadas ficam com a coluna nula.
+    """
+    _add_missing_columns(tables or [name for name in _create_statements() if name.startswith('raw_')])
+
+def ensure_derived_schema():
+    """
+    Recria as tabelas derivadas cujo layout difere do schema.sql (bancos criados por versões anteriores).
+
+    Os dados delas voltam na próxima execução do ETL.
+    """
+    ensure_raw_columns()
+    _add_missing_columns(HISTORY_TABLES, create_missing=True)
+    creates = _create_statements()
+
+    # Colunas esperadas: as do CREATE TABLE aplicado em um banco vazio em memória
+    reference = sqlite3.connect(':memory:')
+    recreated = set()
+    try:
+        with write_transaction() as db:
+            for table_name in DERIVED_TABLES:
+                reference.execute(creates[table_name])
+                expected = [row[1] for row in reference.execute(f'PRAGMA table_info("{table_name}")')]
+                actual = [row[1] for row in db.execute(f'PRAGMA table_info("{table_name}")')]
+                if actual != expected:
+                    print(f"Recriando a tabela {table_name} com o layout atual.")
+                    db.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+                    db.execute(creates[table_name])
+                    recreated.add(table_name)
+            # Agregado mensal novo sobre uma tabela de fatos que continua válida: refeito a partir dela
+            for table_name, monthly in MONTHLY_TABLES.items():
+                if monthly['table'] in recreated and table_name not in recreated:
+                    _rebuild_monthly(db, table_name)
+            # Tabela de fatos recriada (vazia): os arquivos brutos precisam ser transformados de novo
+            for table_name in RAW_SOURCES:
+                if table_name in recreated:
+                    _record_etl_state(db, table_name, None, None, replace=True)
+            if recreated:
+                bump_data_version(db)
+    finally:
+        reference.close()
+    ensure_indexes()
+
+def _index_statements(tables=None):
+    """CREATE INDEX (e CREATE UNIQUE INDEX) do schema.sql, opcionalmente só os das tabelas indicadas."""
+    statements = []
+    for statement in _schema_statements():
+        words = statement.split()
+        if words[0].upper() != 'CREATE' or 'INDEX' not in (words[1].upper(), words[2].upper()):
+            continue
+        table_name = words[words.index('ON') + 1].strip('"')
+        if tables is None or table_name in tables:
+            statements.append(statement)
+    return statements
+
+def ensure_indexes():
+    """Cria (se faltarem) os índices definidos em schema.sql; bancos antigos não passam de novo pelo init-db."""
+    with write_transaction() as db:
+        for statement in _index_statements():
+            db.execute(statement)
+
+def analyze_database(full=True):
+    """
+    Garante os índices e atualiza as estatísticas do planejador após a carga das tabelas.
+
+    full=False (carga incremental) usa PRAGMA optimize, que só reanalisa as tabelas que mudaram bastante.
+    """
+    ensure_indexes()
+    with write_transaction() as db:
+        db.execute("ANALYZE" if full else "PRAGMA optimize")
+
+# Consultas representativas dos callbacks (tabela, colunas, filtros), usadas no relatório de EXPLAIN QUERY PLAN.
+# Nos filtros de lista (clientes, canais, unidades) o número indica quantos valores reais do banco usar.
+DASHBOARD_QUERIES = [
+    ('Visão geral', 'vendas_mensal', ['valor_entrada', 'valor_carteira', 'valor_faturado', 'data_faturamento'], {}),
+    ('KPI Cliente - opções de filtro', 'vendas', ['cod_cliente', 'cliente', 'material', 'canal_distribuicao', 'data_faturamento'],
+     {'ano': [2023, 2024], 'mes': [1, 6]}),
+    ('KPI Cliente - clientes e canais', 'vendas', ['cod_cliente', 'material', 'produto', 'quantidade_faturada', 'data_faturamento'],
+     {'ano': [2023, 2024], 'clientes': 2, 'canais': 1}),
+    ('KPI Cliente - cotações', 'cotacoes', ['cod_cliente', 'material', 'quantidade', 'data'], {'clientes': 2}),
+    ('Propostas - clientes', 'vendas', ['cod_cliente', 'cliente'], {'ano': [2023, 2024]}),
+    ('Produtos - vendas por unidade', 'vendas_mensal', ['cod_cliente', 'material', 'quantidade_faturada'],
+     {'ano': 2024, 'unidades': 1}),
+    ('Produtos - cotações do ano', 'cotacoes_mensal', ['cod_cliente', 'cliente', 'material', 'quantidade'], {'ano': 2024}),
+    ('Propostas - vendas por material', 'vendas_mensal', ['material', 'produto', 'quantidade_faturada'],
+     {'ano': [2023, 2024], 'clientes': 2}),
+    ('Funil - vendas do período', 'vendas', ['cod_cliente', 'quantidade_faturada', 'data_faturamento'],
+     {'data_inicio': '2024-01-01'}),
+    ('Funil - cotações do período', 'cotacoes', ['cod_cliente', 'cliente', 'quantidade', 'data'], {'data_inicio': '2024-01-01'}),
+]
+
+_LIST_FILTER_COLUMNS = {'clientes': 'cod_cliente', 'canais': 'canal_distribuicao', 'unidades': 'unidade_negocio'}
+
+def _sample_values(table_name, column, n):
+    """Primeiros n valores distintos da coluna lógica (para o plano refletir um filtro que encontra linhas)."""
+    db = get_read_db()
+    source = _dimension_of(table_name, column) or table_name
+    rows = db.execute(
+        f'SELECT DISTINCT "{column}" FROM "{source}" WHERE "{column}" IS NOT NULL LIMIT ?', (n,)
+    ).fetchall()
+    return [row[0] for row in rows] or [f'exemplo_{i}' for i in range(n)]
+
+def explain_dashboard_queries():
+    """
+    Roda EXPLAIN QUERY PLAN nas consultas dos callbacks e nas buscas de fingerprint do upload.
+
+    Returns:
+        list: dicts com nome, sql, plano (linhas do EXPLAIN) e full_scan (True se alguma tabela é varrida sem índice)
+    """
+    db = get_read_db()
+    queries = []
+    for name, table_name, columns, filtros in DASHBOARD_QUERIES:
+        available_columns = get_clean_columns(table_name)
+        selected = [col for col in columns if col in available_columns]
+        filtros = {
+            nome: _sample_values(table_name, _LIST_FILTER_COLUMNS[nome], valor) if nome in _LIST_FILTER_COLUMNS else valor
+            for nome, valor in filtros.items()
+        }
+        clauses, params = _build_clean_filters(table_name, available_columns, **filtros)
+        queries.append((name, _clean_select_sql(table_name, selected, clauses), params))
+    for table_name in ('raw_vendas', 'raw_materiais_cotados', 'raw_propostas_anuais'):
+        queries.append((f'Upload - fingerprint em {table_name}', f"SELECT id FROM {table_name} WHERE fingerprint = ?", ['x']))
+
+    report = []
+    for name, sql, params in queries:
+        plan = [row[3] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+        # Consultas sem WHERE (visão geral) leem a tabela inteira de propósito; nas demais, SCAN sem índice é regressão
+        full_scan = ' WHERE ' in sql and any(step.startswith('SCAN') and 'INDEX' not in step for step in plan)
+        report.append({'nome': name, 'sql': sql, 'plano': plan, 'full_scan': full_scan})
+    return report
+
+@click.command('explain-queries')
+def explain_queries_command():
+    """Mostra o EXPLAIN QUERY PLAN das consultas do dashboard."""
+    for item in explain_dashboard_queries():
+        if item['full_scan']:
+            status = 'SCAN COMPLETO'
+        elif ' WHERE ' not in item['sql']:
+            status = 'tabela inteira'
+        else:
+            status = 'índice'
+        click.echo(f"[{status}] {item['nome']}")
+        click.echo(f"    {item['sql']}")
+        for step in item['plano']:
+            click.echo(f"      -> {step}")
+
+@click.command('etl-runs')
+@click.option('--limit', '-n', default=10, show_default=True, help='Quantas execuções mostrar.')
+@click.option('--table', 'table_name', default=None, help='Só uma tabela limpa (vendas ou cotacoes).')
+def etl_runs_command(limit, table_name):
+    """Mostra o histórico do ETL: tempo por etapa, linhas e memória de cada tabela processada."""
+    runs = get_etl_runs(limit, table_name)
+    if not runs:
+        click.echo('Nenhuma execução do ETL registrada.')
+    for run in runs:
+        click.echo(
+            f"{run['started_at']}  {run['table_name']:<8} {run['mode']:<11} {run['seconds']:>8.2f}s  "
+            f"{run['rows_in']} -> {run['rows_out']} linhas  pico {run['peak_rss_mb']} MB  bloco {run['max_chunk_mb']} MB"
+        )
+        click.echo('    etapas: ' + ', '.join(f"{etapa} {segundos:.2f}s" for etapa, segundos in run['stage_seconds'].items()))
+        if run['dropped_rows']:
+            click.echo('    descartes: ' + ', '.join(f"{regra}: {linhas}" for regra, linhas in run['dropped_rows'].items()))
+
+@click.command('hierarchy-rules')
+@click.option('--export', 'export_path', type=click.Path(dir_okay=False), help='Salva as regras em vigor neste arquivo JSON.')
+@click.option('--import', 'import_path', type=click.Path(exists=True, dir_okay=False), help='Grava as regras deste arquivo JSON.')
+@click.option('--reset', is_flag=True, help='Apaga as regras gravadas e volta às regras padrão.')
+def hierarchy_rules_command(export_path, import_path, reset):
+    """Exporta, importa ou restaura as regras de normalização das hierarquias de produto."""
+    from utils import hierarchy
+    if reset:
+        hierarchy.save_rules(None)
+        click.echo('Regras de hierarquia restauradas para o padrão.')
+    elif import_path:
+        with open(import_path, encoding='utf8') as f:
+            try:
+                hierarchy.save_rules(json.load(f))
+            except ValueError as e:
+                raise click.ClickException(f'Regras inválidas: {e}')
+        click.echo(f'Regras de hierarquia gravadas a partir de {import_path}.')
+    rules = hierarchy.get_rules()
+    if export_path:
+        with open(export_path, 'w', encoding='utf8') as f:
+            json.dump(rules, f, ensure_ascii=False, indent=2)
+        click.echo(f'Regras em vigor salvas em {export_path}.')
+    for column, regras in rules.items():
+        click.echo(f'{column}: {len(regras)} regras')
+
+@click.command('hash-raw-rows')
+def hash_raw_rows_command():
+    """Calcula o row_hash das linhas brutas antigas e apaga as linhas repetidas por reexportações."""
+    for table_name, contagem in hash_raw_rows().items():
+        click.echo(f"{table_name}: {contagem['hashed']} linhas com hash, {contagem['deleted']} repetidas apagadas.")
+
 @click.command('create-user')
 @click.argument('username')
 @click.argument('password')
 def create_user_command(username, password):
-    db = get_db()
-    try:
-        db.execute(
-            "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-            (username, hash_password(password)),
-        )
-        db.commit()
+    if add_user(username, password):
         click.echo(f'Usuário "{username}" criado com sucesso.')
-    except db.IntegrityError:
+    else:
         click.echo(f'Erro: Usuário "{username}" já existe.', err=True)
 
 def init_app(app):
+    _df_cache.max_bytes = app.config.get('DF_CACHE_MAX_BYTES', _df_cache.max_bytes)
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(explain_queries_command)
+    app.cli.add_command(etl_runs_command)
+    app.cli.add_command(hierarchy_rules_command)
+    app.cli.add_command(hash_raw_rows_command)
     app.cli.add_command(create_user_command)
\ No newline at end of file
@@ -1,88 +1,617 @@
 # utils/etl.py
 
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import pandas as pd
-from utils import db
+from flask import Flask, current_app
+from utils import db, snapshot
+from utils.prop_adjustments import CENTRO_UNIDADE, unidade_por_centro
 import numpy as np
 
-def transform_vendas():
-    print("Iniciando ETL de Vendas...")
-    df_raw = db.get_raw_data_as_df('raw_vendas')
-    if df_raw.empty:
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    # Windows: sem getrusage, o relatório do ETL mostra só a memória dos blocos
+    RESOURCE_AVAILABLE = False
+
+VENDAS_COLUMN_MAP = {
+    'ID_Cli': 'cod_cliente', 'Cliente': 'cliente', 'Material': 'material', 'Produto': 'produto',
+    'Unidade de Negócio': 'unidade_negocio', 'Data': 'data_entrada', 
+    'Data Faturamento': 'data_faturamento', 'Qtd. Entrada': 'quantidade_entrada', 
+    'Qtd. Carteira': 'quantidade_carteira', 'Qtd. ROL': 'quantidade_faturada', 
+    'Vlr. Entrada': 'valor_entrada', 'Vlr. Carteira': 'valor_carteira', 'Vlr. ROL': 'valor_faturado',
+    'Canal Distribuição': 'canal_distribuicao',
+    'Hier. Produto 1': 'hier_produto_1', 'Hier. Produto 2': 'hier_produto_2', 'Hier. Produto 3': 'hier_produto_3',
+    'Cód. Cliente': 'cod_cliente', 'Data Fat.': 'data_faturamento'  # Adicionar mapeamentos alternativos
+}
+
+# cliente, produto, unidade e hierarquias vão para as dimensões (dim_cliente/dim_material) ao salvar
+VENDAS_FINAL_COLS = [
+    'cod_cliente', 'cliente', 'material', 'produto', 'unidade_negocio', 
+    'canal_distribuicao', 'hier_produto_1', 'hier_produto_2', 'hier_produto_3',
+    'data_entrada', 'data_faturamento', 'quantidade_entrada', 'quantidade_carteira', 
+    'quantidade_faturada', 'valor_entrada', 'valor_carteira', 'valor_faturado'
+]
+
+COTACOES_COLUMN_MAP = {'Cod. Cliente': 'cod_cliente', 'Cliente': 'cliente', 'Material': 'material', 'Data de Criação': 'data', 'Quantidade': 'quantidade'}
+# unidade_negocio (do centro fornecedor) só completa dim_material para materiais que ainda não venderam
+COTACOES_FINAL_COLS = ['cod_cliente', 'cliente', 'material', 'unidade_negocio', 'data', 'quantidade']
+STATUS_DESCARTADOS = ['Perdido', 'Cancelado']
+
+# Configurações que os processos do ETL paralelo recebem (só leem o banco)
+WORKER_CONFIG_KEYS = [
+    'DATABASE', 'SQLITE_CACHE_SIZE_KB', 'SQLITE_MMAP_SIZE', 'SQLITE_BUSY_TIMEOUT_MS', 'SQLITE_READ_POOL_SIZE',
+]
+
+# Segundos de espera pelo fim de um processo do ETL paralelo (depois da carga, ou de um terminate)
+WORKER_JOIN_TIMEOUT = 30
+
+# Incrementar quando uma mudança no código das transformações exigir reprocessar o histórico inteiro
+ETL_RULES_VERSION = 1
+
+def rules_fingerprint(table_name):
+    """
+    Identifica as regras de transformação de uma tabela limpa. O ETL incremental só acrescenta linhas
+    se todos os arquivos já processados usaram as mesmas regras; senão faz a recarga completa.
+    """
+    if table_name == 'vendas':
+        regras = {'map': VENDAS_COLUMN_MAP, 'cols': VENDAS_FINAL_COLS}
+    else:
+        regras = {
+            'map': COTACOES_COLUMN_MAP, 'cols': COTACOES_FINAL_COLS, 'descartados': STATUS_DESCARTADOS,
+            'propostas': 'ultima revisao',
+            # unidade_negocio das cotações vem da tabela de centros: mudá-la refaz a tabela inteira
+            'centros': {str(k): v for k, v in CENTRO_UNIDADE.items()},
+        }
+    regras['version'] = ETL_RULES_VERSION
+    return hashlib.sha1(json.dumps(regras, sort_keys=True).encode('utf8')).hexdigest()[:16]
+
+def _pending_fingerprints(raw_tables, rules):
+    """
+    Arquivos ainda não transformados de cada tabela bruta ({tabela: [fingerprints]}), ou None quando é preciso
+    refazer tudo: nada processado ainda, regras diferentes ou algum arquivo processado não existe mais.
+    """
+    state = db.get_etl_state(raw_tables)
+    pending = {}
+    for raw_table in raw_tables:
+        processed = state[raw_table]
+        atuais = set(db.get_raw_fingerprints(raw_table))
+        if not processed or any(r != rules for r in processed.values()) or not set(processed) <= atuais:
+            return None
+        pending[raw_table] = sorted(atuais - set(processed))
+    return pending
+
+def _new_metrics():
+    """Medidas de um pipeline do ETL (histórico em etl_runs): segundos por etapa, linhas e memória."""
+    return {'stages': {}, 'dropped': {}, 'rows_in': 0, 'raw_bytes': 0, 'clean_bytes': 0, 'peak_rss_mb': None}
+
+# Etapas medidas em cada pipeline, na ordem em que acontecem ('espera': gravação parada esperando o
+# processo de leitura, só no ETL paralelo)
+ETL_STAGES = ['leitura', 'tipos', 'datas', 'dedup', 'espera', 'gravacao']
+
+@contextmanager
+def _stage(metricas, nome):
+    """Soma em metricas['stages'][nome] o tempo do bloco (uma das ETL_STAGES)."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metricas is not None:
+            metricas['stages'][nome] = metricas['stages'].get(nome, 0) + time.perf_counter() - inicio
+
+def _count_dropped(metricas, regra, linhas):
+    if metricas is not None and linhas:
+        metricas['dropped'][regra] = metricas['dropped'].get(regra, 0) + int(linhas)
+
+# Regra de descarte de cada coluna obrigatória das tabelas limpas
+DROP_RULES = {
+    'cod_cliente': 'sem cliente', 'material': 'sem material', 'data': 'sem data', 'quantidade': 'quantidade inválida',
+}
+
+def _drop_missing(df, colunas, metricas=None):
+    """Como dropna(subset=colunas), contando em metricas as linhas descartadas por regra (na ordem das colunas)."""
+    for col in colunas:
+        vazias = df[col].isna()
+        if vazias.any():
+            _count_dropped(metricas, DROP_RULES.get(col, f'sem {col}'), vazias.sum())
+            df = df[~vazias]
+    return df
+
+# Colunas de texto repetitivas dos dados limpos: viram categorias ao fim da limpeza, o que reduz a memória dos
+# blocos em trânsito (e o que o ETL paralelo serializa entre processos) e o custo de gravar as dimensões
+ETL_CATEGORY_COLUMNS = snapshot.CATEGORICAL_COLUMNS + ['hier_produto_1', 'hier_produto_2', 'hier_produto_3']
+
+def _as_categories(df):
+    for col in ETL_CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def _clean_vendas(df_raw, metricas=None):
+    with _stage(metricas, 'tipos'):
+        df_raw.replace('#', pd.NA, inplace=True)
+
+        df_raw.rename(columns=VENDAS_COLUMN_MAP, inplace=True)
+
+        final_cols = VENDAS_FINAL_COLS
+        df_clean = pd.DataFrame(columns=final_cols)
+        for col in final_cols:
+            if col in df_raw.columns:
+                df_clean[col] = df_raw[col]
+
+        numeric_cols = [
+            'quantidade_entrada', 'quantidade_carteira', 'quantidade_faturada',
+            'valor_entrada', 'valor_carteira', 'valor_faturado'
+        ]
+        for col in numeric_cols:
+            if col in df_clean.columns:
+                df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
+
+        if 'cod_cliente' in df_clean.columns:
+            df_clean['cod_cliente'] = df_clean['cod_cliente'].astype(str)
+
+    with _stage(metricas, 'datas'):
+        date_cols = ['data_entrada', 'data_faturamento']
+        for col in date_cols:
+            if col in df_clean.columns:
+                df_clean[col] = pd.to_datetime(df_clean[col], errors='coerce', dayfirst=True)
+
+    with _stage(metricas, 'dedup'):
+        df_clean = _drop_missing(df_clean, ['cod_cliente'], metricas)
+    with _stage(metricas, 'tipos'):
+        df_clean = _as_categories(df_clean)
+    return df_clean
+
+def _load_clean(df_clean, table_name, pending, etl_state):
+    """Grava o resultado do ETL: acrescenta (incremental) ou substitui a tabela limpa."""
+    rules = rules_fingerprint(table_name)
+    if pending is not None:
+        return db.append_clean_df(df_clean, table_name, etl_state, rules)
+    return db.replace_clean_table(df_clean, table_name, etl_state, rules)
+
+def _utc_now():
+    # Mesmo formato do CURRENT_TIMESTAMP do SQLite
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _peak_rss_mb():
+    """Pico de memória residente do processo (MB), ou None onde o getrusage não existe."""
+    if not RESOURCE_AVAILABLE:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def _report(progress, stage, rows):
+    if progress is not None:
+        progress(stage, rows)
+
+def _clean_vendas_chunks(raw_chunks, metricas, progress=None):
+    """Limpa os blocos brutos um a um, anotando em metricas os tempos, as linhas e o maior bloco (bruto e limpo)."""
+    raw_chunks = iter(raw_chunks)
+    while True:
+        with _stage(metricas, 'leitura'):
+            df_raw = next(raw_chunks, None)
+        if df_raw is None:
+            return
+        metricas['rows_in'] += len(df_raw)
+        _report(progress, 'Vendas', metricas['rows_in'])
+        metricas['raw_bytes'] = max(metricas['raw_bytes'], int(df_raw.memory_usage(deep=True).sum()))
+        df_clean = _clean_vendas(df_raw, metricas)
+        del df_raw
+        metricas['clean_bytes'] = max(metricas['clean_bytes'], int(df_clean.memory_usage(deep=True).sum()))
+        yield df_clean
+
+def _plan_vendas(incremental):
+    """
+    O que o ETL de vendas precisa transformar, ou None se não há nada: replace (recarga completa),
+    fingerprints (estado do ETL) e filter (arquivos a ler; None = tabela bruta inteira).
+    """
+    pending = _pending_fingerprints(['raw_vendas'], rules_fingerprint('vendas')) if incremental else None
+    if pending is not None:
+        if not pending['raw_vendas']:
+            print("Nenhum arquivo novo de vendas desde o último ETL.")
+            return None
+        print(f"ETL incremental de Vendas: {len(pending['raw_vendas'])} arquivo(s) novo(s).")
+        return {'replace': False, 'fingerprints': pending['raw_vendas'], 'filter': pending['raw_vendas']}
+    fingerprints = db.get_raw_fingerprints('raw_vendas')
+    if not fingerprints:
         print("Nenhum dado bruto de vendas para processar.")
+        return None
+    return {'replace': True, 'fingerprints': fingerprints, 'filter': None}
+
+def _vendas_chunks(plan, chunk_size, metricas, progress=None):
+    # Só as colunas que a limpeza usa; os fingerprints do estado do ETL já estão no plano
+    raw_chunks = db.iter_raw_data(
+        'raw_vendas', columns=list(VENDAS_COLUMN_MAP), fingerprints=plan['filter'], chunksize=chunk_size
+    )
+    yield from _clean_vendas_chunks(raw_chunks, metricas, progress)
+
+def _print_memoria(metricas):
+    metricas['peak_rss_mb'] = _peak_rss_mb()
+    print(f"Memória do ETL de Vendas: maior bloco bruto {metricas['raw_bytes'] / 2**20:.1f} MB, "
+          f"limpo {metricas['clean_bytes'] / 2**20:.1f} MB"
+          + (f"; pico do processo {metricas['peak_rss_mb']} MB." if metricas['peak_rss_mb'] is not None else "."))
+
+def transform_vendas(incremental=False, chunk_size=None, progress=None):
+    """
+    Transforma raw_vendas em vendas, lendo e gravando em blocos de chunk_size linhas.
+
+    incremental=True transforma e acrescenta só os arquivos ainda não processados, voltando à
+    recarga completa quando as regras mudaram ou o histórico bruto não bate com o já processado.
+
+    chunk_size: linhas brutas por bloco (padrão: ETL_CHUNK_SIZE da configuração; 0 lê tudo de uma vez).
+    A memória de pico fica limitada a um bloco bruto e sua versão limpa, e não ao histórico inteiro.
+
+    progress: função (etapa, linhas) chamada a cada bloco com as linhas brutas lidas até ali.
+    """
+    print("Iniciando ETL de Vendas...")
+    return _load_vendas(_plan_vendas(incremental), _new_metrics(), chunk_size, progress)
+
+def _finish_metrics(metricas, load_stats, inicio, medido_antes=0.0):
+    """
+    Fecha as medidas do pipeline. A gravação é o tempo da carga menos o das etapas medidas durante ela
+    (a leitura e a limpeza dos blocos consumidos pela carga); medido_antes é a soma das etapas antes da carga.
+    """
+    durante = sum(metricas['stages'].values()) - medido_antes
+    metricas['rows_out'] = load_stats['rows']
+    metricas['stages']['gravacao'] = max(0.0, load_stats['seconds'] - durante)
+    metricas['seconds'] = time.perf_counter() - inicio
+    metricas['finished_at'] = _utc_now()
+
+def _load_vendas(plan, metricas, chunk_size=None, progress=None):
+    if plan is None:
         return 0
-    
-    df_raw.replace('#', pd.NA, inplace=True)
-    
-    df_raw.rename(columns={
-        'ID_Cli': 'cod_cliente', 'Cliente': 'cliente', 'Material': 'material', 'Produto': 'produto',
-        'Unidade de Negócio': 'unidade_negocio', 'Data': 'data_entrada', 
-        'Data Faturamento': 'data_faturamento', 'Qtd. Entrada': 'quantidade_entrada', 
-        'Qtd. Carteira': 'quantidade_carteira', 'Qtd. ROL': 'quantidade_faturada', 
-        'Vlr. Entrada': 'valor_entrada', 'Vlr. Carteira': 'valor_carteira', 'Vlr. ROL': 'valor_faturado',
-        'Canal Distribuição': 'canal_distribuicao',
-        'Cód. Cliente': 'cod_cliente', 'Data Fat.': 'data_faturamento'  # Adicionar mapeamentos alternativos
-    }, inplace=True)
-
-    final_cols = [
-        'cod_cliente', 'cliente', 'material', 'produto', 'unidade_negocio', 
-        'canal_distribuicao',
-        'data_entrada', 'data_faturamento', 'quantidade_entrada', 'quantidade_carteira', 
-        'quantidade_faturada', 'valor_entrada', 'valor_carteira', 'valor_faturado'
-    ]
-    df_clean = pd.DataFrame(columns=final_cols)
-    for col in final_cols:
-        if col in df_raw.columns:
-            df_clean[col] = df_raw[col]
-
-    numeric_cols = [
-        'quantidade_entrada', 'quantidade_carteira', 'quantidade_faturada',
-        'valor_entrada', 'valor_carteira', 'valor_faturado'
-    ]
-    for col in numeric_cols:
-        if col in df_clean.columns:
-            df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
-
-    date_cols = ['data_entrada', 'data_faturamento']
-    for col in date_cols:
-        if col in df_clean.columns:
-            df_clean[col] = pd.to_datetime(df_clean[col], errors='coerce', dayfirst=True)
-    
-    if 'cod_cliente' in df_clean.columns:
-        df_clean['cod_cliente'] = df_clean['cod_cliente'].astype(str)
-    
-    df_clean.dropna(subset=['cod_cliente'], inplace=True)
-    
-    db.truncate_table('vendas')
-    rows_inserted = db.save_clean_df(df_clean, 'vendas')
-    print(f"ETL de Vendas concluído. {rows_inserted} registros inseridos.")
+    if chunk_size is None:
+        chunk_size = current_app.config.get('ETL_CHUNK_SIZE', 100_000)
+    inicio = time.perf_counter()
+    metricas['started_at'] = _utc_now()
+    load_stats = db.load_clean_chunks(
+        _vendas_chunks(plan, chunk_size, metricas, progress), 'vendas',
+        etl_state={'raw_vendas': plan['fingerprints']}, rules=rules_fingerprint('vendas'), replace=plan['replace']
+    )
+    _finish_metrics(metricas, load_stats, inicio)
+    rows_inserted = load_stats['rows']
+    print(f"ETL de Vendas concluído. {rows_inserted} registros inseridos em {load_stats['chunks']} bloco(s) "
+          f"({load_stats['rows_per_s']} linhas/s).")
+    _print_memoria(metricas)
     return rows_inserted
 
-def transform_cotacoes():
-    print("Iniciando ETL de Cotações...")
-    df_materiais = db.get_raw_data_as_df('raw_materiais_cotados')
-    df_propostas = db.get_raw_data_as_df('raw_propostas_anuais')
+def _plan_cotacoes(incremental):
+    """Como _plan_vendas; etl_state já traz os fingerprints das duas tabelas brutas."""
+    raw_tables = db.RAW_SOURCES['cotacoes']
+    pending = _pending_fingerprints(raw_tables, rules_fingerprint('cotacoes')) if incremental else None
+    if pending is not None and pending['raw_propostas_anuais']:
+        print("Propostas anuais novas: refazendo a tabela de cotações por completo.")
+        pending = None
+    if pending is not None:
+        if not pending['raw_materiais_cotados']:
+            print("Nenhum arquivo novo de materiais cotados desde o último ETL.")
+            return None
+        print(f"ETL incremental de Cotações: {len(pending['raw_materiais_cotados'])} arquivo(s) novo(s).")
+        return {
+            'replace': False, 'filter': pending['raw_materiais_cotados'],
+            'etl_state': {'raw_materiais_cotados': pending['raw_materiais_cotados'], 'raw_propostas_anuais': []},
+        }
+    return {
+        'replace': True, 'filter': None,
+        'etl_state': {raw_table: db.get_raw_fingerprints(raw_table) for raw_table in raw_tables},
+    }
+
+# Colunas brutas que o ETL de cotações lê
+MATERIAIS_COLUMNS = ['Cotação', 'Cod. Cliente', 'Cliente', 'Material', 'Quantidade', 'Centro Fornecedor']
+PROPOSTAS_COLUMNS = ['id', 'Número da Cotação', 'Número da Revisão', 'Data de Criação', 'Status da Cotação']
+
+def _quote_number(serie):
+    """Número da cotação normalizado: sem espaços e sem o '.0' de números lidos como float do Excel."""
+    return serie.astype('string').str.strip().str.replace(r'\.0+$', '', regex=True)
+
+def _latest_revisions(df_propostas, metricas=None):
+    """
+    Uma proposta por cotação: a maior revisão; no empate, a data de criação mais recente e depois a última
+    carregada. Propostas sem número não têm como ser ligadas aos materiais e ficam de fora.
+    """
+    df_propostas = df_propostas.rename(columns={'Número da Cotação': 'Cotação'})
+    df_propostas['Cotação'] = _quote_number(df_propostas['Cotação'])
+    df_propostas = df_propostas[df_propostas['Cotação'].notna()]
+    df_propostas['Data de Criação'] = pd.to_datetime(df_propostas['Data de Criação'], errors='coerce', dayfirst=True)
+    df_propostas['revisao'] = pd.to_numeric(df_propostas['Número da Revisão'], errors='coerce')
+    ultimas = df_propostas.sort_values(
+        ['revisao', 'Data de Criação', 'id'], na_position='first', kind='stable'
+    ).drop_duplicates('Cotação', keep='last')
+    _count_dropped(metricas, 'revisão anterior da proposta', len(df_propostas) - len(ultimas))
+    return ultimas
+
+def _join_propostas(df_materiais, df_propostas):
+    """
+    Data de criação da proposta em cada linha de material. O join é muitos-para-um sobre chaves categóricas
+    de um mesmo dicionário; uma cotação repetida nas propostas interrompe o ETL em vez de multiplicar linhas.
+    """
+    df_materiais['Cotação'] = _quote_number(df_materiais['Cotação'])
+    dtype = pd.CategoricalDtype(pd.concat([df_materiais['Cotação'], df_propostas['Cotação']]).dropna().unique())
+    df_materiais['Cotação'] = df_materiais['Cotação'].astype(dtype)
+    df_propostas = df_propostas[['Cotação', 'Data de Criação']].astype({'Cotação': dtype})
+    try:
+        df_merged = pd.merge(df_materiais, df_propostas, on='Cotação', how='left', validate='many_to_one')
+    except pd.errors.MergeError:
+        repetidas = df_propostas.loc[df_propostas['Cotação'].duplicated(), 'Cotação'].unique().tolist()
+        raise ValueError(f"Propostas repetidas para as cotações {repetidas[:10]}: o join multiplicaria as linhas de materiais")
+    sem_proposta = df_merged['Data de Criação'].isna().sum()
+    print(f"Cotações: {len(df_materiais)} linhas de materiais ligadas a {len(df_propostas)} propostas "
+          f"(última revisão); {sem_proposta} sem proposta válida.")
+    return df_merged
+
+def _prepare_cotacoes(plan, metricas=None):
+    """Lê e limpa os dados de cotações do plano; None se faltam materiais ou propostas."""
+    with _stage(metricas, 'leitura'):
+        df_materiais = db.get_raw_data_as_df(
+            'raw_materiais_cotados', columns=MATERIAIS_COLUMNS, fingerprints=plan['filter']
+        )
+        df_propostas = db.get_raw_data_as_df('raw_propostas_anuais', columns=PROPOSTAS_COLUMNS)
     if df_materiais.empty or df_propostas.empty:
         print("Dados brutos de materiais ou propostas insuficientes para processar.")
-        return 0
+        return None
+    if metricas is not None:
+        metricas['rows_in'] = len(df_materiais)
+        metricas['raw_bytes'] = int(df_materiais.memory_usage(deep=True).sum())
+
+    with _stage(metricas, 'dedup'):
+        # O status que vale é o da última revisão de cada cotação
+        df_propostas = _latest_revisions(df_propostas, metricas)
+        descartadas = df_propostas['Status da Cotação'].isin(STATUS_DESCARTADOS)
+        _count_dropped(metricas, 'proposta com status descartado', descartadas.sum())
+        df_propostas = df_propostas[~descartadas]
+    with _stage(metricas, 'tipos'):
+        df_merged = _join_propostas(df_materiais, df_propostas)
+        df_merged.rename(columns=COTACOES_COLUMN_MAP, inplace=True)
+        # Centro vazio (arquivos carregados antes da coluna existir) deixa a unidade nula em vez de 'OUTRO'
+        df_merged['unidade_negocio'] = unidade_por_centro(df_merged['Centro Fornecedor'])
+        df_merged.loc[df_merged['Centro Fornecedor'].isna(), 'unidade_negocio'] = None
+        final_cols = COTACOES_FINAL_COLS
+        df_clean = df_merged[[col for col in final_cols if col in df_merged.columns]].copy()
+        df_clean['quantidade'] = pd.to_numeric(df_clean['quantidade'], errors='coerce')
+    with _stage(metricas, 'datas'):
+        df_clean['data'] = pd.to_datetime(df_clean['data'], errors='coerce', dayfirst=True)
+    with _stage(metricas, 'dedup'):
+        df_clean = _drop_missing(df_clean, ['data', 'cod_cliente', 'material', 'quantidade'], metricas)
+    with _stage(metricas, 'tipos'):
+        df_clean = _as_categories(df_clean)
+    if metricas is not None:
+        metricas['clean_bytes'] = int(df_clean.memory_usage(deep=True).sum())
+    return df_clean
+
+def transform_cotacoes(incremental=False):
+    """
+    Transforma raw_materiais_cotados + raw_propostas_anuais em cotacoes.
+
+    No modo incremental só arquivos novos de materiais são acrescentados; um arquivo novo de propostas
+    pode mudar status e datas de cotações já processadas, então a tabela é refeita por completo.
+    """
+    print("Iniciando ETL de Cotações...")
+    return _load_cotacoes(_plan_cotacoes(incremental), _new_metrics())
 
-    df_propostas = df_propostas[~df_propostas['Status da Cotação'].isin(['Perdido', 'Cancelado'])]
-    df_propostas.rename(columns={'Número da Cotação': 'Cotação'}, inplace=True)
-    df_materiais['Cotação'] = df_materiais['Cotação'].astype(str)
-    df_propostas['Cotação'] = df_propostas['Cotação'].astype(str)
-    df_propostas_datas = df_propostas[['Cotação', 'Data de Criação']].drop_duplicates()
-    df_merged = pd.merge(df_materiais, df_propostas_datas, on='Cotação', how='left')
-    df_merged.rename(columns={'Cod. Cliente': 'cod_cliente', 'Cliente': 'cliente', 'Material': 'material', 'Data de Criação': 'data', 'Quantidade': 'quantidade'}, inplace=True)
-    final_cols = ['cod_cliente', 'cliente', 'material', 'data', 'quantidade']
-    df_clean = df_merged[[col for col in final_cols if col in df_merged.columns]].copy()
-    df_clean['data'] = pd.to_datetime(df_clean['data'], errors='coerce', dayfirst=True)
-    df_clean['quantidade'] = pd.to_numeric(df_clean['quantidade'], errors='coerce')
-    df_clean.dropna(subset=['data', 'cod_cliente', 'material', 'quantidade'], inplace=True)
-    db.truncate_table('cotacoes')
-    rows_inserted = db.save_clean_df(df_clean, 'cotacoes')
-    print(f"ETL de Cotações concluído. {rows_inserted} registros inseridos.")
+def _load_cotacoes(plan, metricas):
+    if plan is None:
+        return 0
+    inicio = time.perf_counter()
+    metricas['started_at'] = _utc_now()
+    df_clean = _prepare_cotacoes(plan, metricas)
+    if df_clean is None:
+        return 0
+    pending = None if plan['replace'] else plan['filter']
+    medido_antes = sum(metricas['stages'].values())
+    load_stats = _load_clean(df_clean, 'cotacoes', pending, plan['etl_state'])
+    _finish_metrics(metricas, load_stats, inicio, medido_antes)
+    metricas['peak_rss_mb'] = _peak_rss_mb()
+    rows_inserted = load_stats['rows']
+    print(f"ETL de Cotações concluído. {rows_inserted} registros inseridos ({load_stats['rows_per_s']} linhas/s).")
     return rows_inserted
 
+def _pipeline_worker(pipeline, plan, chunk_size, config, fila):
+    """
+    Processo de preparação do ETL paralelo: lê e limpa os dados brutos de um pipeline ('vendas' ou
+    'cotacoes') e entrega os DataFrames limpos na fila; a gravação fica com o processo principal.
+    """
+    try:
+        app = Flask(__name__)
+        app.config.update(config)
+        with app.app_context():
+            metricas = _new_metrics()
+            if pipeline == 'vendas':
+                for chunk in _vendas_chunks(plan, chunk_size, metricas):
+                    fila.put(('bloco', chunk))
+                _print_memoria(metricas)
+            else:
+                df_clean = _prepare_cotacoes(plan, metricas)
+                if df_clean is not None:
+                    fila.put(('bloco', df_clean))
+                metricas['peak_rss_mb'] = _peak_rss_mb()
+        # As medidas do processo vão junto com o fim, para o histórico do ETL
+        fila.put(('fim', metricas))
+    except Exception as e:
+        fila.put(('erro', f"{type(e).__name__}: {e}"))
+
+def _received_chunks(fila, processo, stage, metricas, progress=None):
+    """
+    Blocos limpos que um _pipeline_worker entrega, na ordem; erro no processo vira exceção aqui.
+
+    O tempo parado esperando o processo fica na etapa 'espera' e as medidas dele em metricas['worker'].
+    """
+    linhas = 0
+    while True:
+        try:
+            with _stage(metricas, 'espera'):
+                tipo, valor = fila.get(timeout=5)
+        except queue.Empty:
+            if not processo.is_alive():
+                raise RuntimeError(f"O processo do ETL de {stage} terminou sem entregar os dados.")
+            continue
+        if tipo == 'fim':
+            metricas['worker'] = valor
+            return
+        if tipo == 'erro':
+            raise RuntimeError(f"ETL de {stage}: {valor}")
+        linhas += len(valor)
+        _report(progress, stage, linhas)
+        yield valor
+
+def _run_parallel(plans, metrics, chunk_size, progress=None):
+    """
+    Recarga com os pipelines de vendas e cotações lendo e limpando ao mesmo tempo, em processos separados.
+
+    O processo principal é o único que grava: recebe os blocos limpos pelas filas e grava as duas tabelas
+    em uma transação (load_clean_tables). A fila de vendas tem poucos blocos, então a memória continua
+    limitada como no ETL em blocos.
+
+    metrics: {tabela: _new_metrics()} preenchido com as medidas de cada pipeline.
+    """
+    contexto = multiprocessing.get_context('spawn')
+    config = {key: value for key, value in current_app.config.items() if key in WORKER_CONFIG_KEYS}
+    processos, filas, loads = [], [], []
+    inicio = time.perf_counter()
+    concluido = False
+    try:
+        for pipeline, plan in plans.items():
+            if plan is None:
+                continue
+            fila = contexto.Queue(maxsize=2)
+            processo = contexto.Process(
+                target=_pipeline_worker, args=(pipeline, plan, chunk_size, config, fila),
+                name=f'etl-{pipeline}', daemon=True
+            )
+            processo.start()
+            processos.append(processo)
+            filas.append(fila)
+            etl_state = {'raw_vendas': plan['fingerprints']} if pipeline == 'vendas' else plan['etl_state']
+            metrics[pipeline]['started_at'] = _utc_now()
+            loads.append({
+                'table_name': pipeline, 'etl_state': etl_state, 'rules': rules_fingerprint(pipeline),
+                'replace': plan['replace'],
+                'chunks': _received_chunks(
+                    fila, processo, 'Vendas' if pipeline == 'vendas' else 'Cotações', metrics[pipeline], progress
+                ),
+            })
+        stats = db.load_clean_tables(loads)
+        concluido = True
+    finally:
+        # Com erro na carga ninguém mais lê as filas, e um processo parado em fila.put nunca sairia:
+        # ele é encerrado antes do join. Depois de uma carga completa, o processo já entregou o 'fim'.
+        for processo in processos:
+            if concluido:
+                processo.join(timeout=WORKER_JOIN_TIMEOUT)
+            if processo.is_alive():
+                processo.terminate()
+                processo.join(timeout=WORKER_JOIN_TIMEOUT)
+        for fila in filas:
+            fila.close()
+            fila.cancel_join_thread()
+    for table_name, load_stats in stats.items():
+        print(f"ETL de {table_name} concluído. {load_stats['rows']} registros inseridos "
+              f"({load_stats['rows_per_s']} linhas/s).")
+        metricas = metrics[table_name]
+        worker = metricas.pop('worker', None) or _new_metrics()
+        if not worker['rows_in']:
+            # Pipeline sem dados para processar (a tabela ficou como estava): fora do histórico
+            continue
+        _finish_metrics(metricas, load_stats, inicio)
+        # Etapas de leitura e limpeza medidas no processo do pipeline; memória: o maior dos dois picos
+        for etapa, segundos in worker['stages'].items():
+            metricas['stages'][etapa] = metricas['stages'].get(etapa, 0) + segundos
+        metricas['dropped'] = worker['dropped']
+        for chave in ('rows_in', 'raw_bytes', 'clean_bytes'):
+            metricas[chave] = worker[chave]
+        picos = [pico for pico in (_peak_rss_mb(), worker['peak_rss_mb']) if pico is not None]
+        metricas['peak_rss_mb'] = max(picos) if picos else None
+    return stats.get('vendas', {}).get('rows', 0), stats.get('cotacoes', {}).get('rows', 0)
+
+def _record_runs(run_id, plans, metrics):
+    """Grava em etl_runs as medidas das tabelas que foram processadas nesta execução."""
+    runs = []
+    for table_name, metricas in metrics.items():
+        if plans[table_name] is None or 'finished_at' not in metricas:
+            continue
+        runs.append({
+            'table_name': table_name, 'mode': 'completo' if plans[table_name]['replace'] else 'incremental',
+            'started_at': metricas['started_at'], 'finished_at': metricas['finished_at'],
+            'seconds': round(metricas['seconds'], 3), 'rows_in': metricas['rows_in'], 'rows_out': metricas['rows_out'],
+            'stage_seconds': {
+                etapa: round(metricas['stages'][etapa], 3) for etapa in ETL_STAGES if etapa in metricas['stages']
+            },
+            'dropped_rows': metricas['dropped'], 'peak_rss_mb': metricas['peak_rss_mb'],
+            'max_chunk_mb': round(max(metricas['raw_bytes'], metricas['clean_bytes']) / 2**20, 1),
+        })
+    if runs:
+        db.record_etl_runs(run_id, runs)
+
+def _parallel_enabled():
+    return current_app.config.get('ETL_PARALLEL', True) and (os.cpu_count() or 1) >= 2
+
+def publish_snapshots():
+    """Publica os snapshots Parquet das tabelas limpas, marcados com o estado atual dos dados."""
+    if not snapshot.PYARROW_AVAILABLE:
+        return
+    token = db.get_data_token()
+    for table_name in ('vendas', 'cotacoes'):
+        # ETL incremental sem arquivos novos: o snapshot publicado continua atual
+        if snapshot.snapshot_token(table_name) == token:
+            continue
+        try:
+            snapshot.write_snapshot(table_name, db.read_clean_table(table_name), token)
+        except Exception as e:
+            # O snapshot é só um atalho de leitura; sem ele os leitores voltam ao SQLite
+            print(f"Erro ao publicar snapshot de {table_name}: {e}")
+
+def run_etl(incremental=True, progress=None, run_id=None):
+    """
+    Executa o ETL de vendas e cotações.
+
+    Cada tabela limpa é gravada em uma transação (as duas juntas, na recarga em paralelo): até o commit,
+    os leitores continuam vendo os dados anteriores.
+
+    Com ETL_PARALLEL (e mais de um núcleo), uma recarga completa lê e limpa vendas e cotações em
+    processos separados (ver _run_parallel).
+
+    Args:
+        incremental: só transforma os arquivos brutos ainda não processados (com volta automática
+            à recarga completa quando necessário); False refaz as tabelas limpas a partir de todo o histórico
+        progress: função (etapa, linhas processadas) chamada ao longo da execução (ver utils/etl_jobs.py)
+        run_id: identificador da execução no histórico etl_runs (o id do job, quando roda em segundo plano)
+
+    Raises:
+        Exception: erro na leitura, limpeza ou gravação de uma tabela. A execução para ali: sem histórico em
+            etl_runs, sem ANALYZE e sem publicar snapshots (o job termina com status 'error')
+    """
+    db.ensure_derived_schema()
+    _report(progress, 'Vendas', 0)
+    print("Iniciando ETL de Vendas e Cotações...")
+    plans = {'vendas': _plan_vendas(incremental), 'cotacoes': _plan_cotacoes(incremental)}
+    metrics = {table_name: _new_metrics() for table_name in plans}
+    # Em paralelo só quando alguma tabela é refeita por completo: numa carga incremental pequena,
+    # iniciar os processos custaria mais que o ganho
+    if _parallel_enabled() and any(plan is not None and plan['replace'] for plan in plans.values()):
+        print("Lendo e limpando vendas e cotações em paralelo.")
+        vendas_count, cotacoes_count = _run_parallel(
+            plans, metrics, current_app.config.get('ETL_CHUNK_SIZE', 100_000), progress
+        )
+    else:
+        vendas_count = _load_vendas(plans['vendas'], metrics['vendas'], progress=progress)
+        _report(progress, 'Cotações', vendas_count)
+        cotacoes_count = _load_cotacoes(plans['cotacoes'], metrics['cotacoes'])
+    _record_runs(run_id or uuid.uuid4().hex, plans, metrics)
+    _report(progress, 'Estatísticas do banco', vendas_count + cotacoes_count)
+    db.analyze_database(full=not incremental)
+    _report(progress, 'Snapshots', vendas_count + cotacoes_count)
+    publish_snapshots()
+    modo = "incremental" if incremental else "completo"
+    return f"Processo {modo} concluído! Vendas: {vendas_count} registros. Cotações: {cotacoes_count} registros."
+
 def run_full_etl():
-    vendas_count = transform_vendas()
-    cotacoes_count = transform_cotacoes()
-    return f"Processo concluído! Vendas: {vendas_count} registros. Cotações: {cotacoes_count} registros."
\ No newline at end of file
+    return run_etl(incremental=False)
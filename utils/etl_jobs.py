@@ -0,0 +1,93 @@
+# utils/etl_jobs.py
+
+import sqlite3
+import threading
+import uuid
+from flask import current_app
+from utils import db, etl
+
+# Um ETL por vez neste processo; entre processos, a linha 'running' de etl_jobs faz o papel do lock
+_job_lock = threading.Lock()
+
+# Progresso do job que roda neste processo. O banco só recebe as trocas de etapa, e nunca durante a carga das
+# tabelas: a conexão de escrita está dentro da transação do ETL, e o progresso gravado ali só apareceria no
+# commit (ou sumiria no rollback). A etapa fica em _live e vai para o banco na primeira troca após o commit.
+_live = {}
+_live_lock = threading.Lock()
+
+def start_etl_job(incremental=True, user_id=None):
+    """
+    Dispara o ETL em uma thread de fundo e retorna o id do job, sem esperar o fim.
+
+    Returns:
+        str | None: id do job (acompanhar com get_job_status) ou None se já há um ETL em execução
+    """
+    if not _job_lock.acquire(blocking=False):
+        return None
+    try:
+        app = current_app._get_current_object()
+        db.ensure_derived_schema()
+        job_id = uuid.uuid4().hex
+        mode = 'incremental' if incremental else 'completo'
+        if not db.create_etl_job(job_id, mode, user_id, app.config.get('ETL_JOB_STALE_SECONDS', 6 * 3600)):
+            # Outro processo do servidor está rodando o ETL
+            _job_lock.release()
+            return None
+        with _live_lock:
+            _live.clear()
+            _live.update(id=job_id, stage='Iniciando', stage_gravada='Iniciando', rows=0)
+        threading.Thread(
+            target=_run_job, args=(app, job_id, incremental), name=f'etl-{job_id[:8]}', daemon=True
+        ).start()
+    except Exception:
+        _job_lock.release()
+        raise
+    return job_id
+
+def _run_job(app, job_id, incremental):
+    try:
+        with app.app_context():
+            try:
+                message = etl.run_etl(
+                    incremental, progress=lambda stage, rows: _progress(job_id, stage, rows), run_id=job_id
+                )
+                db.finish_etl_job(job_id, 'done', message, _live.get('rows'))
+            except Exception as e:
+                print(f"Erro no ETL em segundo plano: {e}")
+                db.finish_etl_job(job_id, 'error', str(e))
+    finally:
+        with _live_lock:
+            _live.clear()
+        _job_lock.release()
+
+def _progress(job_id, stage, rows):
+    with _live_lock:
+        _live.update(stage=stage, rows=rows)
+        gravar = stage != _live.get('stage_gravada') and not db.in_write_transaction()
+        if gravar:
+            _live['stage_gravada'] = stage
+    if gravar:
+        db.update_etl_job(job_id, stage, rows)
+
+def get_job_status(job_id=None):
+    """
+    Situação de um job de ETL (o mais recente se job_id for vazio), com o progresso ao vivo quando ele
+    roda neste processo.
+
+    Returns:
+        dict | None: id, mode, status ('running', 'done' ou 'error'), stage, rows_processed, message e
+            elapsed (segundos); None se o job não existe
+    """
+    with _live_lock:
+        live = dict(_live)
+    try:
+        job = db.get_etl_job(job_id)
+    except sqlite3.OperationalError:
+        # Banco de uma versão anterior, sem etl_jobs: a tabela é criada no primeiro ETL
+        job = None
+    if job is None:
+        return None
+    if job['status'] == 'running' and live.get('id') == job['id']:
+        job['stage'] = live.get('stage', job['stage'])
+        job['rows_processed'] = live.get('rows', job['rows_processed'])
+    return job
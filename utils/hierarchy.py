@@ -0,0 +1,358 @@
+# utils/hierarchy.py
+
+import numpy as np
+import pandas as pd
+from flask import has_app_context
+from utils import db
+
+# Chave em settings com as regras editadas (JSON no formato de DEFAULT_RULES); sem ela valem as regras abaixo
+RULES_SETTING = 'hierarchy_rules'
+
+# Regras de normalização das hierarquias de produto, aplicadas em ordem a cada valor da coluna.
+# Uma regra é (trecho, substituto) ou um dict com:
+#   find / replace: trecho procurado e substituto
+#   match: 'substring' (padrão, como str.replace) ou 'value' (o valor inteiro vira replace se contém find)
+#   when: {'column': outra coluna, 'contains': trecho}; a regra só vale nas linhas em que a outra coluna contém o trecho
+DEFAULT_RULES = {
+    'Hier. Produto 1': [
+        ('Soluções IoT', 'DIGITAL SOLUTIONS'),
+        ('SOLAR WAU', 'SOLAR'),
+        ('SOLAR E SMART METER', 'SOLAR'),
+        ('MOTORREDUTOR/REDUTOR', 'MOTORREDUTORES'),
+        ('PAINEIS ESPECIAIS BT', 'CHAVES ESPECIAIS'),
+        ('CHAVE DE PARTIDA ESPECIAL', 'CHAVES ESPECIAIS'),
+        ('MOTORES DE GRANDE PORTE', 'WEN-M'),
+        ('ENGENHEIRADOS WDS', 'ENGENHEIRADOS'),
+        ('DRIVES BT', 'DRIVES'),
+        ('SEGURANÇA E SENSORES', 'SAFETY'),
+        ('SISTEMAS AUTOMAÇÃO E ELETRIFICAÇÃO', 'SISTEMAS'),
+        ('ESTAÇÕES DE RECARGA VEÍCULOS ELÉTRICOS', 'WEMOB'),
+        ('REDUTORES INDUSTRIAIS', 'REDUTORES'),
+        ('NEGOCIOS DIGITAIS', 'DIGITAL SOLUTIONS'),
+        ('MOTORES INDUSTRIAIS', 'WMO-I'),
+        ('MOTORES COMERCIAIS', 'WMO-C'),
+        ('BARRAMENTO BLINDADO BWW', 'BWW'),
+        ('EQUIPAMENTOS DE ALTA TENSÃO', 'ALTA TENSÃO'),
+        ('TOMADAS E INTERRUPTORES', 'BUILDING'),
+        ('CONTROLS CIVIL', 'BULDING'),
+        ('SMART GRIDS & METERS', 'SMART GRID'),
+        ('MOTORES APPLIANCE', 'WMO-A'),
+    ],
+    'Hier. Produto 2': [
+        ('ACIONAMENTO INVERSOR DE FREQ. PADRÃO', 'INVERSOR'),
+        ('INVERSORES DE FREQUÊNCIA ENGENHEIRADOS', 'INVERSOR ENG'),
+        ('INVERSORES DE FREQÜÊNCIA ENGENHEIRADOS', 'INVERSOR ENG'),
+        ('INVERSORES DE FREQUÊNCIA SERIADOS', 'INVERSOR'),
+        ('INVERSOR DE FREQUÊNCIA', 'INVERSOR'),
+        ('INVERSOR SOLAR STRING', 'INVERSOR SOLAR'),
+        ('INVERSORES DE FREQUÊNCIA SERIADOS', 'INVERSOR'),
+        ('BARRAMENTO BLINDADO BWW BT', 'BWW'),
+        ('CAPACITORES CFP', 'CAP CFP'),
+        ('CAPACITORES MOTOR-RUN', 'CAP MOTOR'),
+        ('CAPACITORES PARA ELETRONICA DE POTENCIA', 'CAP EP'),
+        ('CHAVE DE PARTIDA ESPECIAL', 'CHAVES ESPECIAIS'),
+        ('CHAVE DE PARTIDA SERIADA', 'CHAVES SERIADAS'),
+        ('CHAVE FIM DE CURSO', 'FIM DE CURSO'),
+        ('CHAVES SECCIONADORAS', 'SECCIONADORA'),
+        ('COMANDO E SINALIZAÇÃO', 'COMANDO E SIN'),
+        ('DISPOSITIVO PROTETOR DE SURTO', 'SPW'),
+        ('DISJUNTOR-MOTOR', 'MPW'),
+        ('DISJUNTOR ABERTO', 'ABW'),
+        ('DISJUNTOR DE MÉDIA TENSÃO', 'VBW'),
+        ('DISJUNTORES EM CAIXA MOLDADA', 'DISJ. CAIXA MOLDADA'),
+        ('DISJUNTORES SERIADOS', 'DISJUNTOR SERIADO'),
+        ('ENGENHEIRADOS BT WDS', 'ENGENHEIRADOS BT'),
+        ('ESTAÇÕES DE RECARGA VEÍCULOS ELÉTRICOS', 'WEMOB'),
+        ('EDGE DEVICES', 'GATEWAYS'),
+        ('GERADOR FOTOVOLTAICO', 'GER. SOLAR'),
+        ('GERENCIAMENTO DE ENERGIA', 'WEM'),
+        ("INTERRUPTOR DIFERENCIAL RESIDUAL(DR'S)", 'DR'),
+        ('MEDIDORES DE ENERGIA INTELIGENTES', 'SMW'),
+        ('MODULO FOTOVOLTAICO', 'MÓDULOS'),
+        ('MOTORES COMERCIAIS', 'WCA1'),
+        ('MOTORES DE ALTA TENSÃO', 'WEN-M'),
+        ('MOTORES DE BAIXA TENSÃO', 'WEN-M'),
+        # Motores industriais da WEN são WEN-M; os das outras unidades, WMO-I
+        {'find': 'MOTORES INDUSTRIAIS', 'replace': 'WEN-M', 'when': {'column': 'Unidade', 'contains': 'WEN'}},
+        ('MOTORES INDUSTRIAIS', 'WMO-I'),
+        ('MOTORES INDUSTRIAIS', 'WMO-I'),
+        ('MOTORREDUTOR GEREMIA', 'MOTORREDUTORES'),
+        ('MOTORREDUTOR NLM', 'MOTORREDUTORES'),
+        ('MOTORREDUTOR/REDUTOR', 'MOTORREDUTORES'),
+        ('PAINEIS OEMs', 'CHAVES ESPECIAIS'),
+        ('PAINEIS VAZIOS - PMW', 'PMW'),
+        ('PAINEL TTW01 - CAIXAS', 'TTW'),
+        ('PAINEL TTW01 - COLUNAS', 'TTW'),
+        ('PARA GRUPOS GERADORES', 'ALTERNADORES'),
+        ('PEDAL DE SEGURANÇA', 'PEDAL'),
+        ('PLATAFORMA IOT WEGNOLOGY', 'WEGNOLOGY'),
+        ('QUADRO DE DISTRIBUIÇÃO', 'QDW'),
+        ('RELÉS DE SOBRECARGA TÉRMICOS', 'RELÉS TÉRMICOS'),
+        ('RETIFICADORES CUSTOMIZADOS', 'RETIFICADOR'),
+        ('RETIFICADORES SERIADOS', 'RETIFICADOR'),
+        ('SENSORES E SISTEMAS DE VISÃO', 'SISTEMAS DE VISÃO'),
+        ('SERVIÇO DE ASSISTÊNCIA TÉCNICA', 'ASTEC'),
+        ('SERVIÇOS DE ENGENHARIA', 'ENGENHARIA'),
+        ('SERVIÇOS DIVERSOS', 'DIVERSOS'),
+        ('SERVIÇO DE REFORMA', 'REFORMA'),
+        ('SERVIÇO DE TREINAMENTO', 'TREINAMENTO'),
+        ('SERVIÇOS ESPECIALIZADOS WDI', 'WDI'),
+        ('SISTEMAS BT WDS', 'SISTEMAS WDS'),
+        ('SISTEMAS DE IDENTIFICAÇÃO WEG', 'IDENTIFICAÇÃO BTW'),
+        ('SOFT-STARTERS SERIADAS', 'SOFT-STARTER'),
+        ('SOFT-STARTERS BT', 'SOFT-STARTER'),
+        ('SOFT-STARTERS ENGENHEIRADAS', 'SOFT-STARTER ENG'),
+        ('SWITCHES INDUSTRIAIS', 'SWITCHES'),
+        ('TRANSFORMADOR A ÓLEO PEDESTAL', 'PEDESTAL'),
+        ('TRANSFORMADORES A ÓLEO DISTRIBUIÇÃO', 'DISTRIBUIÇÃO'),
+        ('TRANSFORMADORES A ÓLEO FORÇA', 'FORÇA'),
+        ('TRANSFORMADORES A ÓLEO MEDIA FORÇA I', 'MEIA FORÇA'),
+        ('TRANSFORMADORES A ÓLEO MEDIA FORÇA II', 'MEIA FORÇA'),
+        ('TRANSFORMADORES A ÓLEO MEIA FORÇA', 'MEIA FORÇA'),
+        ('TRANSFORMADORES SECO', 'SECO'),
+        ('WCG20 / WG20', 'WCG20'),
+        ('WEG MOTION FLEET MANAGEMENT', 'WMFM'),
+        ('WEG MOTOR SCAN', 'MOTOR SCAN'),
+        ('WEG SCAN', 'WSCAN'),
+        ('WEG SMART MACHINE', 'WSM'),
+        ('WEGNOLOGY EDGE SUITE', 'WEGNOLOGY'),
+        ('WEGSCAN', 'WSCAN'),
+        ('WEGSCAN 1000', 'WSCAN 1000'),
+    ],
+    'Hier. Produto 3': [
+        # Qualquer hierarquia com 'ACESS' vira 'ACESSÓRIOS' (valor inteiro, não só o trecho)
+        {'find': 'ACESS', 'replace': 'ACESSÓRIOS', 'match': 'value'},
+        ('CHAVE DE PARTIDA CX. TERMOPLÁSTICA', 'PDW'),
+        ('W22 RURAL TEFC', 'W22 RURAL'),
+        ('MPW25/40', 'MPW40'),
+        ('MPW12/16/18', 'MPW18'),
+        ('FUSÍVEL NH ULTRARRÁPIDO', 'aR'),
+        ('CONTATORES AUXILIARES', 'CAW'),
+        ('SERVIÇO DE REFORMA', 'REFORMA'),
+        ('RS GERAL FHP ODP MONO (ANTIGO)', 'ODP (ANTIGO)'),
+        ('SACA FUSÍVEL - FSW', 'FSW'),
+        ('CONTATOR CAPACITOR CWMC', 'CWMC'),
+        ('CONJUNTOS CEW', 'CEW'),
+        ('FUSÍVEL NH RETARDADO', 'gG'),
+        ('CONJUNTOS CSW', 'CSW'),
+        ('HIDROGERADORES - GH20', 'GH20'),
+        ('TURBOGERADORES ST41', 'ST41'),
+        ('W22Xdb À PROVA DE EXPLOSÃO', 'W22X-db'),
+        ('SINALEIROS CEW', 'SIN CEW'),
+        ('TRANSFORMADORES A ÓLEO INDUSTRIAL', 'ÓLEO INDUSTRIAL'),
+        ('WCG20 VERTIMAX / WG20 F', 'VERTIMAX'),
+        ('HIDROGERADORES - SH11', 'SH11'),
+        ('RS AVIÁRIO', 'AVIÁRIO'),
+        ('TRANSFORMADORES SECO INDUSTRIAL', 'SECO'),
+        ('HIDROGERADORES - GH11', 'GH11'),
+        ('CHAVE DE PARTIDA CX. METÁLICA ESPECIAL', 'CHAVE ESPECIAL'),
+        ('MOTORREDUTOR/REDUTOR', 'MOTORREDUTOR'),
+        ('SL - INDUTIVOS', 'INDUTIVOS'),
+        ('HIDROGERADORES S', 'GH-S'),
+        ('MOTORES INDUSTRIAIS', 'WMO-I'),
+        ('WMFM MANGMT MOTOR', 'WMFM'),
+        ('BOTÕES CSW', 'BOT CSW'),
+        ('PSS24 - PADRAO', 'PSS24'),
+        ('RELÉS DE NÍVEL', 'RNW'),
+        ('FUSÍVEL D RETARDADO', 'D'),
+        ('CONTATOR CAPACITOR CWBC', 'CWBC'),
+        ('W21Xdb À PROVA DE EXPLOSÃO', 'W21X-DB'),
+        ('TURBOGERADORES S', 'TG-S'),
+        ('RS GERAL FHP ODP MONO', 'ODP MONO'),
+        ('W22 MOTOFREIO', 'MOTOFREIO'),
+        ('FUSIVEL FLUSH END', 'FLUSH END'),
+        ('ASSINATURA SAAS WEG SMART MACHINE', 'WSM-SIG'),
+        ('MODULO FOTOVOLTAICO', 'MÓDULO'),
+        ('SC - CAPACITIVOS', 'CAPACITIVOS'),
+        ('W22Xec SEGURANÇA AUMENTADA (NÃO ACENDÍVE', 'W22X-ec'),
+        ('CONTROLADOR AUTOMÁTICO', 'PFW'),
+        ('ROTATIVA PORTA FUSIVEL - RFW', 'RFW'),
+        ('TRANSFORMADOR A ÓLEO DE POTÊNCIA', 'ÓLEO POTENCIA'),
+        ('W22Xtb DIP', 'DIP W22X-tb'),
+        ('SERVIÇO DE ENGENHARIA', 'ENGENHARIA'),
+        ('COMUTADORES CSW', 'COMT CSW'),
+        ('TRANSFORMADOR A ÓLEO INDUSTRIAL', 'ÓLEO INDUSTRIAL'),
+        ('W22 MOTOR PARA REDUTOR TIPO 1', 'TIPO 1'),
+        ('WEG MOTOR SCAN COM SUBSCRIÇÃO', 'MOTOR SCAN'),
+        ('MOTORES DE ALTA TENSÃO - H', 'WEN-H'),
+        ('IHM MT', 'IHM'),
+        ('WCG20 COAXIAL / WG20 C', 'COAXIAL'),
+        ('BOTÕES CEW', 'BOT CEW'),
+        ('TRANSFORMADORES A ÓLEO DE POTÊNCIA', 'ÓLEO POTENCIA'),
+        ('BOTÕES CSW-M', 'BOT CSW-M'),
+        ('WCG20 CONIMAX / WG20 K', 'CONIMAX'),
+        ('RS GERAL FHP ODP TRIF (ANTIGO)', 'ODP 3F ANTIGO'),
+        ('RS GERAL FHP TEFC MONO (ANTIGO)', 'MONO ANTIGO'),
+        ('MOTORES DE ALTA TENSÃO - M', 'WEN-M'),
+        ('TRANSFORMADORES A ÓLEO DE DISTRIBUIÇÃO', 'DISTRIBUIÇÃO'),
+        ('TRANSFORMADORES SECO PARA RETIFICADOR', 'SECO RETF'),
+        ('GERADORES PARA GRUPOS GERADORES', 'ALTERNADOR'),
+        ('W22Xec WELL SEGURANÇA AUMENTADA', 'WELL EX-ec'),
+        ('JET PUMP BOMBA/FILTRO', 'JET PUMP'),
+        ('W01 FHP ODP TRIF', 'W01 TRIF'),
+        ('TRANSFORMADORES A ÓLEO TIPO AUTOTRAFO', 'AUTOTRAFO'),
+        ('COMUTADORES CEW', 'COMT CEW'),
+        ('RECTIFIER', 'RETIFICADOR'),
+        ('AFW11 CUSTOMIZADO', 'AFW11'),
+        ('COMUTADORES CSW-M', 'COMT CSW-M'),
+        ('GATEWAY MOTOR SCAN', 'GATEWAY'),
+        ('TRANSFORMADORES SECO', 'SECO'),
+        ('BOMBA COMBUSTÍVEL FERRO', 'BB COMBUSTIVEL FF'),
+        ('MINI FECHADO', 'MINI FECHADO'),
+        ('W22 BOMBA MONOBLOCO JM/JP', 'JM/JP'),
+        ('WEM CLOUD SAAS', 'WEM'),
+        ('WSDAL - DUPLA ABERTURA LATERAL', 'WSDAL'),
+        ('IDENTIFICADOR DE BORNES', 'ID BORNES'),
+        ('RS GERAL FHP TEFC MONO', 'MONO FECHADO'),
+        ('AC RESIDENCIAL JANELA', 'AC JANELA'),
+        ('PSS24W - METALICA', 'PSS24W METAL'),
+        ('SWITCHES ETHERNET SWU', 'SWITCH SWU'),
+        ('AFW11M G2 CUSTOMIZADO', 'AFW11M G2'),
+        ('Sistema Integrado de Distribuição (SID)', 'SID'),
+        ('TURBINA FRANCIS SIMPLES EIXO HORIZONTAL', 'TURBINA FRANCIS'),
+        ('SINALEIROS CSW', 'SIN CSW'),
+        ('TRANSFORMADORES A ÓLEO PARA FORNO', 'ÓLEO FORNO'),
+        ('QUADROS DE COMANDO - PNW', 'PNW'),
+        ('WEG DRIVE SCAN SEM ASSINATURA', 'DRIVE SCAN NO SIGN'),
+        ('W21 MOTOFREIO AL', 'W21 AL COM FREIO'),
+        ('BOMBA COMBUSTÍVEL CHAPA', 'BB COMBUSTIVEL CHAPA'),
+        ('ON PREMISE LICENCA', 'LICENÇA WEN'),
+        ('RELÉS DE MULTI-FUNÇÕES', 'ERWM'),
+        ('RS WJET PUMP ODP (ANTIGO)', 'JET PUMP ANTIGO'),
+        ('RTDW CUSTOMIZADO (NÃO UTILIZAR)', 'RTDW*'),
+        ('BANCO DE BATERIAS RETIFICADORES', 'BATERIAS RETIF'),
+        ('RS GERAL FHP ODP TRIF', 'ODP TRIF'),
+        ('SERVIÇOS DIVERSOS', 'DIVERSOS'),
+        ('SM - MAGNÉTICOS', 'MAGNÉTICOS'),
+        ('MOTORES DE ALTA TENSÃO - M MINING', 'WEN-MINING'),
+        ('QUADROS DE COMANDO - PNW WDS', 'PNW'),
+        ('RP- IRRIGATION (60 AND 61)', 'REDUTOR RODA PIVÔ'),
+        ('WEGNOLOGY DEVELOPER PAAS', 'WEGNOLOGY'),
+        ('WEGNOLOGY GENERIC', 'WEGNOLOGY'),
+        ('SMW CONCESSIONÁRIA', 'SMW'),
+        ('HMI ENG&RUNTIME WES', 'WES'),
+        ('HIDROGERADORES - SH1', 'SH1'),
+        ('AFW11 PADRÃO', 'AFW11'),
+        ('W22 MOTOFREIO PARA REDUTOR TIPO 1', 'W22 TIPO 1 COM FREIO'),
+        ('COMUTADORAS ROTATIVA', 'MSW'),
+        ('AFW11C PADRÃO', 'AFW11C'),
+        ('TRANSFORMADOR A ÓLEO PEDESTAL', 'PEDESTAL'),
+        ('MOTORES COMERCIAIS', 'WMO-C'),
+        ('RTDW CUSTOMIZADO', 'RTDW'),
+        ('BOMBA COMBUSTÍVEL CH', 'BB COMBUSTIVEL CH'),
+        ('TRANSFORMADORES A ÓLEO MEIA FORÇA', 'ÓLEO MEIA FORÇA'),
+        ('SD - ÓPTICOS DIFUSOS', 'OPT DIFUSO'),
+        ('W22 RURAL FARM DUTY', 'W22 RURAL'),
+        ('AC RESIDENCIAL SPLIT', 'AC SPLIT'),
+    ],
+}
+
+MATCH_MODES = ('substring', 'value')
+
+def _as_rule(regra):
+    if isinstance(regra, dict):
+        return regra
+    find, replace = regra
+    return {'find': find, 'replace': replace}
+
+def validate_rules(rules):
+    """
+    Confere o formato das regras (ver DEFAULT_RULES) e devolve cada uma como dict.
+
+    Raises:
+        ValueError: regra sem find/replace de texto, match desconhecido ou when incompleto
+    """
+    if not isinstance(rules, dict):
+        raise ValueError("As regras devem ser um objeto {coluna: [regras]}")
+    normalizadas = {}
+    for column, regras in rules.items():
+        normalizadas[column] = []
+        for i, regra in enumerate(regras):
+            try:
+                regra = _as_rule(regra)
+            except (TypeError, ValueError):
+                raise ValueError(f"{column}, regra {i + 1}: use [trecho, substituto] ou um objeto com find/replace")
+            if not isinstance(regra.get('find'), str) or not isinstance(regra.get('replace'), str) or not regra['find']:
+                raise ValueError(f"{column}, regra {i + 1}: find e replace devem ser textos (find não vazio)")
+            if regra.get('match', 'substring') not in MATCH_MODES:
+                raise ValueError(f"{column}, regra {i + 1}: match deve ser um de {', '.join(MATCH_MODES)}")
+            when = regra.get('when')
+            if when is not None and not (isinstance(when, dict) and {'column', 'contains'} <= set(when)):
+                raise ValueError(f"{column}, regra {i + 1}: when precisa de column e contains")
+            normalizadas[column].append(regra)
+    return normalizadas
+
+def get_rules():
+    """Regras em vigor: as gravadas em settings ou, fora do app ou sem regras gravadas, DEFAULT_RULES."""
+    if has_app_context():
+        salvas = db.get_setting(RULES_SETTING)
+        if salvas is not None:
+            return validate_rules(salvas)
+    return validate_rules(DEFAULT_RULES)
+
+def save_rules(rules):
+    """Grava as regras em settings (None volta para DEFAULT_RULES)."""
+    db.set_setting(RULES_SETTING, None if rules is None else validate_rules(rules))
+
+def _apply(valor, regras, condicoes=()):
+    """Aplica as regras em ordem a um valor; condicoes diz, na ordem, se cada regra com when vale."""
+    condicoes = iter(condicoes)
+    for regra in regras:
+        if regra.get('when') and not next(condicoes):
+            continue
+        if regra.get('match', 'substring') == 'value':
+            if regra['find'] in valor:
+                valor = regra['replace']
+        else:
+            valor = valor.replace(regra['find'], regra['replace'])
+    return valor
+
+def _condition(df, when):
+    """Linhas em que df[when['column']] contém o trecho; avaliado uma vez por valor distinto da coluna."""
+    if when['column'] not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    codes, valores = pd.factorize(df[when['column']])
+    # Vazios (código -1) caem na última posição, False
+    por_valor = np.array([isinstance(v, str) and when['contains'] in v for v in valores] + [False])
+    return por_valor[codes]
+
+def normalize_column(df, column, regras):
+    """
+    Aplica as regras a df[column] e devolve a coluna normalizada (mesmo índice e dtype).
+
+    As regras rodam uma vez por valor distinto (ou por combinação valor + condições when verdadeiras)
+    e o resultado é espalhado de volta pelos códigos: o custo cresce com os valores distintos, não com as linhas.
+    """
+    regras = [_as_rule(r) for r in regras]
+    serie = df[column]
+    condicionais = [r['when'] for r in regras if r.get('when')]
+    codes, valores = pd.factorize(serie)
+    chave = codes.astype('int64') << len(condicionais)
+    for bit, when in enumerate(condicionais):
+        chave |= _condition(df, when).astype('int64') << bit
+    grupos, chaves = pd.factorize(chave)
+    normalizados = []
+    for k in chaves:
+        valor = valores[k >> len(condicionais)] if k >= 0 else None
+        if isinstance(valor, str):
+            valor = _apply(valor, regras, [bool((k >> bit) & 1) for bit in range(len(condicionais))])
+        normalizados.append(valor)
+    grupos[codes < 0] = -1
+    saida = pd.Series(
+        pd.api.extensions.take(np.array(normalizados, dtype=object), grupos, allow_fill=True),
+        index=df.index, name=column,
+    )
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return saida.astype('category')
+    return saida.astype(serie.dtype)
+
+def normalize(df, rules=None, columns=None):
+    """
+    Normaliza as colunas de hierarquia de df com as regras (get_rules() se rules for None), na ordem
+    das regras. columns limita as colunas normalizadas. Altera e devolve df.
+    """
+    rules = get_rules() if rules is None else validate_rules(rules)
+    for column, regras in rules.items():
+        if column in df.columns and (columns is None or column in columns):
+            df[column] = normalize_column(df, column, regras)
+    return df
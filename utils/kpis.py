@@ -61,17 +61,9 @@ def calculate_kpis_por_cliente(df_vendas, df_cotacoes):
     if qtd_col is None:
         return pd.DataFrame()
     
-    kpis_vendas = df_vendas.groupby('cod_cliente').agg(
-        cliente=('cliente', 'first'), 
-        ultima_compra=('data_faturamento', 'max'),
-        total_comprado_valor=(valor_col, 'sum'), 
-        total_comprado_qtd=(qtd_col, 'sum'),
-        mix_produtos=('material', 'nunique'), 
-        unidades_negocio=('unidade_negocio', 'nunique')
-    ).reset_index()
+    kpis_vendas, kpis_cotacoes = _Aggregates.kpis_cliente_aggregates(df_vendas, df_cotacoes, valor_col, qtd_col)
     
     kpis_vendas['dias_sem_compra'] = (hoje - kpis_vendas['ultima_compra']).dt.days
-    kpis_cotacoes = df_cotacoes.groupby('cod_cliente').agg(total_cotado_qtd=('quantidade', 'sum')).reset_index()
     df_kpis = pd.merge(kpis_vendas, kpis_cotacoes, on='cod_cliente', how='left')
     df_kpis['total_cotado_qtd'] = df_kpis['total_cotado_qtd'].fillna(0)
     
@@ -114,27 +106,8 @@ def calculate_funil_metrics(df_vendas, df_cotacoes, periodo_meses=12, threshold_
     hoje = datetime.now()
     data_limite = hoje - pd.DateOffset(months=periodo_meses)
     
-    # Filtrar por período
-    if 'data_faturamento' in df_vendas.columns:
-        df_vendas_periodo = df_vendas[pd.to_datetime(df_vendas['data_faturamento']) >= data_limite]
-    else:
-        df_vendas_periodo = df_vendas
-        
-    if 'data' in df_cotacoes.columns:
-        df_cotacoes_periodo = df_cotacoes[pd.to_datetime(df_cotacoes['data']) >= data_limite]
-    else:
-        df_cotacoes_periodo = df_cotacoes
-    
-    # Calcular conversões por cliente
-    cotacoes_por_cliente = df_cotacoes_periodo.groupby('cod_cliente').agg({
-        'quantidade': 'sum',
-        'cliente': 'first'
-    }).reset_index()
-    
-    vendas_por_cliente = df_vendas_periodo.groupby('cod_cliente').agg({
-        'quantidade_faturada': 'sum',
-        'data_faturamento': 'max'
-    }).reset_index()
+    # Filtrar por período e calcular conversões por cliente
+    cotacoes_por_cliente, vendas_por_cliente = _Aggregates.funil_aggregates(df_vendas, df_cotacoes, data_limite)
     
     # Merge para calcular conversão
     funil_data = pd.merge(cotacoes_por_cliente, vendas_por_cliente, on='cod_cliente', how='left')
@@ -184,17 +157,10 @@ def calculate_produtos_matrix(df_vendas, df_cotacoes, top_produtos=20, top_clien
     if df_cotacoes.empty:
         return pd.DataFrame()
     
-    # Agrupar cotações por cliente e material
-    cotacoes_matrix = df_cotacoes.groupby(['cod_cliente', 'cliente', 'material']).agg({
-        'quantidade': 'sum'
-    }).reset_index()
+    # Agrupar cotações e vendas por cliente e material
+    cotacoes_matrix, vendas_matrix = _Aggregates.produtos_matrix_aggregates(df_vendas, df_cotacoes)
     
-    # Agrupar vendas por cliente e material
     if not df_vendas.empty:
-        vendas_matrix = df_vendas.groupby(['cod_cliente', 'material']).agg({
-            'quantidade_faturada': 'sum'
-        }).reset_index()
-        
         # Merge para calcular % não comprado
         matrix = pd.merge(cotacoes_matrix, vendas_matrix, on=['cod_cliente', 'material'], how='left')
         matrix['quantidade_faturada'] = matrix['quantidade_faturada'].fillna(0)
@@ -209,12 +175,12 @@ def calculate_produtos_matrix(df_vendas, df_cotacoes, top_produtos=20, top_clien
         matrix['pct_nao_comprado'] = 100
     
     # Filtrar top produtos e clientes
-    top_materiais = matrix.groupby('material')['quantidade'].sum().nlargest(top_produtos).index
-    top_clientes_list = matrix.groupby(['cod_cliente', 'cliente'])['quantidade'].sum().nlargest(top_clientes).index
+    top_materiais = matrix.groupby('material', observed=True)['quantidade'].sum().nlargest(top_produtos).index
+    top_clientes_list = matrix.groupby(['cod_cliente', 'cliente'], observed=True)['quantidade'].sum().nlargest(top_clientes).index
     
     matrix_filtered = matrix[
         matrix['material'].isin(top_materiais) & 
-        matrix[['cod_cliente', 'cliente']].apply(tuple, axis=1).isin(top_clientes_list)
+        pd.MultiIndex.from_frame(matrix[['cod_cliente', 'cliente']]).isin(top_clientes_list)
     ]
     
     return matrix_filtered
@@ -264,32 +230,26 @@ def get_client_recommendations(client_code, df_vendas, df_cotacoes):
 def calculate_material_analysis(df_vendas, df_cotacoes):
     if df_cotacoes.empty: return pd.DataFrame()
     df_cotacoes.loc[:, 'data'] = pd.to_datetime(df_cotacoes['data'])
-    agg_cotacoes = df_cotacoes.groupby('material').agg(
-        total_cotado_qtd=('quantidade', 'sum'),
-        primeira_cotacao=('data', 'min'),
-        ultima_cotacao=('data', 'max')
-    ).reset_index()
+    agg_cotacoes, agg_vendas, product_map = _Aggregates.material_analysis_aggregates(df_vendas, df_cotacoes)
     agg_cotacoes['meses_ativo'] = ((agg_cotacoes['ultima_cotacao'] - agg_cotacoes['primeira_cotacao']).dt.days / 30.44).replace(0, 1).round()
     agg_cotacoes['demanda_mensal'] = (agg_cotacoes['total_cotado_qtd'] / agg_cotacoes['meses_ativo']).round(2)
-    agg_vendas = df_vendas.groupby('material')['quantidade_faturada'].sum().reset_index(name='total_comprado_qtd')
     df_analysis = pd.merge(agg_cotacoes, agg_vendas, on='material', how='left').fillna(0)
     df_analysis['razao_cot_compra'] = np.where(
         df_analysis['total_comprado_qtd'] > 0,
         df_analysis['total_cotado_qtd'] / df_analysis['total_comprado_qtd'],
         df_analysis['total_cotado_qtd']
     )
-    product_map = df_vendas[['material', 'produto']].drop_duplicates(subset=['material'])
     df_analysis = pd.merge(df_analysis, product_map, on='material', how='left')
     return df_analysis[['material', 'produto', 'demanda_mensal', 'razao_cot_compra', 'total_cotado_qtd', 'total_comprado_qtd']]
 
 def get_top_products_comparison(df_vendas, selected_clients=[], top_n=20):
     if df_vendas.empty: return pd.DataFrame()
-    top_todos = df_vendas.groupby('produto')['quantidade_faturada'].sum().nlargest(top_n or 20).reset_index()
+    top_todos = df_vendas.groupby('produto', observed=True)['quantidade_faturada'].sum().nlargest(top_n or 20).reset_index()
     top_todos['grupo'] = 'Todos os Clientes'
     if selected_clients:
         df_vendas_cliente = df_vendas[df_vendas['cod_cliente'].isin(selected_clients)]
         if not df_vendas_cliente.empty:
-            top_cliente = df_vendas_cliente.groupby('produto')['quantidade_faturada'].sum().nlargest(top_n or 20).reset_index()
+            top_cliente = df_vendas_cliente.groupby('produto', observed=True)['quantidade_faturada'].sum().nlargest(top_n or 20).reset_index()
             top_cliente['grupo'] = 'Clientes Selecionados'
             return pd.concat([top_todos, top_cliente])
     return top_todos
@@ -299,12 +259,12 @@ def get_top_n_products_list(df_vendas, top_n=20):
     """Retorna uma lista dos Top N produtos mais comprados (globais)."""
     if df_vendas.empty:
         return []
-    return df_vendas.groupby('produto')['quantidade_faturada'].sum().nlargest(top_n or 20).index.tolist()
+    return df_vendas.groupby('produto', observed=True)['quantidade_faturada'].sum().nlargest(top_n or 20).index.tolist()
 
 def generate_purchase_list(df_vendas, df_cotacoes, selected_clients=None):
     if df_vendas.empty or df_cotacoes.empty: return pd.DataFrame()
-    total_cotado = df_cotacoes.groupby('material')['quantidade'].sum()
-    total_vendido = df_vendas.groupby('material')['quantidade_faturada'].sum()
+    total_cotado = df_cotacoes.groupby('material', observed=True)['quantidade'].sum()
+    total_vendido = df_vendas.groupby('material', observed=True)['quantidade_faturada'].sum()
     df_score = pd.concat([total_cotado, total_vendido], axis=1).fillna(0)
     df_score.columns = ['qtd_cotada', 'qtd_vendida']
     df_score['score'] = (df_score['qtd_cotada'] * 0.5) + (df_score['qtd_vendida'] * 1.5)
@@ -314,10 +274,9 @@ def generate_purchase_list(df_vendas, df_cotacoes, selected_clients=None):
         df_score = df_score[~df_score.index.isin(compras_cliente)]
     sugestoes = df_score.head(50).reset_index()
     
-    df_raw_vendas = db.get_raw_data_as_df('raw_vendas')
-    product_map = df_raw_vendas[['Material', 'Produto', 'Hier. Produto 3']].rename(
-        columns={'Material': 'material', 'Produto': 'produto'}
-    ).drop_duplicates(subset=['material'])
+    product_map = db.get_dim_material_df(['material', 'produto', 'hier_produto_3']).rename(
+        columns={'hier_produto_3': 'Hier. Produto 3'}
+    )
     
     sugestoes = pd.merge(sugestoes, product_map, on='material', how='left')
     df_analysis = calculate_material_analysis(df_vendas, df_cotacoes)
@@ -328,4 +287,68 @@ def generate_purchase_list(df_vendas, df_cotacoes, selected_clients=None):
         'produto': 'Descrição do Produto',
         'demanda_mensal': 'Sugestão de Giro Mensal'
     })
-    return sugestoes_final.sort_values(by=['Categoria', 'Sugestão de Giro Mensal'], ascending=[True, False])
\ No newline at end of file
+    return sugestoes_final.sort_values(by=['Categoria', 'Sugestão de Giro Mensal'], ascending=[True, False])
+
+
+class _Aggregates:
+    """Agregações (group-bys) das funções de KPI; o resto de cada cálculo fica na função pública."""
+
+    @staticmethod
+    def kpis_cliente_aggregates(df_vendas, df_cotacoes, valor_col, qtd_col):
+        kpis_vendas = df_vendas.groupby('cod_cliente', observed=True).agg(
+            cliente=('cliente', 'first'), 
+            ultima_compra=('data_faturamento', 'max'),
+            total_comprado_valor=(valor_col, 'sum'), 
+            total_comprado_qtd=(qtd_col, 'sum'),
+            mix_produtos=('material', 'nunique'), 
+            unidades_negocio=('unidade_negocio', 'nunique')
+        ).reset_index()
+        kpis_cotacoes = df_cotacoes.groupby('cod_cliente', observed=True).agg(total_cotado_qtd=('quantidade', 'sum')).reset_index()
+        return kpis_vendas, kpis_cotacoes
+
+    @staticmethod
+    def funil_aggregates(df_vendas, df_cotacoes, data_limite):
+        # Filtrar por período
+        if 'data_faturamento' in df_vendas.columns:
+            df_vendas_periodo = df_vendas[pd.to_datetime(df_vendas['data_faturamento']) >= data_limite]
+        else:
+            df_vendas_periodo = df_vendas
+            
+        if 'data' in df_cotacoes.columns:
+            df_cotacoes_periodo = df_cotacoes[pd.to_datetime(df_cotacoes['data']) >= data_limite]
+        else:
+            df_cotacoes_periodo = df_cotacoes
+        
+        cotacoes_por_cliente = df_cotacoes_periodo.groupby('cod_cliente', observed=True).agg({
+            'quantidade': 'sum',
+            'cliente': 'first'
+        }).reset_index()
+        
+        vendas_por_cliente = df_vendas_periodo.groupby('cod_cliente', observed=True).agg({
+            'quantidade_faturada': 'sum',
+            'data_faturamento': 'max'
+        }).reset_index()
+        return cotacoes_por_cliente, vendas_por_cliente
+
+    @staticmethod
+    def produtos_matrix_aggregates(df_vendas, df_cotacoes):
+        cotacoes_matrix = df_cotacoes.groupby(['cod_cliente', 'cliente', 'material'], observed=True).agg({
+            'quantidade': 'sum'
+        }).reset_index()
+        if df_vendas.empty:
+            return cotacoes_matrix, None
+        vendas_matrix = df_vendas.groupby(['cod_cliente', 'material'], observed=True).agg({
+            'quantidade_faturada': 'sum'
+        }).reset_index()
+        return cotacoes_matrix, vendas_matrix
+
+    @staticmethod
+    def material_analysis_aggregates(df_vendas, df_cotacoes):
+        agg_cotacoes = df_cotacoes.groupby('material', observed=True).agg(
+            total_cotado_qtd=('quantidade', 'sum'),
+            primeira_cotacao=('data', 'min'),
+            ultima_cotacao=('data', 'max')
+        ).reset_index()
+        agg_vendas = df_vendas.groupby('material', observed=True)['quantidade_faturada'].sum().reset_index(name='total_comprado_qtd')
+        product_map = df_vendas[['material', 'produto']].drop_duplicates(subset=['material'])
+        return agg_cotacoes, agg_vendas, product_map
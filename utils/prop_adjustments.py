@@ -1,5 +1,6 @@
 from pathlib import Path
 import pandas as pd
+from utils import workbook_cache
 
 def carrega_materiais():
     pasta_dataset = Path('data/arquivos_compilados')
@@ -8,7 +9,7 @@ def carrega_materiais():
     df = pd.read_excel(caminho_materiais, decimal=',')
     df.fillna({'Centro Fornecedor':0}, inplace=True)
     df['Material'] = df['Material'].astype('string')
-    df['Unidade'] = df.apply(centro_fornecedor, axis=1)
+    df['Unidade'] = unidade_por_centro(df['Centro Fornecedor'])
     return df
 
 
@@ -23,7 +24,6 @@ def carrega_hierarquia_2(df_prop, df_ovs):
 
 def carrega_propostas():
     caminho = Path('data/propostas')
-    lista_dfs = []
     colunas = ['Número da Cotação', 'Número da Revisão', 'Linhas de Cotação',
         'Código do Cliente', 'Nome do Cliente', 'Data de Criação',
         'Data de Emissão', 'Status da Cotação', 'Valor total',
@@ -32,13 +32,8 @@ def carrega_propostas():
         'Canal de Distribuição', 'Divisão', 'Escritório de Vendas',
         'Equipe de Vendas']
 
-    # Percorre todos os arquivos com extensão .xls na pasta
-    for arquivo in caminho.glob('*.xls'):
-        # Lê todas as planilhas do arquivo, retornando um dicionário
-        planilhas = pd.read_excel(arquivo, sheet_name=None, usecols=colunas)
-        # Itera sobre as planilhas e adiciona cada DataFrame à lista
-        for nome, df in planilhas.items():
-            lista_dfs.append(df)
+    # Todas as planilhas dos arquivos .xls da pasta; só os arquivos alterados são lidos de novo
+    lista_dfs = workbook_cache.read_workbooks(sorted(caminho.glob('*.xls')), usecols=colunas)
 
     # Concatena todos os DataFrames em um único DataFrame consolidado
     df = pd.concat(lista_dfs, ignore_index=True)
@@ -73,7 +68,7 @@ def prop_merge_products(df_prop, df_materiais):
     df = df.drop(columns=['Data de Emissão', 'IPI %', 'Preço base', 'Representante', 'Cliente_y', 'Prazo de entrega (Dias)', 'Representante de Vendas',
                           'Criado Por (login)', 'Incoterm 1', 'Condição de Pagamento', 'Emissor', 'Escritório de Vendas', 'Equipe de Vendas',
                           'Taxa Financeira %', 'Cod Cliente'], errors='ignore')
-    df['Unidade'] = df.apply(centro_fornecedor, axis=1)
+    df['Unidade'] = unidade_por_centro(df['Centro Fornecedor'])
     return df
 
 
@@ -87,42 +82,18 @@ def prop_columns_adjustments(df):
     return df
 
 
+# Unidade de negócio de cada centro fornecedor; centros fora da tabela (ou vazios) são 'OUTRO'
+CENTRO_UNIDADE = {
+    1100: 'WMO-I', 1106: 'WMO-C', 1108: 'WCES', 1109: 'WCES', 1200: 'WEN', 1201: 'WEN', 1202: 'WTD', 1203: 'WTD',
+    1304: 'WDS', 1305: 'WDC', 1306: 'WDC', 1312: 'WDC', 1320: 'WDC', 1321: 'WDC', 1323: 'WDS',
+    1340: 'SOLAR', 1341: 'SOLAR', 1505: 'WTD',
+}
+
+
+def unidade_por_centro(centros, outro='OUTRO'):
+    """Unidade de cada linha pelo 'Centro Fornecedor' (consulta em CENTRO_UNIDADE, sem laço por linha)."""
+    return centros.map(CENTRO_UNIDADE).astype(object).where(lambda u: u.notna(), outro)
+
+
 def centro_fornecedor(row):
-    if row['Centro Fornecedor'] == 1100.0:
-        return 'WMO-I'
-    elif row['Centro Fornecedor'] == 1106.0:
-        return 'WMO-C'
-    elif row['Centro Fornecedor'] == 1108.0:
-        return 'WCES'
-    elif row['Centro Fornecedor'] == 1109.0:
-        return 'WCES'
-    elif row['Centro Fornecedor'] == 1200.0:
-        return 'WEN'
-    elif row['Centro Fornecedor'] == 1201.0:
-        return 'WEN'
-    elif row['Centro Fornecedor'] == 1202.0:
-        return 'WTD'
-    elif row['Centro Fornecedor'] == 1203.0:
-        return 'WTD'
-    elif row['Centro Fornecedor'] == 1304.0:
-        return 'WDS'
-    elif row['Centro Fornecedor'] == 1305.0:
-        return 'WDC'
-    elif row['Centro Fornecedor'] == 1306.0:
-        return 'WDC'
-    elif row['Centro Fornecedor'] == 1312.0:
-        return 'WDC'
-    elif row['Centro Fornecedor'] == 1320.0:
-        return 'WDC'
-    elif row['Centro Fornecedor'] == 1321.0:
-        return 'WDC'
-    elif row['Centro Fornecedor'] == 1323.0:
-        return 'WDS'
-    elif row['Centro Fornecedor'] == 1340.0:
-        return 'SOLAR'
-    elif row['Centro Fornecedor'] == 1341.0:
-        return 'SOLAR'
-    elif row['Centro Fornecedor'] == 1505.0:
-        return 'WTD'
-    else:
-        return 'OUTRO'
\ No newline at end of file
+    return CENTRO_UNIDADE.get(row['Centro Fornecedor'], 'OUTRO')
@@ -101,7 +101,7 @@ def generate_client_pdf(client_data, client_name, charts_data=None):
         if 'produto' in client_data.columns:
             story.append(Paragraph("PRODUTOS MAIS COMPRADOS", subtitle_style))
             
-            produtos_top = client_data.groupby('produto').agg({
+            produtos_top = client_data.groupby('produto', observed=True).agg({
                 'valor': 'sum',
                 'quantidade': 'sum'
             }).sort_values('valor', ascending=False).head(5)
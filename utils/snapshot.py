@@ -0,0 +1,100 @@
+# utils/snapshot.py
+
+import os
+import uuid
+import pandas as pd
+from flask import current_app
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    print("⚠️  PyArrow não disponível. Snapshots Parquet desabilitados (leitura via SQLite).")
+    PYARROW_AVAILABLE = False
+
+# Colunas de texto com poucos valores distintos, gravadas como dicionário (categóricas) no Parquet
+CATEGORICAL_COLUMNS = ['cod_cliente', 'cliente', 'material', 'produto', 'unidade_negocio', 'canal_distribuicao']
+DATE_COLUMNS = ['data_entrada', 'data_faturamento', 'data']
+FLOAT_COLUMNS = [
+    'quantidade_entrada', 'quantidade_carteira', 'quantidade_faturada',
+    'valor_entrada', 'valor_carteira', 'valor_faturado', 'quantidade'
+]
+
+def get_snapshot_dir():
+    directory = current_app.config.get('SNAPSHOT_DIR')
+    if not directory:
+        directory = os.path.join(os.path.dirname(current_app.config['DATABASE']), 'snapshots')
+    return directory
+
+def snapshot_path(table_name):
+    return os.path.join(get_snapshot_dir(), f'{table_name}.parquet')
+
+def _typed_table(df):
+    """Converte o DataFrame limpo em uma tabela Arrow com datas, floats e categorias explícitos."""
+    df = df.copy()
+    for col in df.columns:
+        if col in DATE_COLUMNS:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif col in CATEGORICAL_COLUMNS:
+            # Só as categorias presentes: as compartilhadas entre tabelas (db.get_category_dtypes) voltam na leitura
+            df[col] = df[col].astype('category').cat.remove_unused_categories()
+        elif col in FLOAT_COLUMNS:
+            df[col] = df[col].astype('float64')
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def write_snapshot(table_name, df, token):
+    """
+    Publica o snapshot Parquet de uma tabela limpa, marcado com o token dos dados (db.get_data_token).
+
+    A escrita é feita em arquivo temporário e trocada com os.replace, então leitores
+    nunca veem um arquivo pela metade.
+    """
+    if not PYARROW_AVAILABLE or token is None:
+        return False
+    table = _typed_table(df)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'data_token'] = token.encode()
+    table = table.replace_schema_metadata(metadata)
+
+    path = snapshot_path(table_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return True
+
+def snapshot_token(table_name):
+    path = snapshot_path(table_name)
+    if not PYARROW_AVAILABLE or not os.path.exists(path):
+        return None
+    metadata = pq.read_schema(path, memory_map=True).metadata or {}
+    token = metadata.get(b'data_token')
+    return token.decode() if token is not None else None
+
+def read_snapshot(table_name, token, columns=None, categories=False):
+    """
+    Lê o snapshot via memory-map se ele corresponde ao estado atual dos dados.
+
+    Args:
+        table_name: 'vendas' ou 'cotacoes'
+        token: token atual dos dados (db.get_data_token())
+        columns: colunas desejadas (None = todas)
+        categories: se False, as colunas categóricas voltam como texto, como na leitura do SQLite
+
+    Returns:
+        DataFrame ou None se o snapshot não existe, está desatualizado ou o PyArrow não está instalado
+    """
+    try:
+        if token is None or snapshot_token(table_name) != token:
+            return None
+        table = pq.read_table(snapshot_path(table_name), columns=columns, memory_map=True)
+    except (OSError, pa.ArrowException) as e:
+        print(f"Erro ao ler snapshot de {table_name}: {e}")
+        return None
+    if not categories:
+        table = table.cast(pa.schema([
+            pa.field(field.name, field.type.value_type) if pa.types.is_dictionary(field.type) else field
+            for field in table.schema
+        ], metadata=table.schema.metadata))
+    return table.to_pandas()
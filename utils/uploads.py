@@ -0,0 +1,310 @@
+# utils/uploads.py
+
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+from flask import current_app
+from werkzeug.formparser import parse_form_data
+from utils import data_loader, db
+
+# Token de upload: nome dos arquivos no spool (uuid4 hex), nunca um caminho vindo do navegador
+_TOKEN_RE = re.compile(r'^[0-9a-f]{32}$')
+
+def get_upload_dir():
+    directory = current_app.config.get('UPLOAD_DIR')
+    if not directory:
+        directory = os.path.join(os.path.dirname(current_app.config['DATABASE']), 'uploads')
+    return directory
+
+def _paths(token):
+    directory = get_upload_dir()
+    return os.path.join(directory, f'{token}.upload'), os.path.join(directory, f'{token}.json')
+
+class _HashingSpool:
+    """Arquivo do spool que calcula o MD5 (o fingerprint do upload) enquanto os blocos chegam."""
+
+    def __init__(self, path):
+        self.path = path
+        self.md5 = hashlib.md5()
+        self.size = 0
+        self._file = open(path, 'w+b')
+
+    def write(self, data):
+        self.md5.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+def receive_uploads(environ, user_id):
+    """
+    Grava no spool os arquivos de uma requisição multipart, lendo o corpo em blocos (sem base64 e sem
+    carregar o arquivo inteiro na memória) e calculando o fingerprint no caminho.
+
+    Returns:
+        list: {'token', 'filename', 'size'} por arquivo, na ordem do formulário
+    """
+    config = current_app.config
+    directory = get_upload_dir()
+    os.makedirs(directory, exist_ok=True)
+    purge_stale_uploads()
+    spools = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        token = uuid.uuid4().hex
+        spool = _HashingSpool(_paths(token)[0])
+        spools.append((token, spool))
+        return spool
+
+    try:
+        _, _, files = parse_form_data(
+            environ, stream_factory=stream_factory, max_content_length=config.get('UPLOAD_MAX_BYTES'),
+            max_form_memory_size=1024 * 1024, silent=False
+        )
+    except Exception:
+        for token, spool in spools:
+            spool.close()
+            _discard(token)
+        raise
+
+    uploads = []
+    by_spool = {id(spool): token for token, spool in spools}
+    for _, storage in files.items(multi=True):
+        spool = storage.stream
+        token = by_spool.pop(id(spool))
+        spool.close()
+        if not storage.filename:
+            # Campo de arquivo enviado vazio
+            _discard(token)
+            continue
+        meta = {
+            'filename': os.path.basename(storage.filename or ''), 'fingerprint': spool.md5.hexdigest(),
+            'size': spool.size, 'user_id': user_id, 'created_at': time.time(),
+        }
+        with open(_paths(token)[1], 'w', encoding='utf8') as f:
+            json.dump(meta, f)
+        uploads.append({'token': token, 'filename': meta['filename'], 'size': meta['size']})
+    for _, spool in spools:
+        if id(spool) in by_spool:
+            spool.close()
+            _discard(by_spool[id(spool)])
+    return uploads
+
+@contextmanager
+def open_upload(token, user_id):
+    """
+    Abre um arquivo recebido por receive_uploads; o spool é apagado ao sair do bloco.
+
+    Yields:
+        dict: file (aberto em modo binário), path, filename, fingerprint (MD5 do conteúdo) e size
+
+    Raises:
+        ValueError: token inválido, expirado ou de outro usuário
+    """
+    if not isinstance(token, str) or not _TOKEN_RE.match(token):
+        raise ValueError("Token de upload inválido.")
+    data_path, meta_path = _paths(token)
+    try:
+        with open(meta_path, encoding='utf8') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise ValueError("Upload não encontrado ou expirado. Envie o arquivo novamente.")
+    if meta['user_id'] != user_id:
+        raise ValueError("Upload não encontrado ou expirado. Envie o arquivo novamente.")
+    try:
+        with open(data_path, 'rb') as file:
+            yield dict(meta, file=file, path=data_path)
+    finally:
+        _discard(token)
+
+def _discard(token):
+    for path in _paths(token):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def purge_stale_uploads():
+    """Apaga do spool os uploads que nenhum callback consumiu (aba fechada, erro no navegador)."""
+    directory = get_upload_dir()
+    limite = time.time() - current_app.config.get('UPLOAD_SPOOL_MAX_AGE_SECONDS', 24 * 3600)
+    try:
+        nomes = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for nome in nomes:
+        path = os.path.join(directory, nome)
+        try:
+            if os.path.getmtime(path) < limite:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _parse_raw_file(path, schema_columns, out_path):
+    """
+    data_loader.parse_raw_file no processo do pool: (colunas, segundos da leitura, início da leitura). O início
+    vem de time.time() para poder ser comparado com o relógio do processo do servidor.
+    """
+    comeco = time.time()
+    inicio = time.perf_counter()
+    colunas = data_loader.parse_raw_file(path, schema_columns, out_path)
+    return colunas, time.perf_counter() - inicio, comeco
+
+class UploadPipeline:
+    """
+    Caminho único de um upload de vendas ou de cotações, com o tempo de cada etapa:
+
+    recebimento (envio em multipart e MD5, na rota /upload) -> verificação (tipo do arquivo e fingerprint)
+    -> leitura (planilha em lotes) -> gravação (tabela bruta, sem as linhas já carregadas). Cada arquivo é
+    lido uma única vez.
+
+    Com mais de um arquivo e pelo menos UPLOAD_PARSE_POOL_MIN_BYTES no total, cada um é lido em um processo
+    do pool (UPLOAD_PARSE_WORKERS) e convertido em lotes no disco; as gravações continuam uma por vez na
+    conexão de escrita, na ordem em que as leituras terminam. O tempo para subir e encerrar os processos
+    entra na etapa 'processos'. Nos outros casos a leitura vai direto para o banco, em streaming.
+
+    Args:
+        user_id: usuário do upload (os tokens de outro usuário são recusados)
+        classify: filename -> tabela bruta de destino, ou None para arquivo recusado
+    """
+
+    FASES = ('recebimento', 'verificacao', 'processos', 'leitura', 'gravacao')
+
+    def __init__(self, user_id, classify):
+        self.user_id = user_id
+        self.classify = classify
+        # Segundos por etapa, somados entre os arquivos (a leitura paralela pode passar do total)
+        self.timings = dict.fromkeys(self.FASES, 0.0)
+        self.timings['total'] = 0.0
+
+    @contextmanager
+    def _fase(self, fase):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[fase] += time.perf_counter() - inicio
+
+    def _timed_batches(self, lotes):
+        """Repassa os lotes de um gerador, somando à leitura o tempo gasto em produzi-los."""
+        lotes = iter(lotes)
+        while True:
+            with self._fase('leitura'):
+                lote = next(lotes, None)
+            if lote is None:
+                return
+            yield lote
+
+    def run(self, recebidos, receive_seconds=0.0):
+        """
+        Processa os arquivos recebidos pela rota /upload.
+
+        Args:
+            recebidos: {'token', 'filename', 'size'} por arquivo (resposta da rota /upload)
+            receive_seconds: tempo do recebimento na rota, só para o relatório de tempos
+
+        Returns:
+            list: um resultado por arquivo, na ordem de recebidos, com filename, table_name e status:
+                'ok' (rows gravadas e skipped, linhas já carregadas por outro arquivo), 'recusado',
+                'duplicado' (arquivo já carregado) ou 'erro' (error)
+        """
+        inicio = time.perf_counter()
+        self.timings['recebimento'] += receive_seconds
+        resultados = []
+        jobs = []
+        # Os spools ficam abertos até o fim das gravações (os processos de leitura usam o caminho)
+        with ExitStack() as stack:
+            with self._fase('verificacao'):
+                for recebido in recebidos:
+                    resultado = {'filename': recebido.get('filename'), 'table_name': None}
+                    resultados.append(resultado)
+                    try:
+                        arquivo = stack.enter_context(open_upload(recebido.get('token'), self.user_id))
+                        table_name = resultado['table_name'] = self.classify(arquivo['filename'])
+                        if table_name is None:
+                            resultado['status'] = 'recusado'
+                        # Fingerprint calculado durante o envio: arquivo repetido nem chega a ser lido
+                        elif db.check_raw_fingerprint_exists(arquivo['fingerprint'], table_name):
+                            resultado['status'] = 'duplicado'
+                        else:
+                            jobs.append((resultado, dict(arquivo, table_name=table_name)))
+                    except Exception as e:
+                        resultado.update(status='erro', error=e)
+            self._import(jobs)
+        self.timings['total'] += receive_seconds + time.perf_counter() - inicio
+        return resultados
+
+    def _write(self, job, parsed):
+        """Grava um arquivo já verificado; parsed() devolve (colunas, lotes). O fingerprint é conferido de novo
+        aqui porque dois arquivos iguais do mesmo upload passam juntos pela verificação inicial."""
+        with self._fase('verificacao'):
+            if db.check_raw_fingerprint_exists(job['fingerprint'], job['table_name']):
+                return {'status': 'duplicado'}
+        leitura = self.timings['leitura']
+        inicio = time.perf_counter()
+        try:
+            with self._fase('leitura'):
+                colunas, lotes = parsed()
+            gravadas = db.insert_raw_batches(
+                job['table_name'], colunas, self._timed_batches(lotes), job['filename'], job['fingerprint'], self.user_id
+            )
+        except Exception as e:
+            return {'status': 'erro', 'error': e}
+        finally:
+            # A leitura em streaming acontece dentro da gravação: aqui fica só o tempo do banco
+            self.timings['gravacao'] += time.perf_counter() - inicio - (self.timings['leitura'] - leitura)
+        return dict(gravadas, status='ok')
+
+    def _import(self, jobs):
+        """Lê e grava os arquivos verificados (pares (resultado, job)), atualizando cada resultado."""
+        config = current_app.config
+        workers = min(config.get('UPLOAD_PARSE_WORKERS') or os.cpu_count() or 1, len(jobs))
+        # Subir os processos (spawn importa pandas em cada um) custa mais que ler arquivos pequenos
+        if sum(job['size'] for _, job in jobs) < (config.get('UPLOAD_PARSE_POOL_MIN_BYTES') or 0):
+            workers = 1
+        if workers <= 1:
+            for resultado, job in jobs:
+                resultado.update(self._write(job, lambda job=job: data_loader.stream_raw_rows(
+                    job['file'], db.raw_table_columns(job['table_name'])
+                )))
+            return
+
+        contexto = multiprocessing.get_context('spawn')
+        criado = time.time()
+        primeira_leitura = None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as pool:
+            futuros = {
+                pool.submit(
+                    _parse_raw_file, job['path'], db.raw_table_columns(job['table_name']), f"{job['path']}.rows"
+                ): (resultado, job)
+                for resultado, job in jobs
+            }
+            for futuro in as_completed(futuros):
+                resultado, job = futuros[futuro]
+                lotes = f"{job['path']}.rows"
+                try:
+                    colunas, segundos, comeco = futuro.result()
+                    self.timings['leitura'] += segundos
+                    primeira_leitura = comeco if primeira_leitura is None else min(primeira_leitura, comeco)
+                    resultado.update(self._write(
+                        job, lambda: (colunas, data_loader.read_parsed_batches(lotes))
+                    ))
+                except Exception as e:
+                    resultado.update(status='erro', error=e)
+                finally:
+                    try:
+                        os.remove(lotes)
+                    except FileNotFoundError:
+                        pass
+            encerramento = time.time()
+        # Subida (até a primeira leitura começar) e encerramento dos processos
+        if primeira_leitura is not None:
+            self.timings['processos'] += max(primeira_leitura - criado, 0.0)
+        self.timings['processos'] += time.time() - encerramento
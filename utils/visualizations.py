@@ -225,7 +225,8 @@ def create_comparative_chart(df_propostas, chart_type='barra'):
             index='cliente',
             columns='material',
             values='pct_nao_comprado',
-            aggfunc='mean'
+            aggfunc='mean',
+            observed=True
         ).fillna(0)
         
         fig = px.imshow(
@@ -243,7 +244,7 @@ def create_comparative_chart(df_propostas, chart_type='barra'):
         
     else:  # barra
         # Agrupar por cliente
-        client_summary = df_propostas.groupby('cliente').agg({
+        client_summary = df_propostas.groupby('cliente', observed=True).agg({
             'quantidade': 'sum',
             'quantidade_faturada': 'sum'
         }).reset_index()
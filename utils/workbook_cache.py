@@ -0,0 +1,126 @@
+# utils/workbook_cache.py
+
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 (motor do to_parquet/read_parquet)
+    PYARROW_AVAILABLE = True
+except ImportError:
+    print("⚠️  PyArrow não disponível. Cache Parquet das planilhas desabilitado (arquivos lidos a cada chamada).")
+    PYARROW_AVAILABLE = False
+
+# Planilhas já lidas, uma pasta por arquivo/versão com um Parquet por aba (na ordem do arquivo)
+CACHE_DIR = Path('data/cache/planilhas')
+
+def _file_hash(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            md5.update(bloco)
+    return md5.hexdigest()
+
+def _cache_entry(path, read_kwargs, cache_dir):
+    """
+    Pasta do cache de um arquivo: caminho + mtime + hash do conteúdo + opções do read_excel.
+
+    O prefixo (só do caminho) identifica as versões antigas do mesmo arquivo, apagadas ao gravar a nova.
+    """
+    caminho = str(Path(path).resolve())
+    versao = json.dumps(
+        [os.stat(path).st_mtime_ns, _file_hash(path), read_kwargs], sort_keys=True, default=str
+    )
+    prefixo = hashlib.sha1(caminho.encode('utf8')).hexdigest()[:16]
+    return Path(cache_dir) / f"{prefixo}-{hashlib.sha1(versao.encode('utf8')).hexdigest()[:16]}"
+
+def _read_cached(entry):
+    arquivos = sorted(entry.glob('*.parquet'))
+    return [pd.read_parquet(arquivo) for arquivo in arquivos]
+
+def _write_cache(entry, planilhas):
+    """
+    Grava as abas em uma pasta temporária e a publica com os.replace (leitores nunca veem metade das abas).
+
+    Returns:
+        bool: False se alguma aba não cabe em Parquet (ex.: coluna com números e textos misturados)
+    """
+    tmp = entry.with_name(f'{entry.name}.{uuid.uuid4().hex}.tmp')
+    tmp.mkdir(parents=True)
+    try:
+        for i, df in enumerate(planilhas):
+            df.to_parquet(tmp / f'{i:04d}.parquet')
+    except (TypeError, ValueError, pyarrow.ArrowException):
+        shutil.rmtree(tmp, ignore_errors=True)
+        return False
+    for antiga in entry.parent.glob(entry.name.split('-')[0] + '-*'):
+        if not antiga.name.endswith('.tmp'):
+            shutil.rmtree(antiga, ignore_errors=True)
+    try:
+        os.replace(tmp, entry)
+    except OSError:
+        # Outro processo publicou a mesma versão antes
+        shutil.rmtree(tmp, ignore_errors=True)
+    return True
+
+def _parse_file(path, read_kwargs, entry):
+    """
+    Lê todas as abas de um arquivo e grava o cache (roda nos processos do pool).
+
+    Returns:
+        tuple: ('cache', None) se o cache foi gravado; senão ('dados', [DataFrame por aba])
+    """
+    planilhas = list(pd.read_excel(path, sheet_name=None, **read_kwargs).values())
+    if entry is not None and _write_cache(entry, planilhas):
+        return 'cache', None
+    return 'dados', planilhas
+
+def read_workbooks(paths, workers=None, cache_dir=CACHE_DIR, **read_kwargs):
+    """
+    Lê todas as abas de vários arquivos Excel, reaproveitando o cache Parquet dos que não mudaram.
+
+    Os arquivos novos ou alterados são lidos em paralelo, em processos separados (o parse do Excel
+    é puro Python e não escala com threads).
+
+    Args:
+        paths: arquivos a ler
+        workers: número máximo de processos (padrão: um por CPU)
+        cache_dir: pasta do cache; None desliga o cache
+        **read_kwargs: opções repassadas ao pd.read_excel (ex.: usecols); fazem parte da chave do cache
+
+    Returns:
+        list: um DataFrame por aba, na ordem dos arquivos e das abas em cada arquivo
+    """
+    paths = [Path(path) for path in paths]
+    usar_cache = cache_dir is not None and PYARROW_AVAILABLE
+    entradas = [_cache_entry(path, read_kwargs, cache_dir) if usar_cache else None for path in paths]
+    pendentes = [i for i, entry in enumerate(entradas) if entry is None or not entry.is_dir()]
+    if usar_cache:
+        print(f"Planilhas: {len(paths) - len(pendentes)} arquivo(s) do cache, {len(pendentes)} para ler.")
+
+    resultados = {}
+    workers = min(workers or os.cpu_count() or 1, len(pendentes))
+    if workers > 1:
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as pool:
+            futuros = {i: pool.submit(_parse_file, paths[i], read_kwargs, entradas[i]) for i in pendentes}
+            resultados = {i: futuro.result() for i, futuro in futuros.items()}
+    else:
+        resultados = {i: _parse_file(paths[i], read_kwargs, entradas[i]) for i in pendentes}
+
+    planilhas = []
+    for i, entry in enumerate(entradas):
+        tipo, dados = resultados.get(i, ('cache', None))
+        if tipo == 'dados':
+            if usar_cache:
+                print(f"Planilhas: {paths[i].name} não cabe no cache Parquet; será lido de novo na próxima vez.")
+            planilhas.extend(dados)
+        else:
+            planilhas.extend(_read_cached(entry))
+    return planilhas
@@ -0,0 +1,190 @@
+# utils/xlsx_stream.py
+
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+# Leitor mínimo da primeira planilha de um .xlsx, linha a linha (iterparse). Diferente do openpyxl, só
+# converte as células das colunas pedidas: em exportações largas a maior parte das células é só pulada.
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+# Elemento raiz com as declarações de namespace (e o prefixo, se houver), repetido em volta de cada bloco
+_ROOT_RE = re.compile(rb'<([A-Za-z_][\w.-]*:)?worksheet\b[^>]*>')
+# XML descompactado lido por vez: a memória do leitor fica nesse tamanho (mais as linhas de um bloco)
+_READ_SIZE = 1 << 20
+
+def column_index(letters):
+    """'A' -> 0, 'B' -> 1, ..., 'AA' -> 26."""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+def _text(elem):
+    """Texto de um <si>/<is>: todos os <t>, sem as leituras fonéticas (<rPh>)."""
+    if elem is None:
+        return ''
+    partes = []
+    for child in elem:
+        if child.tag == f'{_NS}t':
+            partes.append(child.text or '')
+        elif child.tag == f'{_NS}r':
+            partes.append(''.join(t.text or '' for t in child.iter(f'{_NS}t')))
+    return ''.join(partes)
+
+class SheetReader:
+    """
+    Linhas da primeira planilha de um .xlsx.
+
+    keep: índices (base 0) das colunas convertidas; as demais voltam como None. Pode ser trocado entre
+    uma linha e outra (ex.: cabeçalho inteiro, depois só as colunas do schema). None converte todas.
+    """
+
+    def __init__(self, file):
+        self.keep = None
+        self._columns = {}
+        self._zip = zipfile.ZipFile(file)
+        self._sheet_path = self._first_sheet()
+        self._strings = self._shared_strings()
+        self._date_styles, self._epoch = self._styles_and_epoch()
+
+    def close(self):
+        self._zip.close()
+
+    def _first_sheet(self):
+        workbook = ET.fromstring(self._zip.read('xl/workbook.xml'))
+        rel_id = workbook.find(f'{_NS}sheets/{_NS}sheet').get(f'{_REL_NS}id')
+        rels = ET.fromstring(self._zip.read('xl/_rels/workbook.xml.rels'))
+        for rel in rels.iter(f'{_PKG_REL_NS}Relationship'):
+            if rel.get('Id') == rel_id:
+                target = rel.get('Target')
+                return target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+        raise ValueError("Planilha não encontrada no arquivo .xlsx.")
+
+    def _shared_strings(self):
+        if 'xl/sharedStrings.xml' not in self._zip.namelist():
+            return []
+        strings = []
+        with self._zip.open('xl/sharedStrings.xml') as f:
+            for _, elem in ET.iterparse(f):
+                if elem.tag == f'{_NS}si':
+                    strings.append(_text(elem))
+                    elem.clear()
+        return strings
+
+    def _styles_and_epoch(self):
+        """Índices de estilo (atributo s) com formato de data e a época do arquivo (1900 ou 1904)."""
+        workbook = ET.fromstring(self._zip.read('xl/workbook.xml'))
+        props = workbook.find(f'{_NS}workbookPr')
+        date1904 = props is not None and props.get('date1904') in ('1', 'true')
+        epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+        if 'xl/styles.xml' not in self._zip.namelist():
+            return set(), epoch
+        styles = ET.fromstring(self._zip.read('xl/styles.xml'))
+        formatos = dict(BUILTIN_FORMATS)
+        for fmt in styles.iter(f'{_NS}numFmt'):
+            formatos[int(fmt.get('numFmtId'))] = fmt.get('formatCode')
+        cell_xfs = styles.find(f'{_NS}cellXfs')
+        datas = set()
+        for i, xf in enumerate(cell_xfs if cell_xfs is not None else []):
+            codigo = formatos.get(int(xf.get('numFmtId', 0)))
+            if codigo and is_date_format(codigo):
+                datas.add(i)
+        return datas, epoch
+
+    def _value(self, cell):
+        tipo = cell.get('t', 'n')
+        if tipo == 'inlineStr':
+            return _text(cell.find(f'{_NS}is'))
+        valor = cell.find(f'{_NS}v')
+        if valor is None or valor.text is None:
+            return None
+        texto = valor.text
+        if tipo == 's':
+            return self._strings[int(texto)]
+        if tipo in ('str', 'e'):
+            return texto
+        if tipo == 'b':
+            return texto == '1'
+        if tipo == 'd':
+            return from_ISO8601(texto)
+        numero = float(texto) if any(c in texto for c in '.eE') else int(texto)
+        if int(cell.get('s', 0)) in self._date_styles:
+            return from_excel(numero, self._epoch)
+        return numero
+
+    def _row_blocks(self):
+        """
+        Blocos de linhas completas da planilha, cada um já montado como árvore XML.
+
+        O XML descompactado é lido em pedaços e cortado no último </row> de cada pedaço; o bloco é
+        analisado de uma vez pelo parser em C, em vez de um evento Python por elemento do iterparse.
+        """
+        with self._zip.open(self._sheet_path) as f:
+            buffer = f.read(_READ_SIZE)
+            raiz = _ROOT_RE.search(buffer)
+            if raiz is None:
+                raise ValueError("Planilha .xlsx sem o elemento worksheet.")
+            prefixo = raiz.group(1) or b''
+            abertura = raiz.group(0)
+            fechamento = b'</' + prefixo + b'worksheet>'
+            fim_linha = b'</' + prefixo + b'row>'
+            fim_dados = b'</' + prefixo + b'sheetData>'
+            # Início dos dados: depois de <sheetData ...>; <sheetData/> é uma planilha vazia
+            while True:
+                dados = re.search(rb'<' + re.escape(prefixo) + rb'sheetData\b[^>]*?(/?)>', buffer)
+                if dados is not None:
+                    break
+                pedaco = f.read(_READ_SIZE)
+                if not pedaco:
+                    return
+                buffer += pedaco
+            if dados.group(1):
+                return
+            buffer = buffer[dados.end():]
+            while True:
+                final = buffer.find(fim_dados)
+                if final >= 0:
+                    corte, ultimo = final, True
+                else:
+                    corte, ultimo = buffer.rfind(fim_linha), False
+                    corte = corte + len(fim_linha) if corte >= 0 else 0
+                if corte:
+                    yield ET.fromstring(abertura + buffer[:corte] + fechamento)
+                if ultimo:
+                    return
+                buffer = buffer[corte:]
+                pedaco = f.read(_READ_SIZE)
+                if not pedaco:
+                    return
+                buffer += pedaco
+
+    def rows(self):
+        """Tuplas de valores por linha, na ordem da planilha (linhas ausentes no XML não aparecem)."""
+        colunas = self._columns
+        for bloco in self._row_blocks():
+            for row in bloco:
+                keep = self.keep
+                # As células de uma linha vêm em ordem de coluna: depois da última pedida, o resto é pulado
+                ultima = max(keep, default=-1) if keep is not None else None
+                valores = {}
+                posicao = -1
+                for cell in row:
+                    ref = cell.get('r')
+                    if ref:
+                        letras = ref.rstrip('0123456789')
+                        posicao = colunas.get(letras)
+                        if posicao is None:
+                            posicao = colunas[letras] = column_index(letras)
+                    else:
+                        posicao += 1
+                    if ultima is not None and posicao > ultima:
+                        break
+                    if keep is None or posicao in keep:
+                        valores[posicao] = self._value(cell)
+                largura = max(valores) + 1 if valores else 0
+                yield tuple(valores.get(i) for i in range(largura))
@@ -9,7 +9,34 @@ server = Flask(__name__, instance_relative_config=True)
 
 server.config.update(
     SECRET_KEY='uma-chave-secreta-muito-forte-deve-ser-usada-aqui',
-    DATABASE='instance/database.sqlite'
+    DATABASE='instance/database.sqlite',
+    # Limite de memória do cache de DataFrames das tabelas limpas (0 desliga o cache)
+    DF_CACHE_MAX_BYTES=512 * 1024 * 1024,
+    # Conexões SQLite (WAL): cache de páginas em KiB, mmap em bytes, espera por lock em ms
+    # e quantas conexões de leitura ociosas o pool mantém abertas
+    SQLITE_CACHE_SIZE_KB=64 * 1024,
+    SQLITE_MMAP_SIZE=256 * 1024 * 1024,
+    SQLITE_BUSY_TIMEOUT_MS=5000,
+    SQLITE_READ_POOL_SIZE=8,
+    # Carga em massa: linhas por executemany e a partir de quantas linhas o ETL recria os índices no fim
+    BULK_INSERT_BATCH_SIZE=50_000,
+    BULK_REBUILD_INDEX_MIN_ROWS=100_000,
+    # Linhas brutas lidas, limpas e gravadas por bloco no ETL de vendas (0 processa tudo de uma vez)
+    ETL_CHUNK_SIZE=100_000,
+    # Recarga completa com vendas e cotações lidas e limpas em processos paralelos (só com 2+ núcleos)
+    ETL_PARALLEL=True,
+    # Job de ETL 'running' sem atualização por mais que isso (s) é tratado como interrompido (processo caiu)
+    ETL_JOB_STALE_SECONDS=6 * 3600,
+    # Uploads (rota /upload): tamanho máximo da requisição em bytes e idade (s) a partir da qual um arquivo
+    # do spool que nenhum callback consumiu é apagado
+    UPLOAD_MAX_BYTES=200 * 1024 * 1024,
+    UPLOAD_SPOOL_MAX_AGE_SECONDS=24 * 3600,
+    # Processos que leem os arquivos de um upload com vários arquivos (None: um por núcleo; 1 lê tudo no
+    # processo do servidor). As gravações no banco continuam uma por vez
+    UPLOAD_PARSE_WORKERS=None,
+    # Tamanho total (bytes) a partir do qual os arquivos de um upload são lidos nesses processos; abaixo
+    # disso a leitura fica no processo do servidor, sem pagar a subida do pool
+    UPLOAD_PARSE_POOL_MIN_BYTES=20 * 1024 * 1024
 )
 
 init_db_app(server)
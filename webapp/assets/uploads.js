@@ -0,0 +1,42 @@
+// webapp/assets/uploads.js
+
+// Botões com data-upload-store: os arquivos escolhidos vão em multipart para a rota /upload, que grava em
+// disco e devolve um token por arquivo. O Store indicado recebe só os tokens (o arquivo não passa pelo JSON
+// do callback em base64).
+document.addEventListener('click', function (event) {
+    var button = event.target.closest ? event.target.closest('[data-upload-store]') : null;
+    if (!button) {
+        return;
+    }
+    var storeId = button.getAttribute('data-upload-store');
+    var input = document.createElement('input');
+    input.type = 'file';
+    input.multiple = true;
+    input.accept = '.xlsx,.xls';
+    input.addEventListener('change', function () {
+        if (!input.files || !input.files.length) {
+            return;
+        }
+        var form = new FormData();
+        for (var i = 0; i < input.files.length; i++) {
+            form.append('files', input.files[i], input.files[i].name);
+        }
+        button.disabled = true;
+        fetch('/upload', {method: 'POST', body: form, credentials: 'same-origin'})
+            .then(function (response) {
+                return response.json().catch(function () {
+                    return {error: 'Falha no envio (HTTP ' + response.status + ').'};
+                });
+            })
+            .catch(function (error) {
+                return {error: 'Falha no envio: ' + error};
+            })
+            .then(function (data) {
+                button.disabled = false;
+                // sent_at: dois envios iguais seguidos ainda disparam o callback
+                data.sent_at = Date.now();
+                window.dash_clientside.set_props(storeId, {data: data});
+            });
+    });
+    input.click();
+});
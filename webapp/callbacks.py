@@ -11,7 +11,7 @@ from io import StringIO
 
 from webapp import app
 
-from utils import db, kpis, etl
+from utils import db, kpis, etl_jobs
 
 def create_interactive_table(df, table_id="interactive-table"):
     """
@@ -307,8 +307,11 @@ def create_interactive_table(df, table_id="interactive-table"):
 )
 def update_visao_geral_kpis(style):
     if style and style.get('display') == 'block':
-        df_vendas = db.get_clean_vendas_as_df()
-        df_cotacoes = db.get_clean_cotacoes_as_df()
+        # Só somas por mês: lidas do agregado mensal (vendas_mensal)
+        df_vendas = db.get_monthly_vendas_as_df(
+            columns=['valor_entrada', 'valor_carteira', 'valor_faturado', 'data_faturamento']
+        )
+        df_cotacoes = db.get_clean_cotacoes_as_df(columns=['cod_cliente'])
         print(f"[Visao Geral] Vendas: {len(df_vendas)}, Cotacoes: {len(df_cotacoes)}")
         kpis_dict = kpis.calculate_kpis_gerais(df_vendas, df_cotacoes)
         return kpis_dict['entrada_pedidos'], kpis_dict['valor_carteira'], kpis_dict['faturamento']
@@ -343,22 +346,13 @@ def update_propostas_page_visuals_callback(selected_clients, ano_filtro, mes_fil
 )
 def update_kpi_page_filter_options(style, ano_filtro, mes_filtro):
     if style and style.get('display') == 'block':
-        df_vendas = db.get_clean_vendas_as_df()
-        print(f"[KPIs Cliente] Vendas antes filtro: {len(df_vendas)}")
-        # Filtrar vendas por intervalo de ano e mês
-        # Aceita tanto valor único quanto intervalo
-        if ano_filtro:
-            if isinstance(ano_filtro, (list, tuple)) and len(ano_filtro) == 2:
-                df_vendas = df_vendas[(df_vendas['data_faturamento'].dt.year >= ano_filtro[0]) & (df_vendas['data_faturamento'].dt.year <= ano_filtro[1])]
-            else:
-                df_vendas = df_vendas[df_vendas['data_faturamento'].dt.year == ano_filtro]
-        if mes_filtro:
-            if isinstance(mes_filtro, (list, tuple)) and len(mes_filtro) == 2:
-                df_vendas = df_vendas[(df_vendas['data_faturamento'].dt.month >= mes_filtro[0]) & (df_vendas['data_faturamento'].dt.month <= mes_filtro[1])]
-            else:
-                df_vendas = df_vendas[df_vendas['data_faturamento'].dt.month == mes_filtro]
+        # Filtros de ano e mês (valor único ou intervalo) aplicados direto no SQL
+        df_vendas = db.get_clean_vendas_as_df(
+            columns=['cod_cliente', 'cliente', 'material', 'canal_distribuicao', 'data_faturamento'],
+            ano=ano_filtro, mes=mes_filtro
+        )
         print(f"[KPIs Cliente] Vendas apos filtro: {len(df_vendas)} | Ano: {ano_filtro} | Mes: {mes_filtro}")
-        df_raw_vendas = db.get_raw_data_as_df('raw_vendas')
+        df_hier_materiais = db.get_material_hierarchy()
         cliente_map = df_vendas[['cod_cliente', 'cliente']].drop_duplicates(subset=['cod_cliente'])
         cliente_options = [{'label': f"{row['cod_cliente']} - {row['cliente']}", 'value': row['cod_cliente']} for index, row in cliente_map.sort_values('cliente').iterrows()]
         # Opções de canal de vendas devem vir dos dados limpos
@@ -367,7 +361,7 @@ def update_kpi_page_filter_options(style, ano_filtro, mes_filtro):
         else:
             canal_options = []
         materiais_vendas = set(df_vendas['material'].unique())
-        df_hierarquia = df_raw_vendas[df_raw_vendas['Material'].isin(materiais_vendas)]
+        df_hierarquia = df_hier_materiais[df_hier_materiais['Material'].isin(materiais_vendas)]
         hierarquia1 = df_hierarquia['Hier. Produto 1'].dropna().unique().tolist() if 'Hier. Produto 1' in df_hierarquia.columns else []
         hierarquia2 = df_hierarquia['Hier. Produto 2'].dropna().unique().tolist() if 'Hier. Produto 2' in df_hierarquia.columns else []
         hierarquia3 = df_hierarquia['Hier. Produto 3'].dropna().unique().tolist() if 'Hier. Produto 3' in df_hierarquia.columns else []
@@ -383,36 +377,16 @@ def update_propostas_page_visuals(selected_clients, ano_filtro, mes_filtro, top_
     if not style or style.get('display') != 'block':
         raise exceptions.PreventUpdate
         
-    df_vendas = db.get_clean_vendas_as_df()
-    df_cotacoes = db.get_clean_cotacoes_as_df()
-    
-    # Aplicar filtros de ano e mês se especificados
-    if ano_filtro and isinstance(ano_filtro, (list, tuple)) and len(ano_filtro) == 2:
-        df_vendas = df_vendas[(df_vendas['data_faturamento'].dt.year >= ano_filtro[0]) & 
-                              (df_vendas['data_faturamento'].dt.year <= ano_filtro[1])]
-    elif ano_filtro:
-        df_vendas = df_vendas[df_vendas['data_faturamento'].dt.year == ano_filtro]
-        
-    if mes_filtro and isinstance(mes_filtro, (list, tuple)) and len(mes_filtro) == 2:
-        df_vendas = df_vendas[(df_vendas['data_faturamento'].dt.month >= mes_filtro[0]) & 
-                              (df_vendas['data_faturamento'].dt.month <= mes_filtro[1])]
-    elif mes_filtro:
-        df_vendas = df_vendas[df_vendas['data_faturamento'].dt.month == mes_filtro]
-    
-    # Filtrar por clientes se especificado
-    if selected_clients:
-        df_vendas = df_vendas[df_vendas['cod_cliente'].isin(selected_clients)]
-        df_cotacoes = df_cotacoes[df_cotacoes['cod_cliente'].isin(selected_clients)]
-    
-    # Filtrar por canais se especificado
-    if canais:
-        canal_col = None
-        for col in df_vendas.columns:
-            if col.lower().replace(' ', '_') == 'canal_distribuicao':
-                canal_col = col
-                break
-        if canal_col:
-            df_vendas = df_vendas[df_vendas[canal_col].isin(canais)]
+    # Período, clientes e canais são filtrados no SQL; a análise só soma as vendas por material,
+    # então elas vêm do agregado mensal (vendas_mensal)
+    df_vendas = db.get_monthly_vendas_as_df(
+        columns=['cod_cliente', 'material', 'produto', 'quantidade_faturada'],
+        ano=ano_filtro, mes=mes_filtro, clientes=selected_clients, canais=canais
+    )
+    df_cotacoes = db.get_clean_cotacoes_as_df(
+        columns=['cod_cliente', 'material', 'quantidade', 'data'],
+        clientes=selected_clients
+    )
     
     # Filtrar por hierarquia se especificado
     if hierarquias:
@@ -450,7 +424,8 @@ def update_propostas_page_visuals(selected_clients, ano_filtro, mes_filtro, top_
                     pivot_data = df_analysis.pivot_table(
                         index='material', 
                         values=['total_comprado_qtd', 'total_cotado_qtd'], 
-                        fill_value=0
+                        fill_value=0,
+                        observed=True
                     )
                     fig = px.imshow(pivot_data.values, 
                                   x=pivot_data.columns, 
@@ -484,20 +459,9 @@ def update_propostas_filter_options(style, ano_filtro, mes_filtro):
     if not style or style.get('display') != 'block':
         raise exceptions.PreventUpdate
         
-    df_vendas = db.get_clean_vendas_as_df()
-    
-    # Aplicar filtros de ano e mês se especificados
-    if ano_filtro and isinstance(ano_filtro, (list, tuple)) and len(ano_filtro) == 2:
-        df_vendas = df_vendas[(df_vendas['data_faturamento'].dt.year >= ano_filtro[0]) & 
-                              (df_vendas['data_faturamento'].dt.year <= ano_filtro[1])]
-    elif ano_filtro:
-        df_vendas = df_vendas[df_vendas['data_faturamento'].dt.year == ano_filtro]
-        
-    if mes_filtro and isinstance(mes_filtro, (list, tuple)) and len(mes_filtro) == 2:
-        df_vendas = df_vendas[(df_vendas['data_faturamento'].dt.month >= mes_filtro[0]) & 
-                              (df_vendas['data_faturamento'].dt.month <= mes_filtro[1])]
-    elif mes_filtro:
-        df_vendas = df_vendas[df_vendas['data_faturamento'].dt.month == mes_filtro]
+    df_vendas = db.get_clean_vendas_as_df(
+        columns=['cod_cliente', 'cliente'], ano=ano_filtro, mes=mes_filtro
+    )
     
     if df_vendas.empty:
         return []
@@ -562,15 +526,85 @@ def handle_deletions(user_clicks, wipe_clicks, user_id):
 
 @app.callback(
     Output('config-feedback-msg', 'children', allow_duplicate=True),
+    Output('store-etl-job-id', 'data'),
     Input('run-etl-button', 'n_clicks'),
+    Input('run-full-etl-button', 'n_clicks'),
     prevent_initial_call=True
 )
-def run_etl_callback(n_clicks):
+def run_etl_callback(n_clicks, full_clicks):
     try:
-        result_message = etl.run_full_etl()
-        return dbc.Alert(result_message, color="success")
+        # O botão principal só transforma os arquivos novos; "Reconstruir Tudo" refaz as tabelas limpas
+        job_id = etl_jobs.start_etl_job(
+            incremental=callback_context.triggered_id != 'run-full-etl-button', user_id=session.get('user_id')
+        )
     except Exception as e:
-        return dbc.Alert(str(e), color="danger")
+        return dbc.Alert(str(e), color="danger"), dash.no_update
+    if job_id is None:
+        return dbc.Alert("Já existe um processamento em andamento. Aguarde a conclusão.", color="warning"), dash.no_update
+    return None, job_id
+
+@app.callback(
+    Output('etl-job-status', 'children'),
+    Output('etl-job-interval', 'disabled'),
+    Input('etl-job-interval', 'n_intervals'),
+    Input('store-etl-job-id', 'data'),
+    Input('page-config-content', 'style')
+)
+def update_etl_job_status(n_intervals, job_id, style):
+    if style and style.get('display') == 'none':
+        return dash.no_update, True
+    # Sem job disparado nesta página, mostra o último (que pode ter sido iniciado por outro usuário)
+    job = etl_jobs.get_job_status(job_id)
+    if job is None:
+        return None, True
+    elapsed = f"{job['elapsed']:.0f}s"
+    if job['status'] == 'running':
+        return dbc.Alert([
+            dbc.Spinner(size="sm", spinner_class_name="me-2"),
+            f"Processando ({job['mode']}): {job['stage']} — {job['rows_processed']:,} linhas, {elapsed}. "
+            "Os dashboards continuam com os dados anteriores até o fim do processamento."
+        ], color="info"), False
+    if job['status'] == 'done':
+        return dbc.Alert(f"{job['message']} ({elapsed})", color="success"), True
+    return dbc.Alert(f"Erro no processamento: {job['message']}", color="danger"), True
+
+# Colunas das etapas do ETL (etl.ETL_STAGES) no histórico da página de configurações
+ETL_STAGE_LABELS = {
+    'leitura': 'Leitura', 'tipos': 'Tipos', 'datas': 'Datas', 'dedup': 'Filtros', 'espera': 'Espera', 'gravacao': 'Gravação',
+}
+
+@app.callback(
+    Output('etl-runs-table-container', 'children'),
+    Input('page-config-content', 'style'),
+    Input('etl-job-interval', 'disabled')
+)
+def load_etl_runs_table(style, polling_disabled):
+    # Atualiza ao abrir a página e quando um processamento termina (o polling é desligado)
+    if not (style and style.get('display') == 'block') or polling_disabled is False:
+        raise exceptions.PreventUpdate
+    try:
+        runs = db.get_etl_runs(limit=20)
+    except Exception:
+        # Banco de uma versão anterior, sem etl_runs: a tabela é criada no primeiro processamento
+        runs = []
+    if not runs:
+        return html.P("Nenhum processamento registrado ainda.", className="text-muted")
+    header = html.Thead(html.Tr(
+        [html.Th("Início (UTC)"), html.Th("Tabela"), html.Th("Modo"), html.Th("Linhas (entrada → saída)"), html.Th("Total")]
+        + [html.Th(label) for label in ETL_STAGE_LABELS.values()]
+        + [html.Th("Linhas descartadas"), html.Th("Pico de memória")]
+    ))
+    body = html.Tbody([
+        html.Tr(
+            [html.Td(run['started_at']), html.Td(run['table_name']), html.Td(run['mode']),
+             html.Td(f"{run['rows_in']:,} → {run['rows_out']:,}"), html.Td(f"{run['seconds']:.1f}s")]
+            + [html.Td(f"{run['stage_seconds'][etapa]:.1f}s" if etapa in run['stage_seconds'] else "-") for etapa in ETL_STAGE_LABELS]
+            + [html.Td("; ".join(f"{regra}: {linhas:,}" for regra, linhas in run['dropped_rows'].items()) or "-"),
+               html.Td(f"{run['peak_rss_mb']} MB" if run['peak_rss_mb'] is not None else "-")]
+        )
+        for run in runs
+    ])
+    return dbc.Table([header, body], bordered=True, striped=True, size="sm", responsive=True)
 
 @app.callback(
     Output('grafico-scatter-kpis-cliente', 'figure'),
@@ -587,97 +621,55 @@ def run_etl_callback(n_clicks):
     Input('page-kpis-cliente-content', 'style')
 )
 def update_kpis_cliente_visuals(ano_filtro, mes_filtro, clientes, canais, dias_sem_compra, hierarquias, top_n, historico_kpis, style):
-    # Carregar dados limpos
-    df_vendas_original = db.get_clean_vendas_as_df()
-    df_cotacoes_original = db.get_clean_cotacoes_as_df()
+    # Carregar dados limpos já filtrados por período, clientes e canal (filtros aplicados no SQL)
+    df_vendas = db.get_clean_vendas_as_df(
+        columns=['cod_cliente', 'cliente', 'material', 'produto', 'unidade_negocio', 'canal_distribuicao',
+                 'data_faturamento', 'quantidade_faturada', 'valor_faturado'],
+        ano=ano_filtro, mes=mes_filtro, clientes=clientes, canais=canais
+    )
+    df_cotacoes = db.get_clean_cotacoes_as_df(
+        columns=['cod_cliente', 'cliente', 'material', 'data', 'quantidade'],
+        ano=ano_filtro, mes=mes_filtro, clientes=clientes
+    )
     
-    print(f'DEBUG - Registros originais: vendas={len(df_vendas_original)}, cotacoes={len(df_cotacoes_original)}')
     print(f'DEBUG - Filtros recebidos: ano={ano_filtro}, mes={mes_filtro}, hierarquias={hierarquias}, top_n={top_n}')
+    print(f'DEBUG - Registros após filtros SQL: vendas={len(df_vendas)}, cotacoes={len(df_cotacoes)}')
     
-    # Trabalhar com cópias para manter dados originais
-    df_vendas = df_vendas_original.copy()
-    df_cotacoes = df_cotacoes_original.copy()
-    
-    # Converter datas uma vez só no início
+    # Remover datas inválidas (quando não há filtro de ano o SQL não exclui os nulos)
     if 'data_faturamento' in df_vendas.columns:
-        df_vendas['data_faturamento'] = pd.to_datetime(df_vendas['data_faturamento'], errors='coerce')
-        df_vendas = df_vendas.dropna(subset=['data_faturamento'])  # Remover datas inválidas
-        print(f'DEBUG - Após limpeza de datas: {len(df_vendas)} registros em vendas')
+        df_vendas = df_vendas.dropna(subset=['data_faturamento'])
     
     if 'data' in df_cotacoes.columns:
-        df_cotacoes['data'] = pd.to_datetime(df_cotacoes['data'], errors='coerce')
         df_cotacoes = df_cotacoes.dropna(subset=['data'])
-        print(f'DEBUG - Após limpeza de datas: {len(df_cotacoes)} registros em cotações')
-    
-    # === APLICAR FILTROS DE FORMA INDEPENDENTE ===
     
-    # 1. Filtro de ANO
-    if ano_filtro:
-        if isinstance(ano_filtro, (list, tuple)) and len(ano_filtro) == 2:
-            # Range de anos
-            df_vendas = df_vendas[(df_vendas['data_faturamento'].dt.year >= ano_filtro[0]) & 
-                                 (df_vendas['data_faturamento'].dt.year <= ano_filtro[1])]
-            if 'data' in df_cotacoes.columns:
-                df_cotacoes = df_cotacoes[(df_cotacoes['data'].dt.year >= ano_filtro[0]) & 
-                                         (df_cotacoes['data'].dt.year <= ano_filtro[1])]
-        else:
-            # Ano específico
-            df_vendas = df_vendas[df_vendas['data_faturamento'].dt.year == ano_filtro]
-            if 'data' in df_cotacoes.columns:
-                df_cotacoes = df_cotacoes[df_cotacoes['data'].dt.year == ano_filtro]
-        
-        print(f'DEBUG - Após filtro de ano {ano_filtro}: vendas={len(df_vendas)}, cotacoes={len(df_cotacoes)}')
-    
-    # 2. Filtro de MÊS
-    if mes_filtro:
-        if isinstance(mes_filtro, (list, tuple)) and len(mes_filtro) == 2:
-            # Range de meses
-            df_vendas = df_vendas[(df_vendas['data_faturamento'].dt.month >= mes_filtro[0]) & 
-                                 (df_vendas['data_faturamento'].dt.month <= mes_filtro[1])]
-            if 'data' in df_cotacoes.columns:
-                df_cotacoes = df_cotacoes[(df_cotacoes['data'].dt.month >= mes_filtro[0]) & 
-                                         (df_cotacoes['data'].dt.month <= mes_filtro[1])]
-        else:
-            # Mês específico
-            df_vendas = df_vendas[df_vendas['data_faturamento'].dt.month == mes_filtro]
-            if 'data' in df_cotacoes.columns:
-                df_cotacoes = df_cotacoes[df_cotacoes['data'].dt.month == mes_filtro]
-        
-        print(f'DEBUG - Após filtro de mês {mes_filtro}: vendas={len(df_vendas)}, cotacoes={len(df_cotacoes)}')
-    
-    # 3. Filtro de CLIENTES
-    if clientes:
-        df_vendas = df_vendas[df_vendas['cod_cliente'].isin(clientes)]
-        df_cotacoes = df_cotacoes[df_cotacoes['cod_cliente'].isin(clientes)]
-        print(f'DEBUG - Após filtro de clientes: vendas={len(df_vendas)}, cotacoes={len(df_cotacoes)}')
-    # 4. Filtro de HIERARQUIA/PRODUTO - USAR df_raw_vendas e mapear para vendas
+    # 4. Filtro de HIERARQUIA/PRODUTO - hierarquia por material (dim_material) mapeada para vendas
     if hierarquias:
         print(f'DEBUG - Aplicando filtro de hierarquia: {hierarquias}')
         print(f'DEBUG - Registros antes do filtro de hierarquia: {len(df_vendas)}')
         
-        # Carregar dados raw para obter informações de hierarquia
+        # Carregar a hierarquia de produto por material
         try:
-            df_raw_vendas = db.get_raw_data_as_df('raw_vendas')
+            df_hier_materiais = db.get_material_hierarchy()
             
-            if not df_raw_vendas.empty:
-                print(f'DEBUG - Usando df_raw_vendas para filtro de hierarquia')
+            if not df_hier_materiais.empty:
+                print(f'DEBUG - Usando df_hier_materiais para filtro de hierarquia')
                 
-                # Criar máscara para hierarquias nos dados raw
-                mask_hierarquia = pd.Series(False, index=df_raw_vendas.index)
+                # Criar máscara para hierarquias por material
+                mask_hierarquia = pd.Series(False, index=df_hier_materiais.index)
                 
                 # Verificar colunas de hierarquia disponíveis
-                colunas_hier = [col for col in df_raw_vendas.columns if 'Hier. Produto' in col]
+                colunas_hier = [col for col in df_hier_materiais.columns if 'Hier. Produto' in col]
                 print(f'DEBUG - Colunas de hierarquia encontradas no raw: {colunas_hier}')
                 
                 for hierarquia in hierarquias:
                     for col_hier in colunas_hier:
-                        mask_temp = df_raw_vendas[col_hier].str.contains(str(hierarquia), case=False, na=False)
+                        mask_temp = df_hier_materiais[col_hier].str.contains(str(hierarquia), case=False, na=False)
                         registros_encontrados = mask_temp.sum()
                         print(f'DEBUG - Hierarquia "{hierarquia}" em coluna "{col_hier}": {registros_encontrados} registros')
                         mask_hierarquia |= mask_temp
                 
                 # Obter materiais que atendem ao filtro de hierarquia
-                materiais_filtrados = df_raw_vendas[mask_hierarquia]['Material'].unique()
+                materiais_filtrados = df_hier_materiais[mask_hierarquia]['Material'].unique()
                 print(f'DEBUG - Materiais filtrados por hierarquia: {len(materiais_filtrados)}')
                 
                 # Aplicar filtro de materiais no df_vendas
@@ -694,10 +686,10 @@ def update_kpis_cliente_visuals(ano_filtro, mes_filtro, clientes, canais, dias_s
                     print(f'DEBUG - ERRO: Nenhum material encontrado para hierarquias: {hierarquias}')
                     df_vendas = df_vendas.iloc[:0]  # DataFrame vazio
             else:
-                print(f'DEBUG - df_raw_vendas vazio, tentando filtro direto')
-                raise Exception("df_raw_vendas vazio")
+                print(f'DEBUG - df_hier_materiais vazio, tentando filtro direto')
+                raise Exception("df_hier_materiais vazio")
         except Exception as e:
-            print(f'DEBUG - Erro ao carregar df_raw_vendas: {e}, tentando filtro direto')
+            print(f'DEBUG - Erro ao carregar df_hier_materiais: {e}, tentando filtro direto')
             # Fallback: tentar filtro direto nas colunas disponíveis
             colunas_possiveis = [
                 'Hier. Produto 1', 'hier_produto_1', 'hierarquia_produto_1',
@@ -729,18 +721,6 @@ def update_kpis_cliente_visuals(ano_filtro, mes_filtro, clientes, canais, dias_s
                 print('ERRO - Nenhuma coluna apropriada encontrada para filtro de hierarquia')
                 print(f'DEBUG - Colunas existentes: {df_vendas.columns.tolist()}')
     
-    # 5. Filtro de CANAL DE VENDAS
-    if canais:
-        canal_col = None
-        for col in df_vendas.columns:
-            if col.lower().replace(' ', '_') == 'canal_distribuicao':
-                canal_col = col
-                break
-        if canal_col:
-            df_vendas = df_vendas[df_vendas[canal_col].isin(canais)]
-            print(f'DEBUG - Após filtro de canal: {len(df_vendas)} registros')
-        else:
-            print('DEBUG - Coluna de canal de vendas não encontrada')
     df_kpis = kpis.calculate_kpis_por_cliente(df_vendas, df_cotacoes)
     print(f'DEBUG - KPIs calculados para {len(df_kpis)} clientes')
     if not df_kpis.empty:
@@ -887,7 +867,7 @@ def update_kpis_cliente_visuals(ano_filtro, mes_filtro, clientes, canais, dias_s
                 df_hist_kpis = pd.concat(dados_historicos, ignore_index=True)
                 
                 # Criar identificador único combinando código + nome para distinguir clientes com mesmo nome
-                df_hist_kpis['cliente_id'] = df_hist_kpis['cod_cliente'].astype(str) + ' - ' + df_hist_kpis['cliente']
+                df_hist_kpis['cliente_id'] = df_hist_kpis['cod_cliente'].astype(str) + ' - ' + df_hist_kpis['cliente'].astype(object)
                 
                 # Para a legenda, verificar se há nomes duplicados
                 nomes_duplicados = df_hist_kpis['cliente'].duplicated(keep=False)
@@ -905,7 +885,7 @@ def update_kpis_cliente_visuals(ano_filtro, mes_filtro, clientes, canais, dias_s
                     # Filtrar apenas para os clientes que estão nos KPIs filtrados
                     if not df_kpis.empty:
                         # Criar o mesmo identificador único para os KPIs filtrados
-                        df_kpis['cliente_id'] = df_kpis['cod_cliente'].astype(str) + ' - ' + df_kpis['cliente']
+                        df_kpis['cliente_id'] = df_kpis['cod_cliente'].astype(str) + ' - ' + df_kpis['cliente'].astype(object)
                         clientes_kpis_ids = df_kpis['cliente_id'].unique()
                         df_hist_kpis = df_hist_kpis[df_hist_kpis['cliente_id'].isin(clientes_kpis_ids)]
                     
@@ -1023,32 +1003,6 @@ def update_kpis_cliente_visuals(ano_filtro, mes_filtro, clientes, canais, dias_s
         fig_hist = {}
     return fig_scatter, tabela, fig_hist
 
-# Exemplo de callback para upload de vendas
-@app.callback(
-    Output('upload-feedback-msg', 'children'),
-    Input('upload-vendas', 'contents'),
-    State('upload-vendas', 'filename'),
-    State('session-user-id', 'data'),
-    prevent_initial_call=True
-)
-def upload_vendas_callback(contents, filename, user_id):
-    if not contents:
-        return dbc.Alert('Nenhum arquivo enviado.', color='warning')
-    try:
-        from utils.data_loader import parse_upload_content, read_raw_vendas, generate_fingerprint
-        file_bytes_io = parse_upload_content(contents)
-        df = read_raw_vendas(file_bytes_io)
-        fingerprint = generate_fingerprint(file_bytes_io)
-        linhas_inseridas = db.insert_raw_df(df, 'raw_vendas', filename, fingerprint, user_id)
-        print(f"Linhas inseridas em raw_vendas: {linhas_inseridas}")
-        if linhas_inseridas == 0:
-            return dbc.Alert("Erro ao inserir dados no banco. Verifique o arquivo e tente novamente.", color="danger")
-        else:
-            return dbc.Alert(f"Upload realizado com sucesso! {linhas_inseridas} linhas inseridas.", color="success")
-    except Exception as e:
-        print(f"Erro no upload: {e}")
-        return dbc.Alert(f"Erro no upload: {e}", color="danger")
-
 # --- CALLBACKS PARA PÁGINA DE PRODUTOS (BOLHAS) ---
 @app.callback(
     Output('grafico-bolhas-produtos', 'figure'),
@@ -1067,22 +1021,17 @@ def update_produtos_bubble_chart(ano, unidades, top_produtos, top_clientes, pale
         from utils.visualizations import create_bubble_chart
         from utils.kpis import calculate_produtos_matrix
         
-        df_vendas = db.get_clean_vendas_as_df()
-        df_cotacoes = db.get_clean_cotacoes_as_df()
-        
-        # Filtrar por ano se especificado
-        if ano and ano != "__ALL__":
-            if 'data_faturamento' in df_vendas.columns:
-                df_vendas = df_vendas[pd.to_datetime(df_vendas['data_faturamento']).dt.year == int(ano)]
-            if 'data' in df_cotacoes.columns:
-                df_cotacoes = df_cotacoes[pd.to_datetime(df_cotacoes['data']).dt.year == int(ano)]
-        
-        # Filtrar por unidade de negócio
-        if unidades:
-            if 'unidade_negocio' in df_vendas.columns:
-                df_vendas = df_vendas[df_vendas['unidade_negocio'].isin(unidades)]
-            if 'unidade_negocio' in df_cotacoes.columns:
-                df_cotacoes = df_cotacoes[df_cotacoes['unidade_negocio'].isin(unidades)]
+        # Filtros de ano e unidade de negócio aplicados no SQL; a matriz só soma quantidades por
+        # cliente e material, então a leitura vem dos agregados mensais
+        ano_sql = int(ano) if ano and ano != "__ALL__" else None
+        df_vendas = db.get_monthly_vendas_as_df(
+            columns=['cod_cliente', 'material', 'quantidade_faturada'],
+            ano=ano_sql, unidades=unidades
+        )
+        df_cotacoes = db.get_monthly_cotacoes_as_df(
+            columns=['cod_cliente', 'cliente', 'material', 'quantidade'],
+            ano=ano_sql, unidades=unidades
+        )
         
         # Calcular matriz de produtos
         df_matrix = calculate_produtos_matrix(
@@ -1108,8 +1057,8 @@ def update_produtos_bubble_chart(ano, unidades, top_produtos, top_clientes, pale
 def update_un_options_produtos(style):
     if style and style.get('display') == 'block':
         try:
-            df_vendas = db.get_clean_vendas_as_df()
-            df_cotacoes = db.get_clean_cotacoes_as_df()
+            df_vendas = db.get_clean_vendas_as_df(columns=['unidade_negocio'])
+            df_cotacoes = db.get_clean_cotacoes_as_df(columns=['unidade_negocio'])
             
             unidades = set()
             if 'unidade_negocio' in df_vendas.columns:
@@ -1138,21 +1087,16 @@ def download_produtos_csv(n_clicks, ano, unidades, top_produtos, top_clientes):
     try:
         from utils.kpis import calculate_produtos_matrix
         
-        df_vendas = db.get_clean_vendas_as_df()
-        df_cotacoes = db.get_clean_cotacoes_as_df()
-        
         # Aplicar filtros (mesmo código do gráfico)
-        if ano and ano != "__ALL__":
-            if 'data_faturamento' in df_vendas.columns:
-                df_vendas = df_vendas[pd.to_datetime(df_vendas['data_faturamento']).dt.year == int(ano)]
-            if 'data' in df_cotacoes.columns:
-                df_cotacoes = df_cotacoes[pd.to_datetime(df_cotacoes['data']).dt.year == int(ano)]
-        
-        if unidades:
-            if 'unidade_negocio' in df_vendas.columns:
-                df_vendas = df_vendas[df_vendas['unidade_negocio'].isin(unidades)]
-            if 'unidade_negocio' in df_cotacoes.columns:
-                df_cotacoes = df_cotacoes[df_cotacoes['unidade_negocio'].isin(unidades)]
+        ano_sql = int(ano) if ano and ano != "__ALL__" else None
+        df_vendas = db.get_monthly_vendas_as_df(
+            columns=['cod_cliente', 'material', 'quantidade_faturada'],
+            ano=ano_sql, unidades=unidades
+        )
+        df_cotacoes = db.get_monthly_cotacoes_as_df(
+            columns=['cod_cliente', 'cliente', 'material', 'quantidade'],
+            ano=ano_sql, unidades=unidades
+        )
         
         df_matrix = calculate_produtos_matrix(
             df_vendas, df_cotacoes,
@@ -1170,6 +1114,19 @@ def download_produtos_csv(n_clicks, ano, unidades, top_produtos, top_clientes):
         raise exceptions.PreventUpdate
 
 # --- CALLBACKS PARA PÁGINA DE FUNIL & AÇÕES ---
+def _load_funil_data(periodo_meses):
+    """Carrega apenas o período e as colunas usadas por calculate_funil_metrics."""
+    data_limite = datetime.now() - pd.DateOffset(months=periodo_meses)
+    df_vendas = db.get_clean_vendas_as_df(
+        columns=['cod_cliente', 'quantidade_faturada', 'data_faturamento'],
+        data_inicio=data_limite
+    )
+    df_cotacoes = db.get_clean_cotacoes_as_df(
+        columns=['cod_cliente', 'cliente', 'quantidade', 'data'],
+        data_inicio=data_limite
+    )
+    return df_vendas, df_cotacoes
+
 @app.callback(
     Output('metricas-funil', 'children'),
     Output('lista-a-container', 'children'),
@@ -1188,8 +1145,7 @@ def update_funil_analysis(periodo, threshold_conversao, threshold_dias, style):
         from utils.kpis import calculate_funil_metrics
         from utils.visualizations import create_funnel_chart
         
-        df_vendas = db.get_clean_vendas_as_df()
-        df_cotacoes = db.get_clean_cotacoes_as_df()
+        df_vendas, df_cotacoes = _load_funil_data(periodo or 12)
         
         # Calcular métricas do funil
         funil_metrics = calculate_funil_metrics(
@@ -1287,8 +1243,7 @@ def download_lista_a(n_clicks, periodo, threshold_conversao, threshold_dias):
     try:
         from utils.kpis import calculate_funil_metrics
         
-        df_vendas = db.get_clean_vendas_as_df()
-        df_cotacoes = db.get_clean_cotacoes_as_df()
+        df_vendas, df_cotacoes = _load_funil_data(periodo or 12)
         
         funil_metrics = calculate_funil_metrics(
             df_vendas, df_cotacoes,
@@ -1322,8 +1277,7 @@ def download_lista_b(n_clicks, periodo, threshold_conversao, threshold_dias):
     try:
         from utils.kpis import calculate_funil_metrics
         
-        df_vendas = db.get_clean_vendas_as_df()
-        df_cotacoes = db.get_clean_cotacoes_as_df()
+        df_vendas, df_cotacoes = _load_funil_data(periodo or 12)
         
         funil_metrics = calculate_funil_metrics(
             df_vendas, df_cotacoes,
@@ -1356,17 +1310,13 @@ def generate_client_pdf_report(n_clicks, ano):
     try:
         from utils.report import generate_client_pdf, create_chart_for_pdf
         
-        df_vendas = db.get_clean_vendas_as_df()
-        df_cotacoes = db.get_clean_cotacoes_as_df()
-        
-        # Filtrar por ano se especificado
-        if ano and ano != "__ALL__":
-            if 'data_faturamento' in df_vendas.columns:
-                df_vendas = df_vendas[pd.to_datetime(df_vendas['data_faturamento']).dt.year == int(ano)]
+        # Filtrar por ano se especificado (aplicado no SQL)
+        ano_sql = int(ano) if ano and ano != "__ALL__" else None
+        df_vendas = db.get_clean_vendas_as_df(ano=ano_sql)
         
         # Pegar o cliente com maior volume (exemplo)
         if not df_vendas.empty:
-            top_client = df_vendas.groupby(['cod_cliente', 'cliente'])['valor_faturado'].sum().idxmax()
+            top_client = df_vendas.groupby(['cod_cliente', 'cliente'], observed=True)['valor_faturado'].sum().idxmax()
             client_code, client_name = top_client
             client_data = df_vendas[df_vendas['cod_cliente'] == client_code]
             
@@ -47,37 +47,27 @@ def generate_suggestion_list(n_clicks, ano_filtro, mes_filtro):
         raise exceptions.PreventUpdate
     
     try:
-        df_vendas = db.get_clean_vendas_as_df()
-        df_cotacoes = db.get_clean_cotacoes_as_df()
+        df_vendas = db.get_clean_vendas_as_df(columns=['cod_cliente', 'material', 'quantidade_faturada'])
         
-        # Filtrar por período se especificado
+        # Filtrar por período se especificado (ano e mês pré-calculados, filtrados no SQL)
+        filtros_periodo = {}
         if ano_filtro and isinstance(ano_filtro, (list, tuple)) and len(ano_filtro) == 2:
-            if 'data' in df_cotacoes.columns:
-                df_cotacoes_filtered = df_cotacoes[
-                    (pd.to_datetime(df_cotacoes['data']).dt.year >= ano_filtro[0]) &
-                    (pd.to_datetime(df_cotacoes['data']).dt.year <= ano_filtro[1])
-                ]
-            else:
-                df_cotacoes_filtered = df_cotacoes
-                
+            filtros_periodo['ano'] = ano_filtro
             if mes_filtro and isinstance(mes_filtro, (list, tuple)) and len(mes_filtro) == 2:
-                if 'data' in df_cotacoes_filtered.columns:
-                    df_cotacoes_filtered = df_cotacoes_filtered[
-                        (pd.to_datetime(df_cotacoes_filtered['data']).dt.month >= mes_filtro[0]) &
-                        (pd.to_datetime(df_cotacoes_filtered['data']).dt.month <= mes_filtro[1])
-                    ]
-        else:
-            df_cotacoes_filtered = df_cotacoes
+                filtros_periodo['mes'] = mes_filtro
+        df_cotacoes_filtered = db.get_clean_cotacoes_as_df(
+            columns=['cod_cliente', 'material', 'quantidade'], **filtros_periodo
+        )
         
         # Analisar produtos mais cotados vs menos vendidos
-        cotacoes_summary = df_cotacoes_filtered.groupby('material').agg({
+        cotacoes_summary = df_cotacoes_filtered.groupby('material', observed=True).agg({
             'quantidade': 'sum',
             'cod_cliente': 'nunique'
         }).reset_index()
         cotacoes_summary.columns = ['material', 'qtd_cotada_total', 'num_clientes_cotaram']
         
         if not df_vendas.empty:
-            vendas_summary = df_vendas.groupby('material').agg({
+            vendas_summary = df_vendas.groupby('material', observed=True).agg({
                 'quantidade_faturada': 'sum',
                 'cod_cliente': 'nunique'
             }).reset_index()
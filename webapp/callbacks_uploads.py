@@ -1,105 +1,139 @@
 # webapp/callbacks_uploads.py
 
+import time
 from dash import Output, Input, State, html
 import dash_bootstrap_components as dbc
-from flask import session
-import hashlib
+from flask import current_app, jsonify, request, session
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from webapp import app
-from utils import data_loader, db
+from webapp import app, server
+from utils import uploads
+
+@server.route('/upload', methods=['POST'])
+def upload_files():
+    """Recebe os arquivos dos botões de upload (assets/uploads.js) e devolve um token por arquivo."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify(error="Sessão inválida."), 401
+    inicio = time.perf_counter()
+    try:
+        recebidos = uploads.receive_uploads(request.environ, user_id)
+    except RequestEntityTooLarge:
+        # Também vem do MAX_CONTENT_LENGTH do Flask ou do limite dos campos de formulário, com UPLOAD_MAX_BYTES vazio
+        limite = current_app.config.get('UPLOAD_MAX_BYTES') or current_app.config.get('MAX_CONTENT_LENGTH')
+        tamanho = f" de {-(-limite // (1024 * 1024))} MB" if limite else ""
+        return jsonify(error=f"Envio maior que o limite{tamanho}. Selecione menos arquivos por vez."), 413
+    except ValueError as e:
+        return jsonify(error=f"Envio inválido: {e}"), 400
+    # Tempo do recebimento (envio e MD5), repassado ao callback para o relatório de tempos do upload
+    return jsonify(uploads=recebidos, seconds=round(time.perf_counter() - inicio, 3))
+
+def _upload_error(upload):
+    """Alert de erro do envio pela rota /upload, ou None se há arquivos recebidos."""
+    if not upload or upload.get('error') or not upload.get('uploads'):
+        erro = (upload or {}).get('error') or "Erro no upload. Por favor, tente selecionar o arquivo novamente."
+        return dbc.Alert(erro, color="warning")
+    return None
+
+NOMES_FASES = {
+    'recebimento': 'recebimento', 'verificacao': 'verificação', 'processos': 'processos', 'leitura': 'leitura',
+    'gravacao': 'gravação'
+}
+
+def _resumo_tempos(timings):
+    fases = ' · '.join(f"{nome} {timings[fase]:.2f}s" for fase, nome in NOMES_FASES.items())
+    return html.Small(f"Tempos do upload: {fases} (total {timings['total']:.2f}s)", className="text-muted")
+
+def _import_uploads(upload, user_id, classify, mensagens):
+    """
+    Processa os arquivos recebidos com uploads.UploadPipeline e monta as mensagens para a tela.
+
+    mensagens tem os Alerts de resultado ('ok', 'sem_novas', 'recusado', 'erro', 'ja_carregado', 'falha').
+    Devolve uma mensagem por arquivo, na ordem do upload, e o resumo dos tempos por etapa.
+    """
+    pipeline = uploads.UploadPipeline(user_id, classify)
+    messages = []
+    for resultado in pipeline.run(upload['uploads'], upload.get('seconds') or 0.0):
+        filename = resultado['filename']
+        if resultado['status'] == 'recusado':
+            messages.append(mensagens['recusado'](filename))
+        elif resultado['status'] == 'duplicado':
+            messages.append(mensagens['ja_carregado'](filename))
+        elif resultado['status'] == 'erro':
+            messages.append(mensagens['erro'](filename, resultado['error']))
+        elif resultado['rows'] > 0:
+            messages.append(mensagens['ok'](filename, resultado['rows'], resultado['table_name'], resultado['skipped']))
+        elif resultado['skipped'] > 0:
+            # Reexportação sem nenhuma linha nova: todas já vieram de outros arquivos
+            messages.append(mensagens['sem_novas'](filename, resultado['skipped']))
+        else:
+            messages.append(mensagens['falha'](filename))
+    return messages + [_resumo_tempos(pipeline.timings)]
+
+def _classify_vendas(filename):
+    if not (filename.endswith('.xlsx') or filename.endswith('.xls')):
+        return None
+    return 'raw_vendas'
+
+def _classify_cotacoes(filename):
+    # Identifica o tipo de arquivo pelo nome
+    if 'materiais_cotados' in filename:
+        return 'raw_materiais_cotados'
+    if any(char.isdigit() for char in filename) and ('.xls' in filename or '.xlsx' in filename):
+        return 'raw_propostas_anuais'
+    return None
+
+def _ignoradas(skipped):
+    """Complemento da mensagem de sucesso com as linhas que já estavam no banco (períodos sobrepostos)."""
+    return f" {skipped} linhas já carregadas por outros arquivos foram ignoradas." if skipped else ""
+
+MENSAGENS_VENDAS = {
+    'ok': lambda filename, rows, table_name, skipped: dbc.Alert(f"Arquivo de vendas '{filename}' carregado! {rows} registros brutos salvos.{_ignoradas(skipped)}", color="success"),
+    'sem_novas': lambda filename, skipped: dbc.Alert(f"O arquivo '{filename}' não tem linhas novas: as {skipped} linhas já foram carregadas por outros arquivos.", color="warning"),
+    'recusado': lambda filename: dbc.Alert(f"Erro em '{filename}': Apenas arquivos .xlsx ou .xls são permitidos.", color="danger"),
+    'falha': lambda filename: dbc.Alert(f"Erro ao salvar dados brutos do arquivo '{filename}'.", color="danger"),
+    'ja_carregado': lambda filename: dbc.Alert(f"O arquivo '{filename}' já foi carregado.", color="warning"),
+    'erro': lambda filename, e: dbc.Alert(f"Erro ao processar o arquivo de vendas '{filename}': {e}", color="danger"),
+}
+
+MENSAGENS_COTACOES = {
+    'ok': lambda filename, rows, table_name, skipped: dbc.Alert(f"Arquivo '{filename}' carregado! {rows} registros brutos salvos em '{table_name}'.{_ignoradas(skipped)}", color="success"),
+    'sem_novas': lambda filename, skipped: dbc.Alert(f"O arquivo '{filename}' não tem linhas novas: as {skipped} linhas já foram carregadas por outros arquivos.", color="warning"),
+    'recusado': lambda filename: dbc.Alert(f"Arquivo '{filename}' não reconhecido e foi ignorado.", color="warning"),
+    'falha': lambda filename: dbc.Alert(f"Erro ao salvar dados brutos do arquivo '{filename}'.", color="danger"),
+    'ja_carregado': lambda filename: dbc.Alert(f"O arquivo '{filename}' já foi carregado.", color="warning"),
+    'erro': lambda filename, e: dbc.Alert(f"Erro ao processar '{filename}': {e}", color="danger"),
+}
 
 @app.callback(
     Output('upload-msgs', 'children', allow_duplicate=True),
-    Input('upload-vendas', 'contents'),
-    Input('upload-vendas', 'filename'),
+    Input('upload-vendas-tokens', 'data'),
     prevent_initial_call=True
 )
-def on_upload_vendas(contents_list, filenames_list):
-    if not contents_list or not filenames_list:
-        return dbc.Alert("Erro no upload. Por favor, tente selecionar o arquivo novamente.", color="warning")
+def on_upload_vendas(upload):
+    erro = _upload_error(upload)
+    if erro:
+        return erro
     
     user_id = session.get('user_id')
     if not user_id: 
         return dbc.Alert("Sessão inválida.", color="danger")
 
-    messages = []
-    for contents, filename in zip(contents_list, filenames_list):
-        if not (filename.endswith('.xlsx') or filename.endswith('.xls')):
-            messages.append(dbc.Alert(f"Erro em '{filename}': Apenas arquivos .xlsx ou .xls são permitidos.", color="danger"))
-            continue
-
-        try:
-            file_io = data_loader.parse_upload_content(contents)
-            fingerprint = data_loader.generate_fingerprint(file_io)
-
-            if db.check_raw_fingerprint_exists(fingerprint, 'raw_vendas'):
-                messages.append(dbc.Alert(f"O arquivo '{filename}' já foi carregado.", color="warning"))
-                continue
-            
-            df = data_loader.read_raw_vendas(file_io)
-            rows_inserted = db.insert_raw_df(df, 'raw_vendas', filename, fingerprint, user_id)
-
-            if rows_inserted > 0:
-                messages.append(dbc.Alert(f"Arquivo de vendas '{filename}' carregado! {rows_inserted} registros brutos salvos.", color="success"))
-            else:
-                messages.append(dbc.Alert(f"Erro ao salvar dados brutos do arquivo '{filename}'.", color="danger"))
-        except Exception as e:
-            messages.append(dbc.Alert(f"Erro ao processar o arquivo de vendas '{filename}': {e}", color="danger"))
-            
-    return messages
+    return _import_uploads(upload, user_id, _classify_vendas, MENSAGENS_VENDAS)
 
 
 @app.callback(
     Output('upload-msgs', 'children', allow_duplicate=True),
-    Input('upload-cotacoes', 'contents'),
-    Input('upload-cotacoes', 'filename'),
+    Input('upload-cotacoes-tokens', 'data'),
     prevent_initial_call=True
 )
-def on_upload_cotacoes(contents_list, filenames_list):
-    if not contents_list or not filenames_list:
-        return dbc.Alert("Erro no upload. Por favor, tente selecionar os arquivos novamente.", color="warning")
+def on_upload_cotacoes(upload):
+    erro = _upload_error(upload)
+    if erro:
+        return erro
     
     user_id = session.get('user_id')
     if not user_id: 
         return dbc.Alert("Sessão inválida.", color="danger")
-    
-    messages = []
-    for contents, filename in zip(contents_list, filenames_list):
-        try:
-            # --- CORREÇÃO AQUI: A ordem das operações foi ajustada ---
-
-            # 1. Processa o conteúdo do arquivo PRIMEIRO para criar o file_io
-            file_io = data_loader.parse_upload_content(contents)
-            
-            # 2. Identifica o tipo de arquivo e chama a função de leitura correta
-            table_name = None
-            df = None
-            if 'materiais_cotados' in filename:
-                table_name = 'raw_materiais_cotados'
-                df = data_loader.read_raw_materiais_cotados(file_io)
-            elif any(char.isdigit() for char in filename) and ('.xls' in filename or '.xlsx' in filename):
-                table_name = 'raw_propostas_anuais'
-                df = data_loader.read_raw_propostas_anuais(file_io)
-            else:
-                messages.append(dbc.Alert(f"Arquivo '{filename}' não reconhecido e foi ignorado.", color="warning"))
-                continue
-            
-            # 3. Agora que temos o file_io, podemos gerar o fingerprint
-            fingerprint = data_loader.generate_fingerprint(file_io)
-
-            if db.check_raw_fingerprint_exists(fingerprint, table_name):
-                messages.append(dbc.Alert(f"O arquivo '{filename}' já foi carregado.", color="warning"))
-                continue
-            
-            # 4. Insere o DataFrame (df) que já foi lido e processado
-            rows_inserted = db.insert_raw_df(df, table_name, filename, fingerprint, user_id)
-            
-            if rows_inserted > 0:
-                messages.append(dbc.Alert(f"Arquivo '{filename}' carregado! {rows_inserted} registros brutos salvos em '{table_name}'.", color="success"))
-            else:
-                messages.append(dbc.Alert(f"Erro ao salvar dados brutos do arquivo '{filename}'.", color="danger"))
-
-        except Exception as e:
-            messages.append(dbc.Alert(f"Erro ao processar '{filename}': {e}", color="danger"))
-            
-    return messages
\ No newline at end of file
+
+    return _import_uploads(upload, user_id, _classify_cotacoes, MENSAGENS_COTACOES)
@@ -24,8 +24,11 @@ sidebar_layout = html.Div(
         ),
         html.Hr(),
         html.Div([
-            dcc.Upload(id="upload-vendas", children=dbc.Button("Upload Vendas (Anual)", color="primary", className="me-1"), multiple=True),
-            dcc.Upload(id="upload-cotacoes", children=dbc.Button("Upload Cotações (Materiais + Ano)", color="secondary", className="me-1"), multiple=True),
+            # Os arquivos vão para a rota /upload (assets/uploads.js); os callbacks recebem só os tokens nos Stores
+            html.Button("Upload Vendas (Anual)", className="btn btn-primary me-1", **{"data-upload-store": "upload-vendas-tokens"}),
+            html.Button("Upload Cotações (Materiais + Ano)", className="btn btn-secondary me-1", **{"data-upload-store": "upload-cotacoes-tokens"}),
+            dcc.Store(id="upload-vendas-tokens"),
+            dcc.Store(id="upload-cotacoes-tokens"),
             html.Div(id="upload-msgs", className="mt-2")
         ]),
     ],
@@ -422,6 +425,7 @@ config_layout = dbc.Container([
     dcc.ConfirmDialog(id='confirm-wipe-db', message='PERIGO: Esta ação é irreversível e apagará TODOS os dados. Deseja continuar?'),
     dcc.Store(id='store-user-to-delete', data=None),
     dbc.Card([dbc.CardHeader(html.H4("Gestão de Usuários")), dbc.CardBody(id="user-management-table-container")], className="mb-4"),
+    dbc.Card([dbc.CardHeader(html.H4("Histórico do Processamento")), dbc.CardBody(id="etl-runs-table-container")], className="mb-4"),
     dbc.Card([
         dbc.CardHeader(html.H4("Ações Perigosas")),
         dbc.CardBody([
@@ -429,7 +433,13 @@ config_layout = dbc.Container([
             dbc.Button("Limpar Todos os Dados Brutos e Processados", id="wipe-db-button", color="danger"),
             html.Hr(),
             html.P("Execute o processo de transformação para atualizar os dashboards com os últimos dados carregados."),
-            dbc.Button("Processar Dados Brutos e Atualizar Análises", id="run-etl-button", color="primary", className="mt-2")
+            dbc.Button("Processar Dados Brutos e Atualizar Análises", id="run-etl-button", color="primary", className="mt-2"),
+            html.P("A reconstrução completa reprocessa todo o histórico bruto (necessária só após mudanças nas regras de transformação).", className="mt-3"),
+            dbc.Button("Reconstruir Tudo", id="run-full-etl-button", color="secondary", outline=True, className="mt-2"),
+            # O ETL roda em segundo plano; a situação do job é consultada a cada intervalo enquanto ele roda
+            dcc.Store(id='store-etl-job-id', data=None),
+            dcc.Interval(id='etl-job-interval', interval=2000, disabled=True),
+            html.Div(id='etl-job-status', className="mt-3")
         ])
     ], color="danger", outline=True)
 ], fluid=True)
@@ -3,16 +3,23 @@
 DROP TABLE IF EXISTS users;
 DROP TABLE IF EXISTS vendas;
 DROP TABLE IF EXISTS cotacoes;
+DROP TABLE IF EXISTS vendas_mensal;
+DROP TABLE IF EXISTS cotacoes_mensal;
 DROP TABLE IF EXISTS settings;
 DROP TABLE IF EXISTS raw_vendas;
 DROP TABLE IF EXISTS raw_materiais_cotados;
 DROP TABLE IF EXISTS raw_propostas_anuais;
+DROP TABLE IF EXISTS dim_cliente;
+DROP TABLE IF EXISTS dim_material;
+DROP TABLE IF EXISTS etl_processed;
+DROP TABLE IF EXISTS etl_jobs;
+DROP TABLE IF EXISTS etl_runs;
 
 CREATE TABLE users ( id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL, is_active BOOLEAN NOT NULL DEFAULT 1, created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP );
 CREATE TABLE settings ( key TEXT PRIMARY KEY, value_json TEXT NOT NULL );
 
 CREATE TABLE raw_vendas (
-    id INTEGER PRIMARY KEY AUTOINCREMENT, source_filename TEXT NOT NULL, fingerprint TEXT NOT NULL, uploaded_by INTEGER NOT NULL, uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    id INTEGER PRIMARY KEY AUTOINCREMENT, source_filename TEXT NOT NULL, fingerprint TEXT NOT NULL, uploaded_by INTEGER NOT NULL, uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, row_hash TEXT,
     "Unidade de Negócio" TEXT, "Canal Distribuição" TEXT, "ID_Cli" TEXT, "Cliente" TEXT, "Hier. Produto 1" TEXT, "Hier. Produto 2" TEXT, "Hier. Produto 3" TEXT,
     "Doc. Vendas" TEXT, "Material" TEXT, "Produto" TEXT, "Data Faturamento" TEXT, "Data" TEXT, "Cidade do Cliente" TEXT,
     "Qtd. Entrada" REAL, "Vlr. Entrada" REAL, "Qtd. Carteira" REAL, "Vlr. Carteira" REAL, "Qtd. ROL" REAL, "Vlr. ROL" REAL,
@@ -20,24 +27,102 @@ CREATE TABLE raw_vendas (
 );
 
 CREATE TABLE raw_materiais_cotados (
-    id INTEGER PRIMARY KEY AUTOINCREMENT, source_filename TEXT NOT NULL, fingerprint TEXT NOT NULL, uploaded_by INTEGER NOT NULL, uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    "Cotação" TEXT, "Cod. Cliente" TEXT, "Cliente" TEXT, "Material" TEXT, "Descrição" TEXT, "Quantidade" REAL, "Preço Líquido Total" REAL,
+    id INTEGER PRIMARY KEY AUTOINCREMENT, source_filename TEXT NOT NULL, fingerprint TEXT NOT NULL, uploaded_by INTEGER NOT NULL, uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, row_hash TEXT,
+    "Cotação" TEXT, "Cod. Cliente" TEXT, "Cliente" TEXT, "Material" TEXT, "Descrição" TEXT, "Quantidade" REAL, "Preço Líquido Total" REAL, "Centro Fornecedor" REAL,
     FOREIGN KEY (uploaded_by) REFERENCES users (id)
 );
 
 CREATE TABLE raw_propostas_anuais (
-    id INTEGER PRIMARY KEY AUTOINCREMENT, source_filename TEXT NOT NULL, fingerprint TEXT NOT NULL, uploaded_by INTEGER NOT NULL, uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    id INTEGER PRIMARY KEY AUTOINCREMENT, source_filename TEXT NOT NULL, fingerprint TEXT NOT NULL, uploaded_by INTEGER NOT NULL, uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, row_hash TEXT,
     "Número da Cotação" TEXT, "Número da Revisão" TEXT, "Código do Cliente" TEXT, "Nome do Cliente" TEXT, "Data de Criação" TEXT, "Status da Cotação" TEXT, "Valor Total" REAL,
     FOREIGN KEY (uploaded_by) REFERENCES users (id)
 );
 
+-- Dimensões: atributos descritivos guardados uma vez por cliente/material; os fatos guardam só a chave inteira
+CREATE TABLE dim_cliente ( cliente_id INTEGER PRIMARY KEY, cod_cliente TEXT UNIQUE NOT NULL, cliente TEXT );
+
+CREATE TABLE dim_material (
+    material_id INTEGER PRIMARY KEY, material TEXT UNIQUE NOT NULL, produto TEXT, unidade_negocio TEXT,
+    hier_produto_1 TEXT, hier_produto_2 TEXT, hier_produto_3 TEXT
+);
+
+-- Datas dos fatos: dias desde 1970-01-01 (INTEGER); ano, mes e yyyymm são da data principal (faturamento / cotação)
 CREATE TABLE vendas (
-    id INTEGER PRIMARY KEY AUTOINCREMENT, cod_cliente TEXT NOT NULL, cliente TEXT, material TEXT, produto TEXT, unidade_negocio TEXT, canal_distribuicao TEXT,
-    data_entrada DATE, data_faturamento DATE, quantidade_entrada REAL, quantidade_carteira REAL, quantidade_faturada REAL,
+    id INTEGER PRIMARY KEY AUTOINCREMENT, cliente_id INTEGER NOT NULL REFERENCES dim_cliente (cliente_id),
+    material_id INTEGER REFERENCES dim_material (material_id), canal_distribuicao TEXT,
+    data_entrada INTEGER, data_faturamento INTEGER, ano INTEGER, mes INTEGER, yyyymm INTEGER,
+    quantidade_entrada REAL, quantidade_carteira REAL, quantidade_faturada REAL,
     valor_entrada REAL, valor_carteira REAL, valor_faturado REAL
 );
 
-CREATE TABLE cotacoes ( id INTEGER PRIMARY KEY AUTOINCREMENT, cod_cliente TEXT NOT NULL, cliente TEXT, material TEXT, data DATE, quantidade REAL NOT NULL );
+CREATE TABLE cotacoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, cliente_id INTEGER NOT NULL REFERENCES dim_cliente (cliente_id),
+    material_id INTEGER REFERENCES dim_material (material_id), data INTEGER, ano INTEGER, mes INTEGER, yyyymm INTEGER,
+    quantidade REAL NOT NULL
+);
+
+-- Agregados mensais (refeitos a cada carga das tabelas de fatos); o mês é o primeiro dia, na mesma coluna de data
+CREATE TABLE vendas_mensal (
+    cliente_id INTEGER NOT NULL, material_id INTEGER, canal_distribuicao TEXT,
+    data_faturamento INTEGER, ano INTEGER, mes INTEGER, yyyymm INTEGER,
+    quantidade_entrada REAL, quantidade_carteira REAL, quantidade_faturada REAL,
+    valor_entrada REAL, valor_carteira REAL, valor_faturado REAL
+);
+
+CREATE TABLE cotacoes_mensal (
+    cliente_id INTEGER NOT NULL, material_id INTEGER, data INTEGER, ano INTEGER, mes INTEGER, yyyymm INTEGER,
+    quantidade REAL NOT NULL
+);
+
+-- Arquivos brutos (fingerprint) já transformados nas tabelas limpas e a versão das regras usada (ETL incremental)
+CREATE TABLE etl_processed (
+    raw_table TEXT NOT NULL, fingerprint TEXT NOT NULL, rules TEXT NOT NULL,
+    processed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (raw_table, fingerprint)
+);
+
+-- Execuções do ETL em segundo plano (utils/etl_jobs.py); etapa e linhas são gravadas a cada troca de etapa
+CREATE TABLE etl_jobs (
+    id TEXT PRIMARY KEY, mode TEXT NOT NULL, status TEXT NOT NULL, stage TEXT, rows_processed INTEGER NOT NULL DEFAULT 0,
+    message TEXT, started_by INTEGER, started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, finished_at TIMESTAMP
+);
+
+-- Histórico do ETL: uma linha por tabela limpa processada em cada execução (run_id), com os segundos de cada
+-- etapa e as linhas descartadas por regra (JSON), as linhas de entrada/saída e a memória de pico
+CREATE TABLE etl_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, table_name TEXT NOT NULL, mode TEXT NOT NULL,
+    started_at TIMESTAMP NOT NULL, finished_at TIMESTAMP NOT NULL, seconds REAL, rows_in INTEGER, rows_out INTEGER,
+    stage_seconds TEXT, dropped_rows TEXT, peak_rss_mb REAL, max_chunk_mb REAL
+);
+
+-- Índices das consultas do dashboard (ver `flask explain-queries`); as colunas extras tornam os índices
+-- cobrintes para as projeções dos callbacks, que então não precisam ler a tabela
+CREATE INDEX IF NOT EXISTS idx_vendas_cliente_data ON vendas (cliente_id, data_faturamento);
+CREATE INDEX IF NOT EXISTS idx_vendas_data ON vendas (data_faturamento, cliente_id, material_id, canal_distribuicao, quantidade_faturada);
+CREATE INDEX IF NOT EXISTS idx_vendas_material_data ON vendas (material_id, data_faturamento, cliente_id, quantidade_faturada);
+CREATE INDEX IF NOT EXISTS idx_vendas_canal_data ON vendas (canal_distribuicao, data_faturamento);
+CREATE INDEX IF NOT EXISTS idx_cotacoes_cliente_data ON cotacoes (cliente_id, data);
+CREATE INDEX IF NOT EXISTS idx_cotacoes_data ON cotacoes (data, cliente_id, material_id, quantidade);
+CREATE INDEX IF NOT EXISTS idx_cotacoes_material ON cotacoes (material_id);
+CREATE INDEX IF NOT EXISTS idx_vendas_mensal_data ON vendas_mensal (data_faturamento, cliente_id, material_id);
+CREATE INDEX IF NOT EXISTS idx_vendas_mensal_cliente ON vendas_mensal (cliente_id, data_faturamento);
+CREATE INDEX IF NOT EXISTS idx_vendas_mensal_material ON vendas_mensal (material_id, data_faturamento);
+CREATE INDEX IF NOT EXISTS idx_cotacoes_mensal_data ON cotacoes_mensal (data, cliente_id, material_id);
+CREATE INDEX IF NOT EXISTS idx_cotacoes_mensal_cliente ON cotacoes_mensal (cliente_id, data);
+-- Filtro por unidade de negócio: resolve os materiais da unidade e usa idx_vendas_material_data
+CREATE INDEX IF NOT EXISTS idx_dim_material_unidade ON dim_material (unidade_negocio, material_id);
+
+-- Busca de arquivo já carregado no upload (check_raw_fingerprint_exists)
+CREATE INDEX IF NOT EXISTS idx_raw_vendas_fingerprint ON raw_vendas (fingerprint);
+CREATE INDEX IF NOT EXISTS idx_raw_materiais_cotados_fingerprint ON raw_materiais_cotados (fingerprint);
+CREATE INDEX IF NOT EXISTS idx_raw_propostas_anuais_fingerprint ON raw_propostas_anuais (fingerprint);
+-- Linha já carregada por outro arquivo (reexportação com períodos sobrepostos): o INSERT a ignora.
+-- Linhas gravadas antes da coluna existir ficam com row_hash nulo até o comando hash-raw-rows
+CREATE UNIQUE INDEX IF NOT EXISTS idx_raw_vendas_row_hash ON raw_vendas (row_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_raw_materiais_cotados_row_hash ON raw_materiais_cotados (row_hash);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_raw_propostas_anuais_row_hash ON raw_propostas_anuais (row_hash);
 
-CREATE INDEX idx_vendas_cliente_data ON vendas (cod_cliente, data_faturamento);
-CREATE INDEX idx_cotacoes_cliente_data ON cotacoes (cod_cliente, data);
\ No newline at end of file
+-- Job em execução e último job (etl_jobs.get_job_status)
+CREATE INDEX IF NOT EXISTS idx_etl_jobs_status ON etl_jobs (status, updated_at);
+CREATE INDEX IF NOT EXISTS idx_etl_jobs_started ON etl_jobs (started_at);
+CREATE INDEX IF NOT EXISTS idx_etl_runs_table ON etl_runs (table_name, started_at);
\ No newline at end of file